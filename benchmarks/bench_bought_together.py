@@ -0,0 +1,85 @@
+"""
+"Frequently bought together" from orders: mining the order history per
+request, against the streaming co-purchase index.
+
+Orders pick one to four products from a 10k catalog with a skewed
+(Zipf-like) popularity. For 100k and 1M orders it reports the cost of
+one ad hoc query over all orders, the streaming update rate, the batch
+rebuild rate, a served lookup, and the counters kept against an exact
+pair table.
+
+    python benchmarks/bench_bought_together.py [orders...]
+"""
+
+import random
+import sys
+import time
+from collections import Counter
+from itertools import accumulate, combinations
+
+from common import load_backend, report
+
+PRODUCTS = 10000
+LOOKUPS = 100000
+
+def make_orders(n, seed=5):
+    rng = random.Random(seed)
+    ids = [f'product-{i}' for i in range(PRODUCTS)]
+    weights = list(accumulate(1 / (rank + 1) for rank in range(PRODUCTS)))
+    return [
+        {'items': [{'product_id': p} for p in set(rng.choices(ids, cum_weights=weights, k=rng.randint(1, 4)))]}
+        for _ in range(n)
+    ]
+
+def ad_hoc(orders, product_id):
+    """Count partners by rescanning every order"""
+    partners = Counter()
+    for order in orders:
+        ids = {item['product_id'] for item in order['items']}
+        if product_id in ids:
+            partners.update(ids - {product_id})
+    return partners.most_common(8)
+
+def main(sizes):
+    backend = load_backend()
+
+    rows = []
+    for n in sizes:
+        orders = make_orders(n)
+
+        start = time.perf_counter()
+        ad_hoc(orders, 'product-0')
+        scan = time.perf_counter() - start
+
+        index = backend.CoPurchaseIndex()
+        start = time.perf_counter()
+        for order in orders:
+            index.add_order(order)
+        streaming = time.perf_counter() - start
+
+        rebuilt = backend.CoPurchaseIndex()
+        start = time.perf_counter()
+        rebuilt.rebuild(orders)
+        rebuild = time.perf_counter() - start
+
+        probes = [f'product-{i % 500}' for i in range(LOOKUPS)]
+        start = time.perf_counter()
+        for product_id in probes:
+            index.bought_together(product_id)
+        lookup = (time.perf_counter() - start) / LOOKUPS
+
+        exact = set()
+        for order in orders:
+            ids = sorted({item['product_id'] for item in order['items']})
+            exact.update(combinations(ids, 2))
+        counters = sum(len(table) for table in index.counters.values())
+
+        rows.append((f'{n:,}', f'{scan * 1000:,.0f}', f'{n / streaming:,.0f}', f'{n / rebuild:,.0f}',
+                     f'{lookup * 1e6:.2f}', f'{2 * len(exact):,}', f'{counters:,}'))
+
+    report('Bought-together over a 10k product catalog', rows,
+           ('orders', 'ad hoc query ms', 'stream orders/s', 'rebuild orders/s', 'lookup us',
+            'exact pair counts', 'counters kept'))
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [100000, 1000000])
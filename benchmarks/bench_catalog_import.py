@@ -0,0 +1,139 @@
+"""
+Bulk catalog import throughput and memory: one write per row (validating
+each line, then add_product() or update_product()) against the batched
+import_catalog_lines() behind POST /api/admin/catalog/import.
+
+The catalog is written to a temporary JSON-lines file first and read back
+line by line, so neither path holds the input. Each configuration runs in
+its own process on an empty in-memory Database and reports rows per second,
+the RSS growth once done and the peak RSS growth on the way; the gap
+between the two is what the import itself held beyond the catalog. A
+second file with new prices, stock, flags and tags for the same products
+is imported next, so every row there is an update. A thread lists
+products throughout, and the slowest of its listings shows how long an
+import keeps readers waiting.
+
+    python benchmarks/bench_catalog_import.py [sizes...]
+"""
+
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from common import load_backend, report
+
+CATEGORIES = 12
+TAGS = ('جديد', 'عرض', 'أصلي', 'شحن مجاني', 'هدية', 'فاخر', 'رياضي', 'منزلي')
+
+def rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * 4096
+
+def peak_rss_bytes():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def catalog_lines(n, seed=7):
+    """Yield the categories and n products as import lines, one at a time"""
+    rng = random.Random(seed)
+    for c in range(CATEGORIES):
+        yield json.dumps(['categories', {'id': f'bench-category-{c}', 'name': f'تصنيف {c}', 'slug': f'bench-category-{c}'}], ensure_ascii=False)
+    for i in range(n):
+        price = rng.randrange(10, 20000)
+        yield json.dumps(['products', {
+            'name': f'منتج {i}', 'name_en': f'Product {i}', 'slug': f'product-{i}',
+            'short_description': f'وصف مختصر للمنتج {i}',
+            'price': price,
+            'original_price': price + rng.randrange(0, 2000) if rng.random() < 0.4 else None,
+            'category_id': f'bench-category-{i % CATEGORIES}',
+            'brand': f'Brand {i % 200}', 'tags': rng.sample(TAGS, 2),
+            'stock': rng.randrange(0, 500), 'rating': round(rng.uniform(3, 5), 1),
+            'sold_count': rng.randrange(0, 50000),
+            'is_featured': rng.random() < 0.1, 'is_active': rng.random() < 0.95
+        }], ensure_ascii=False)
+
+def import_per_row(backend, lines):
+    """One validated write per line, each reindexing on its own"""
+    db = backend.db
+    for line in lines:
+        table, row = json.loads(line)
+        exists = lambda record_id: db.store.get(table, record_id) is not None
+        record = backend.catalog_record(table, row, exists)
+        if table == 'categories':
+            db.add_category(record)
+        elif db.store.get('products', record['id']) is not None:
+            db.update_product(record['id'], **record)
+        else:
+            db.add_product(record)
+
+def list_products(db, done, worst):
+    """Page the cheapest products until done is set, keeping the slowest wait"""
+    while not done.is_set():
+        start = time.perf_counter()
+        db.query_products('price', limit=12)
+        worst[0] = max(worst[0], time.perf_counter() - start)
+        time.sleep(0.001)
+
+def child(mode, paths):
+    backend = load_backend()
+    backend.db = db = backend.Database(backend.MemoryStorage(), seed_path=None, related_interval=None)
+    results = []
+    for path in paths:
+        done, worst = threading.Event(), [0.0]
+        reader = threading.Thread(target=list_products, args=(db, done, worst))
+        reader.start()
+        before = rss_bytes()
+        start = time.perf_counter()
+        with open(path, 'rb') as f:
+            if mode == 'batched':
+                summary = backend.import_catalog_lines(f, backend.app.config['IMPORT_BATCH_SIZE'])
+                assert summary['failed'] == 0, summary['errors'][:3]
+            else:
+                import_per_row(backend, f)
+        elapsed = time.perf_counter() - start
+        done.set()
+        reader.join()
+        results.append({'seconds': elapsed, 'rss': rss_bytes() - before, 'peak': peak_rss_bytes() - before,
+                        'worst': worst[0]})
+    assert len(db.products) == int(sys.argv[5])
+    print(json.dumps(results))
+
+def main(sizes):
+    rows = []
+    for n in sizes:
+        paths = []
+        for seed in (7, 8):
+            with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False, encoding='utf-8') as f:
+                for line in catalog_lines(n, seed):
+                    f.write(line + '\n')
+            paths.append(f.name)
+        try:
+            results = {}
+            for mode in ('per row', 'batched'):
+                out = subprocess.run([sys.executable, __file__, '--child', mode, *paths, str(n)],
+                                     capture_output=True, text=True, check=True).stdout
+                results[mode] = json.loads(out.strip().splitlines()[-1])
+        finally:
+            for path in paths:
+                os.unlink(path)
+        for mode, (create, update) in results.items():
+            rows.append((
+                f'{n:,}', mode,
+                f'{n / create["seconds"]:,.0f}', f'{n / update["seconds"]:,.0f}',
+                f'{create["rss"] / 2 ** 20:,.0f}', f'{max(create["peak"], 0) / 2 ** 20:,.0f}',
+                f'{max(create["worst"], update["worst"]) * 1000:,.0f}'
+            ))
+    report('Catalog import from a JSON-lines file (in-memory store)', rows,
+           ('products', 'path', 'create rows/s', 'update rows/s', 'RSS MiB', 'peak RSS MiB',
+            'worst listing ms'))
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2], sys.argv[3:5])
+    else:
+        main([int(n) for n in sys.argv[1:]] or [10000, 100000, 1000000])
@@ -0,0 +1,85 @@
+"""
+Columnar (NumPy) product filtering vs. the interpreted dict scan.
+
+Measures the listing query "category + price range + featured, sorted by
+rating, first page of 12" and the deals ranking at several catalog sizes.
+
+    python benchmarks/bench_columnar_products.py [sizes...]
+"""
+
+import sys
+
+from common import best_of, load_backend, make_products, report
+
+def python_listing(products, category_id, min_price, max_price):
+    """The pre-columnar get_products() filter/sort/slice"""
+    result = [p for p in products.values() if p['is_active']]
+    result = [p for p in result if p['category_id'] == category_id]
+    result = [p for p in result if p['price'] >= min_price]
+    result = [p for p in result if p['price'] <= max_price]
+    result = [p for p in result if p['is_featured']]
+    result.sort(key=lambda x: x['rating'], reverse=True)
+    return result[:12]
+
+def python_deals(products):
+    """The pre-columnar get_deal_products() ranking"""
+    deals = [
+        p for p in products.values()
+        if p['is_active'] and p.get('original_price') and p['original_price'] > p['price']
+    ]
+    ranked = sorted(
+        deals,
+        key=lambda p: round((p['original_price'] - p['price']) / p['original_price'] * 100),
+        reverse=True
+    )
+    return ranked[:8]
+
+def column_discounts(np, columns):
+    """Vector of rounded discount percentages (0 where there is no discount)"""
+    n = columns.size
+    price = columns.columns['price'][:n]
+    original = columns.columns['original_price'][:n]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        discount = np.rint((original - price) / original * 100)
+    return np.where(original > price, discount, 0).astype('int64')
+
+def main(sizes):
+    backend = load_backend()
+    np = backend.np
+    if np is None:
+        sys.exit('numpy is not installed; the columnar store is disabled')
+    
+    categories = [f'cat-{i}' for i in range(6)]
+    rows = []
+    for n in sizes:
+        products = {p['id']: p for p in make_products(n, categories)}
+        columns = backend.ProductColumns()
+        build_ms = best_of(lambda: [columns.upsert(p) for p in products.values()], repeat=1)
+        
+        args = (categories[2], 500, 5000)
+        py_ms = best_of(lambda: python_listing(products, *args))
+        col_ms = best_of(lambda: columns.top(
+            columns.mask(args[0], args[1], args[2], featured_only=True), 'rating', 12, reverse=True
+        ))
+        
+        def columnar_deals():
+            discounts = column_discounts(np, columns)
+            candidates = np.flatnonzero(columns.columns['is_active'][:n] & (discounts > 0))
+            return candidates[np.argsort(-discounts[candidates], kind='stable')[:8]]
+        
+        py_deals_ms = best_of(lambda: python_deals(products))
+        col_deals_ms = best_of(columnar_deals)
+        
+        rows.append((
+            f'{n:,}', f'{build_ms:.0f}',
+            f'{py_ms:.2f}', f'{col_ms:.2f}', f'{py_ms / col_ms:.1f}x',
+            f'{py_deals_ms:.2f}', f'{col_deals_ms:.2f}', f'{py_deals_ms / col_deals_ms:.1f}x'
+        ))
+        del products, columns
+    
+    report('Listing and deals query time (ms, best of 5)', rows, (
+        'products', 'build', 'list py', 'list np', 'speedup', 'deals py', 'deals np', 'speedup'
+    ))
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
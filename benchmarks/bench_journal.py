@@ -0,0 +1,120 @@
+"""
+Write throughput and recovery time of the journaled in-memory store.
+
+Throughput: worker threads record orders through Database.add_order, so
+each write is applied in memory, appended to the journal and waited on
+until fsynced. With one thread every order pays a full fsync; with more,
+the flusher folds everything that queued up during the previous fsync
+into one batch (group commit).
+
+Recovery: a store of N orders, each written once and updated twice, is
+reopened from journal replay alone and from a snapshot plus a short
+journal tail.
+
+    python benchmarks/bench_journal.py [orders...]
+"""
+
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from common import load_backend, report
+
+ORDERS_PER_RUN = 2000
+TAIL = 1000
+
+def make_order(n, product_id):
+    return {
+        'id': f'order-{n}',
+        'order_number': f'ES-{n:08d}',
+        'user_id': f'user-{n % 500}',
+        'items': [{'product_id': product_id, 'price': 100, 'quantity': 1, 'total': 100}],
+        'shipping_address': {'full_name': 'x', 'phone': '1', 'city': 'الرياض', 'address': 'x'},
+        'subtotal': 100,
+        'tax': 15,
+        'total': 115,
+        'status': 'pending',
+        'created_at': f'2024-01-01T00:00:{n:07d}'
+    }
+
+def throughput(backend, threads):
+    directory = tempfile.mkdtemp()
+    try:
+        db = backend.Database(backend.JournaledStorage(directory))
+        product_id = next(iter(db.products))
+        fsyncs = db.store.stats['fsyncs']
+        per_thread = ORDERS_PER_RUN // threads
+
+        def worker(t):
+            for i in range(per_thread):
+                db.add_order(make_order(t * per_thread + i, product_id))
+
+        workers = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+        start = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+        batches = db.store.stats['fsyncs'] - fsyncs
+        db.store.close()
+        return per_thread * threads / elapsed, per_thread * threads / batches
+    finally:
+        shutil.rmtree(directory)
+
+def recovery(backend, orders):
+    directory = tempfile.mkdtemp()
+    try:
+        store = backend.JournaledStorage(directory, snapshot_every=10 ** 9)
+        db = backend.Database(store)
+        product_id = next(iter(db.products))
+        with store.transaction():
+            for n in range(orders):
+                db.add_order(make_order(n, product_id))
+            # Orders move through a couple of statuses, as they do in production
+            for status in ('confirmed', 'shipped'):
+                for n in range(orders):
+                    db.update_order(f'order-{n}', status=status)
+        store.close()
+
+        start = time.perf_counter()
+        store = backend.JournaledStorage(directory, snapshot_every=10 ** 9)
+        replay = time.perf_counter() - start
+
+        store.snapshot()
+        with store.transaction():
+            for n in range(orders, orders + TAIL):
+                store.put('orders', make_order(n, product_id))
+        store.close()
+
+        start = time.perf_counter()
+        store = backend.JournaledStorage(directory)
+        from_snapshot = time.perf_counter() - start
+        backend.Database(store)
+        total = time.perf_counter() - start
+        store.close()
+        return replay * 1000, from_snapshot * 1000, total * 1000
+    finally:
+        shutil.rmtree(directory)
+
+def main(sizes):
+    backend = load_backend()
+
+    rows = []
+    for threads in (1, 4, 16, 64):
+        rate, batch = throughput(backend, threads)
+        rows.append((threads, f'{rate:,.0f}', f'{batch:.1f}'))
+    report('Durable orders per second (fsync before acknowledging)', rows,
+           ('threads', 'orders/s', 'orders/fsync'))
+
+    rows = []
+    for n in sizes:
+        replay, from_snapshot, total = recovery(backend, n)
+        rows.append((f'{n:,}', f'{replay:,.0f}', f'{from_snapshot:,.0f}', f'{total:,.0f}'))
+    report(f'Recovery time (ms; snapshot runs with a {TAIL:,}-record tail)', rows,
+           ('orders', 'log replay', 'snapshot + tail', '+ read models'))
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [10000, 100000])
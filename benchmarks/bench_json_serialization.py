@@ -0,0 +1,80 @@
+"""
+Response encoding: Flask's jsonify() against encode_json() with the stdlib
+encoder, with orjson (when installed), and with warm per-product fragments.
+
+The payload is a product listing page whose items carry full images,
+specifications and a category summary, at 1k, 10k and 100k items.
+
+    python benchmarks/bench_json_serialization.py [sizes...]
+"""
+
+import sys
+
+from flask import jsonify
+
+from common import best_of, load_backend, make_products, report
+
+def full_product(p, i):
+    return {
+        **p,
+        'description': 'وصف تفصيلي للمنتج مع جميع المزايا والمواصفات الفنية ' * 3,
+        'images': [f'https://images.example.com/products/{i}/{n}.jpg' for n in range(4)],
+        'specifications': {
+            'المعالج': 'ثماني النواة', 'الذاكرة': '16GB', 'التخزين': '512GB',
+            'الشاشة': '6.7 بوصة', 'البطارية': '4500mAh', 'الوزن': '221 جرام'
+        },
+    }
+
+def main(sizes):
+    backend = load_backend()
+    db = backend.db
+    db.load()
+    backend.fragments.enabled = True
+    category_id = next(iter(db.categories))
+    orjson = backend.orjson
+
+    rows = []
+    for n in sizes:
+        products = [full_product(p, i) for i, p in enumerate(make_products(n, [category_id]))]
+        for p in products:
+            p['category_id'] = category_id
+        category = db.category_summaries[category_id]
+        cards = [{**p, 'category': category} for p in products]
+
+        def page(items):
+            return {'success': True, 'data': {'products': items, 'pagination': {'total': n}}}
+
+        with backend.app.app_context():
+            flask_ms = best_of(lambda: jsonify(page(cards)).get_data(), 3)
+        flask_bytes = len(jsonify_bytes(backend, page(cards)))
+
+        backend.orjson = None
+        stdlib_ms = best_of(lambda: backend.encode_json(page(cards)), 3)
+        stdlib_bytes = len(backend.encode_json(page(cards)))
+        backend.fragments.clear()
+        [backend.product_card(p) for p in products]
+        stdlib_frag_ms = best_of(lambda: backend.encode_json(page([backend.product_card(p) for p in products])), 3)
+
+        backend.orjson = orjson
+        if orjson is not None:
+            orjson_ms = best_of(lambda: backend.encode_json(page(cards)), 3)
+            backend.fragments.clear()
+            [backend.product_card(p) for p in products]
+            orjson_frag_ms = best_of(lambda: backend.encode_json(page([backend.product_card(p) for p in products])), 3)
+            orjson_cols = (f'{orjson_ms:.1f}', f'{orjson_frag_ms:.1f}')
+        else:
+            orjson_cols = ('n/a', 'n/a')
+        backend.fragments.clear()
+
+        rows.append((f'{n:,}', f'{flask_ms:.1f}', f'{stdlib_ms:.1f}', f'{stdlib_frag_ms:.1f}', *orjson_cols,
+                     f'{flask_bytes / 1024:,.0f}', f'{stdlib_bytes / 1024:,.0f}'))
+
+    report('Encoding a listing response (ms, best of 3)', rows,
+           ('items', 'jsonify', 'stdlib', 'stdlib+frag', 'orjson', 'orjson+frag', 'KiB before', 'KiB after'))
+
+def jsonify_bytes(backend, payload):
+    with backend.app.app_context():
+        return jsonify(payload).get_data()
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [1000, 10000, 100000])
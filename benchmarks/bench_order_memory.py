@@ -0,0 +1,117 @@
+"""
+Resident memory of the in-memory Database holding N orders (1M by
+default), with orders kept as plain dicts (as before) and as compact
+records.
+
+Each configuration runs in its own process and reports the RSS growth
+from an empty, loaded Database to one holding the orders, plus the time
+taken to add them. Orders come from 20k customers, carry one to three
+items and are built two ways: in process, sharing strings with the
+catalog as checkout does, and decoded from JSON lines, as after a
+restart replays the journal.
+
+    python benchmarks/bench_order_memory.py [orders]
+"""
+
+import gc
+import json
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from uuid import UUID
+
+from common import load_backend, report
+
+CUSTOMERS = 20000
+CITIES = ('الرياض', 'جدة', 'الدمام', 'مكة المكرمة', 'المدينة المنورة')
+STATUSES = ('pending', 'confirmed', 'processing', 'shipped', 'delivered', 'cancelled')
+
+def rss_bytes():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * 4096
+
+def make_orders(backend, n, products, seed=11):
+    rng = random.Random(seed)
+    users = [str(UUID(int=rng.getrandbits(128), version=4)) for _ in range(CUSTOMERS)]
+    start = datetime(2024, 1, 1)
+    for i in range(n):
+        lines = rng.sample(products, rng.randint(1, 3))
+        items = []
+        for p in lines:
+            quantity = rng.randint(1, 3)
+            items.append({
+                'product_id': p['id'], 'name': p['name'], 'price': p['price'],
+                'quantity': quantity, 'total': p['price'] * quantity, 'thumbnail': p['thumbnail']
+            })
+        subtotal = sum(item['total'] for item in items)
+        status = rng.choice(STATUSES)
+        order_id = str(UUID(int=rng.getrandbits(128), version=4))
+        yield {
+            'id': order_id,
+            'order_number': f"ES-20240101-{order_id[:8].upper()}",
+            'user_id': rng.choice(users),
+            'items': items,
+            'shipping_address': {
+                'full_name': f'عميل {i % 5000}', 'phone': f'+9665{rng.randrange(10 ** 8):08d}',
+                'city': rng.choice(CITIES), 'address': f'حي {rng.randrange(300)}، شارع {rng.randrange(90)}'
+            },
+            'payment_method': 'cash',
+            'subtotal': subtotal,
+            'shipping_cost': 0 if subtotal >= 500 else 30,
+            'tax': round(subtotal * 0.15, 2),
+            'total': round(subtotal * 1.15 + (0 if subtotal >= 500 else 30), 2),
+            'status': status,
+            'status_label': backend.ORDER_STATUS_LABELS[status],
+            'notes': None,
+            'created_at': (start + timedelta(seconds=i * 7, microseconds=rng.randrange(10 ** 6))).isoformat()
+        }
+
+def child(layout, source, n):
+    backend = load_backend()
+    if layout == 'dicts':
+        backend.RECORD_TYPES.clear()
+    db = backend.db
+    db.load()
+    products = list(db.products.values())
+    orders = make_orders(backend, n, products)
+    if source == 'json':
+        # Encode up front so only the decoded orders stay resident
+        lines = [json.dumps(o, ensure_ascii=False) for o in orders]
+        orders = (json.loads(line) for line in lines)
+    gc.collect()
+    before = rss_bytes()
+    start = time.perf_counter()
+    with db.store.transaction():
+        for order in orders:
+            db.add_order(order)
+    elapsed = time.perf_counter() - start
+    orders = lines = None
+    gc.collect()
+    print(json.dumps({'rss': rss_bytes() - before, 'seconds': elapsed}))
+
+def main(n):
+    rows = []
+    for source in ('process', 'json'):
+        results = {}
+        for layout in ('dicts', 'records'):
+            out = subprocess.run([sys.executable, __file__, '--child', layout, source, str(n)],
+                                 capture_output=True, text=True, check=True).stdout
+            results[layout] = json.loads(out.strip().splitlines()[-1])
+        dicts, records = results['dicts'], results['records']
+        rows.append((
+            'in process' if source == 'process' else 'from JSON',
+            f"{dicts['rss'] / 2 ** 20:,.0f}", f"{records['rss'] / 2 ** 20:,.0f}",
+            f"{dicts['rss'] / n:,.0f}", f"{records['rss'] / n:,.0f}",
+            f"{dicts['seconds']:.1f}", f"{records['seconds']:.1f}"
+        ))
+    report(f'Database memory for {n:,} orders', rows,
+           ('orders built', 'dicts MiB', 'records MiB', 'dicts B/order', 'records B/order',
+            'dicts add s', 'records add s'))
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,107 @@
+"""
+Login throughput and latency under the password hashing schemes, and how
+much a login storm slows catalog requests running at the same time.
+
+Client threads log in through the Flask test client while one more thread
+keeps requesting /api/categories. The configurations:
+
+  legacy sha256    the original unsalted hash (no KDF cost at all)
+  scrypt inline    scrypt on the request thread (PASSWORD_WORKERS = 0)
+  scrypt pool      scrypt in the bounded process pool
+
+    python benchmarks/bench_password_login.py [client threads]
+"""
+
+import hashlib
+import statistics
+import sys
+import threading
+import time
+from uuid import uuid4
+
+from common import load_backend, report
+
+USERS = 20
+LOGINS_PER_THREAD = 15
+
+def percentile(samples, q):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def run(backend, hasher, legacy, threads):
+    backend.passwords = hasher
+    db = backend.db
+    emails = []
+    for _ in range(USERS):
+        email = f'{uuid4().hex[:12]}@bench.test'
+        password = hashlib.sha256(b'secret-pass').hexdigest() if legacy else hasher.hash('secret-pass')
+        db.add_user({
+            'id': str(uuid4()), 'email': email, 'password': password, 'first_name': 'x',
+            'last_name': 'y', 'phone': None, 'role': 'customer', 'avatar': None,
+            'is_verified': False, 'is_active': True, 'addresses': [], 'created_at': '2024-01-01'
+        })
+        emails.append(email)
+
+    latencies = []
+    catalog = []
+    done = threading.Event()
+
+    def login_worker(n):
+        client = backend.app.test_client()
+        for i in range(LOGINS_PER_THREAD):
+            start = time.perf_counter()
+            r = client.post('/api/auth/login', json={
+                'email': emails[(n + i) % USERS], 'password': 'secret-pass'
+            })
+            latencies.append(time.perf_counter() - start)
+            assert r.status_code == 200, r.get_json()
+
+    def catalog_worker():
+        client = backend.app.test_client()
+        while not done.is_set():
+            start = time.perf_counter()
+            client.get('/api/categories')
+            catalog.append(time.perf_counter() - start)
+
+    browsing = threading.Thread(target=catalog_worker)
+    browsing.start()
+    workers = [threading.Thread(target=login_worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    browsing.join()
+
+    return (
+        len(latencies) / elapsed,
+        statistics.median(latencies) * 1000,
+        percentile(latencies, 0.99) * 1000,
+        percentile(catalog, 0.99) * 1000
+    )
+
+def main(threads):
+    backend = load_backend()
+    backend.db.load()
+    # Every client shares one address; measure hashing, not the login throttle
+    backend.app.config['RATE_LIMITS'] = {}
+
+    legacy = backend.PasswordHasher(workers=0)
+    legacy.needs_rehash = lambda stored: False
+    configs = [
+        ('legacy sha256', legacy, True),
+        ('scrypt inline', backend.PasswordHasher(workers=0), False),
+        ('scrypt pool', backend.PasswordHasher(workers=2), False),
+    ]
+
+    rows = []
+    for name, hasher, is_legacy in configs:
+        rate, p50, p99, catalog_p99 = run(backend, hasher, is_legacy, threads)
+        rows.append((name, f'{rate:,.0f}', f'{p50:.1f}', f'{p99:.1f}', f'{catalog_p99:.2f}'))
+    report(f'Logins with {threads} client threads (scrypt n=2^14, r=8)', rows,
+           ('scheme', 'logins/s', 'p50 ms', 'p99 ms', 'catalog p99 ms'))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 8)
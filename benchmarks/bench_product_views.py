@@ -0,0 +1,61 @@
+"""
+Listing cost by projection: GET /api/products with full documents, the
+card view and a bare `fields=` list, on a catalog of full products.
+
+The response cache is disabled so every request builds and encodes its
+page. Per-request time is the best of several runs; bytes are the body.
+
+    python benchmarks/bench_product_views.py [catalog size]
+"""
+
+import sys
+
+from common import best_of, load_backend, make_products, report
+
+PAGE_SIZES = (24, 100, 1000)
+QUERIES = (
+    ('full document', ''),
+    ('view=card', '&view=card'),
+    ('fields=name,price,thumbnail,slug', '&fields=name,price,thumbnail,slug'),
+)
+
+def full_product(p, i):
+    return {
+        **p,
+        'short_description': 'وصف مختصر للمنتج',
+        'description': 'وصف تفصيلي للمنتج مع جميع المزايا والمواصفات الفنية ' * 3,
+        'images': [f'https://images.example.com/products/{i}/{n}.jpg' for n in range(4)],
+        'thumbnail': f'https://images.example.com/products/{i}/thumb.jpg',
+        'currency': 'SAR',
+        'sku': f'SKU-{i:06d}',
+        'tags': ['منتج', 'مميز', 'جديد'],
+        'review_count': i % 900,
+        'specifications': {
+            'المعالج': 'ثماني النواة', 'الذاكرة': '16GB', 'التخزين': '512GB',
+            'الشاشة': '6.7 بوصة', 'البطارية': '4500mAh', 'الوزن': '221 جرام'
+        },
+    }
+
+def main(size):
+    backend = load_backend()
+    db = backend.db
+    db.load()
+    backend.response_cache.max_bytes = 0
+    categories = list(db.categories)
+    for i, p in enumerate(make_products(size, categories)):
+        db.add_product(full_product(p, i))
+    client = backend.app.test_client()
+
+    rows = []
+    for limit in PAGE_SIZES:
+        for name, query in QUERIES:
+            url = f'/api/products?limit={limit}{query}'
+            body = client.get(url).get_data()
+            ms = best_of(lambda: client.get(url), 5)
+            rows.append((limit, name, f'{ms:.2f}', f'{len(body) / 1024:,.1f}'))
+    encoder = 'orjson' if backend.orjson else 'stdlib json'
+    report(f'GET /api/products on {size:,} products ({encoder}; ms per request)', rows,
+           ('limit', 'projection', 'ms', 'KiB'))
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,104 @@
+"""
+Allocations and time per request on the catalog read path: the original
+handlers, which wrote a category dict into every listed product and
+copied the whole document for the detail page, against the current
+composition over frozen records and shared category summaries.
+
+Both sides build the same page from the same products and encode it with
+encode_json(), so only the assembly differs. Peak is the tracemalloc high
+water mark above the starting point while one response is built.
+
+    python benchmarks/bench_read_path_allocations.py [catalog size] [page size]
+"""
+
+import sys
+import time
+import tracemalloc
+
+from common import load_backend, make_products, report
+
+def full_product(p, i):
+    return {
+        **p,
+        'short_description': 'وصف مختصر للمنتج',
+        'description': 'وصف تفصيلي للمنتج مع جميع المزايا والمواصفات الفنية ' * 3,
+        'images': [f'https://images.example.com/products/{i}/{n}.jpg' for n in range(4)],
+        'specifications': {'المعالج': 'ثماني النواة', 'الذاكرة': '16GB', 'الشاشة': '6.7 بوصة'},
+    }
+
+def measure(fn, rounds=200):
+    """(peak KiB above the start, us) per call"""
+    fn()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        fn()
+    elapsed = (time.perf_counter() - start) / rounds
+    
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1] - baseline
+    tracemalloc.stop()
+    return peak / 1024, elapsed * 1e6
+
+def main(size, page_size):
+    backend = load_backend()
+    db = backend.db
+    db.load()
+    for i, p in enumerate(make_products(size, list(db.categories))):
+        db.add_product(full_product(p, i))
+    encode = backend.encode_json
+    
+    # The original handlers worked on plain, shared, mutable dicts
+    mutable = {pid: {**p, 'images': list(p['images']), 'specifications': dict(p['specifications'])}
+               for pid, p in db.products.items()}
+    page_ids = list(db.products)[:page_size]
+    legacy_page = [mutable[pid] for pid in page_ids]
+    page = [db.products[pid] for pid in page_ids]
+    detail_id = page_ids[0]
+    related_ids = page_ids[1:5]
+    
+    def legacy_listing():
+        for p in legacy_page:
+            cat = db.categories.get(p['category_id'])
+            p['category'] = {'id': cat['id'], 'name': cat['name'], 'slug': cat['slug']} if cat else None
+        return encode({'success': True, 'data': {'products': legacy_page}})
+    
+    def listing(fields=None):
+        return encode({'success': True, 'data': {'products': [backend.product_card(p, fields) for p in page]}})
+    
+    def legacy_detail():
+        product = mutable[detail_id].copy()
+        cat = db.categories.get(product['category_id'])
+        product['category'] = {'id': cat['id'], 'name': cat['name'], 'slug': cat['slug']} if cat else None
+        related = [mutable[pid] for pid in related_ids]
+        return encode({'success': True, 'data': {'product': product, 'related_products': related}})
+    
+    def detail():
+        return encode({'success': True, 'data': {
+            'product': backend.product_card(db.products[detail_id]),
+            'related_products': [backend.product_card(db.products[pid], backend.PRODUCT_VIEWS['card'])
+                                 for pid in related_ids]
+        }})
+    
+    rows = []
+    for cache in (False, True):
+        backend.fragments.enabled = cache
+        backend.fragments.clear()
+        for name, fn in (
+            ('listing, original', legacy_listing),
+            ('listing, full documents', listing),
+            ('listing, view=card', lambda: listing(backend.PRODUCT_VIEWS['card'])),
+            ('detail, original', legacy_detail),
+            ('detail', detail),
+        ):
+            peak, us = measure(fn)
+            rows.append((name, 'on' if cache else 'off', f'{peak:,.1f}', f'{us:,.0f}'))
+    encoder = 'orjson' if backend.orjson else 'stdlib json'
+    report(f'Per response, {page_size} listed products ({encoder})', rows,
+           ('handler', 'fragments', 'peak KiB', 'us'))
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:]]
+    main(*(args + [10000, 100][len(args):]))
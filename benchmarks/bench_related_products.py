@@ -0,0 +1,78 @@
+"""
+Related products on the product page: the original scan of every product
+for the first four of the same category, against the precomputed lists.
+
+For catalogs of 1k, 10k and 100k products (spread over 20 categories,
+200 brands and 300 tags) it reports the per-page cost of each, the time
+to rank every list from scratch, and the background refresh after a
+burst of orders.
+
+    python benchmarks/bench_related_products.py [sizes...]
+"""
+
+import random
+import sys
+import time
+
+from common import load_backend, make_products, report
+
+CATEGORIES = 20
+TAGS = [f'tag-{n}' for n in range(300)]
+PAGES = 2000
+BURST = 1000
+
+def legacy_related(products, product):
+    """The original related_products scan"""
+    return [
+        p for p in products.values()
+        if p['category_id'] == product['category_id'] and
+           p['id'] != product['id'] and
+           p['is_active']
+    ][:4]
+
+def per_page_us(fn, ids):
+    start = time.perf_counter()
+    for pid in ids:
+        fn(pid)
+    return (time.perf_counter() - start) / len(ids) * 1e6
+
+def main(sizes):
+    backend = load_backend()
+    rng = random.Random(3)
+    category_ids = [f'category-{n}' for n in range(CATEGORIES)]
+
+    rows = []
+    for n in sizes:
+        products = {}
+        for p in make_products(n, category_ids):
+            p['tags'] = rng.sample(TAGS, rng.randint(0, 3))
+            products[p['id']] = p
+        related = backend.RelatedProducts(backend.CoPurchaseIndex(), interval=None)
+        for p in products.values():
+            related.update_product(p)
+
+        start = time.perf_counter()
+        related.refresh()
+        build = time.perf_counter() - start
+
+        active = [pid for pid, p in products.items() if p['is_active']]
+        pages = [rng.choice(active) for _ in range(PAGES)]
+        legacy = per_page_us(lambda pid: legacy_related(products, products[pid]), pages[:200])
+        lookup = per_page_us(related.related, pages)
+
+        for _ in range(BURST):
+            order = {'items': [{'product_id': pid} for pid in rng.sample(active, rng.randint(1, 3))]}
+            related.co_purchases.add_order(order)
+            related.add_order(order)
+        start = time.perf_counter()
+        related.refresh()
+        burst = time.perf_counter() - start
+
+        rows.append((f'{n:,}', f'{legacy:,.1f}', f'{lookup:.2f}', f'{legacy / lookup:,.0f}x',
+                     f'{build:.2f}', f'{burst * 1000:,.0f}'))
+
+    report('Related products per product page', rows,
+           ('products', 'scan us', 'lookup us', 'speedup', 'build s', f'{BURST:,} orders ms'))
+
+if __name__ == '__main__':
+    main([int(n) for n in sys.argv[1:]] or [1000, 10000, 100000])
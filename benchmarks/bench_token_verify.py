@@ -0,0 +1,115 @@
+"""
+Token verification cost: the original verify_token() against a cache
+miss (a token never seen before, checked with the prepared HMAC) and a
+hit in the verified-token cache, plus the whole overhead of an
+authenticated request through the Flask test client.
+
+    python benchmarks/bench_token_verify.py
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime, timedelta
+
+from common import load_backend, report
+
+TOKENS = 2000
+ROUNDS = 20
+
+def legacy_generate(secret, user_id, sid=None):
+    """The original ISO-expiry token format (plus a session id for auth_required)"""
+    payload = {'user_id': user_id, 'sid': sid, 'exp': (datetime.now() + timedelta(days=7)).isoformat()}
+    encoded = base64.b64encode(json.dumps(payload).encode()).decode()
+    signature = hmac.new(secret.encode(), encoded.encode(), hashlib.sha256).hexdigest()
+    return f"{encoded}.{signature}"
+
+def legacy_verify(secret, token):
+    """The original verify_token()"""
+    try:
+        parts = token.split('.')
+        if len(parts) != 2:
+            return None
+        encoded, signature = parts
+        expected_sig = hmac.new(secret.encode(), encoded.encode(), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(signature, expected_sig):
+            return None
+        payload = json.loads(base64.b64decode(encoded).decode())
+        if datetime.fromisoformat(payload['exp']) < datetime.now():
+            return None
+        return payload
+    except:
+        return None
+
+def per_call_us(fn, tokens):
+    best = float('inf')
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(ROUNDS):
+            for token in tokens:
+                fn(token)
+        best = min(best, time.perf_counter() - start)
+    return best / (ROUNDS * len(tokens)) * 1e6
+
+def miss_us(backend, n=TOKENS * ROUNDS):
+    """Per-call cost of tokens the cache has not seen, fresh ones each pass"""
+    best = float('inf')
+    for _ in range(5):
+        tokens = [backend.generate_token(f'user-{i}') for i in range(n)]
+        backend.token_cache.clear()
+        start = time.perf_counter()
+        for token in tokens:
+            backend.verify_token(token)
+        best = min(best, time.perf_counter() - start)
+    return best / n * 1e6
+
+def main():
+    backend = load_backend()
+    secret = backend.app.config['SECRET_KEY']
+    legacy_tokens = [legacy_generate(secret, f'user-{i}') for i in range(TOKENS)]
+    tokens = [backend.generate_token(f'user-{i}') for i in range(TOKENS)]
+
+    legacy = per_call_us(lambda t: legacy_verify(secret, t), legacy_tokens)
+    prepared = miss_us(backend)
+    cached = per_call_us(backend.verify_token, tokens)
+    rows = [
+        ('original', f'{legacy:.2f}', '1.0x'),
+        ('prepared HMAC, cache miss', f'{prepared:.2f}', f'{legacy / prepared:.1f}x'),
+        ('verified-token cache', f'{cached:.2f}', f'{legacy / cached:.1f}x'),
+    ]
+    report('verify_token() per call (us)', rows, ('path', 'us', 'speedup'))
+
+    # Whole request: /api/auth/me for a real user, with each verifier
+    client = backend.app.test_client()
+    backend.db.load()
+    admin = backend.db.get_user_by_email('admin@elitesouk.com')
+    new_header = {'Authorization': 'Bearer ' + backend.generate_token(admin['id'])}
+    old_header = {'Authorization': 'Bearer ' + legacy_generate(
+        secret, admin['id'], backend.db.create_session(admin['id'])['id']
+    )}
+    fast_verify = backend.verify_token
+
+    def request_us(header, n=2000):
+        start = time.perf_counter()
+        for _ in range(n):
+            client.get('/api/auth/me', headers=header)
+        return (time.perf_counter() - start) / n * 1e6
+
+    # Interleaved, best of several rounds each, so drift hits all three alike
+    before = after = anonymous = float('inf')
+    for _ in range(7):
+        backend.verify_token = lambda token: legacy_verify(secret, token)
+        before = min(before, request_us(old_header))
+        backend.verify_token = fast_verify
+        after = min(after, request_us(new_header))
+        anonymous = min(anonymous, request_us({}))
+    report('GET /api/auth/me per request (us)', [
+        ('original verify', f'{before:.1f}', f'{before - anonymous:.1f}'),
+        ('fast path', f'{after:.1f}', f'{after - anonymous:.1f}'),
+        ('no token (401)', f'{anonymous:.1f}', '-'),
+    ], ('path', 'total', 'auth overhead'))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Shared helpers for the Elite Souk benchmarks.
+
+The backend lives in a single script whose file name is not importable,
+so benchmarks load it by path. Run any benchmark from the repository root:
+
+    python benchmarks/bench_columnar_products.py
+"""
+
+import importlib.util
+import os
+import sys
+import time
+from uuid import uuid4
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_backend():
+    """Import elite-souk-backend.py as the module `elite_souk_backend`"""
+    if 'elite_souk_backend' in sys.modules:
+        return sys.modules['elite_souk_backend']
+    path = os.path.join(ROOT, 'elite-souk-backend.py')
+    spec = importlib.util.spec_from_file_location('elite_souk_backend', path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['elite_souk_backend'] = module
+    spec.loader.exec_module(module)
+    return module
+
+def best_of(fn, repeat=5):
+    """Return the fastest wall time of fn() in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+def make_products(n, category_ids, seed=7):
+    """Build n synthetic products with the scalar fields the listing uses"""
+    import random
+    rng = random.Random(seed)
+    products = []
+    for i in range(n):
+        price = rng.randrange(10, 20000)
+        products.append({
+            'id': str(uuid4()),
+            'slug': f'product-{i}',
+            'name': f'منتج {i}',
+            'name_en': f'Product {i}',
+            'description': '',
+            'tags': [],
+            'brand': f'Brand {i % 200}',
+            'price': price,
+            'original_price': price + rng.randrange(0, 2000) if rng.random() < 0.4 else None,
+            'category_id': category_ids[i % len(category_ids)],
+            'stock': rng.randrange(0, 500),
+            'rating': round(rng.uniform(3, 5), 1),
+            'sold_count': rng.randrange(0, 50000),
+            'thumbnail': '',
+            'is_featured': rng.random() < 0.1,
+            'is_active': rng.random() < 0.95,
+            'created_at': f'2024-01-01T00:00:{i:07d}'
+        })
+    return products
+
+def report(title, rows, headers):
+    """Print an aligned results table"""
+    print(f'\n{title}')
+    widths = [max(len(str(h)), *(len(str(r[i])) for r in rows)) for i, h in enumerate(headers)]
+    print('  '.join(str(h).rjust(w) for h, w in zip(headers, widths)))
+    for row in rows:
+        print('  '.join(str(v).rjust(w) for v, w in zip(row, widths)))
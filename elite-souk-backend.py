@@ -17,551 +17,2995 @@
 ╚═══════════════════════════════════════════════════════════════════════════════╝
 """
 
-from flask import Flask, request, jsonify
-from functools import wraps
+from flask import Flask, request, make_response
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from functools import lru_cache, wraps
 from datetime import datetime, timedelta
-from uuid import uuid4
+from enum import Enum
+from uuid import UUID, uuid4, uuid5
+from itertools import combinations, islice
+import bisect
 import hashlib
+import heapq
 import hmac
 import base64
 import json
+import math
+import mmap
+import multiprocessing
+import os
 import re
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+
+try:
+    import numpy as np
+except ImportError:  # columnar product store is optional
+    np = None
+
+try:
+    import orjson
+except ImportError:  # encode_json() falls back to the stdlib encoder
+    orjson = None
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'elite-souk-super-secret-key-2024-production'
+app.config['RESPONSE_CACHE_MAX_BYTES'] = 32 * 1024 * 1024
+app.config['FRAGMENT_CACHE_MAX_BYTES'] = 64 * 1024 * 1024
+# Rows per table written (and reindexed) at a time by the bulk catalog import
+app.config['IMPORT_BATCH_SIZE'] = 5000
+# Seconds between background refreshes of the related-product lists
+app.config['RELATED_REFRESH_INTERVAL'] = 1.0
+# SQLite file shared by all worker processes; unset keeps everything in memory
+app.config['DATABASE_PATH'] = os.environ.get('ELITE_SOUK_DATABASE')
+# Seconds a worker may go without reading the shared change feed before it
+# stops holding feed rows back from pruning (it reloads if it reads again)
+app.config['CHANGE_FEED_READER_TIMEOUT'] = 600
+# Directory for the in-memory store's write-ahead log and snapshots
+app.config['JOURNAL_DIR'] = os.environ.get('ELITE_SOUK_JOURNAL')
+# JSON-lines catalog used to fill an empty store; unset uses data/seed_catalog.jsonl
+app.config['SEED_CATALOG'] = os.environ.get('ELITE_SOUK_SEED')
+# Password hashing: 'scrypt' or 'pbkdf2_sha256', its cost, and the size of
+# the process pool that runs it (0 hashes inline on the request thread)
+app.config['PASSWORD_SCHEME'] = 'scrypt'
+app.config['SCRYPT_N'] = 2 ** 14
+app.config['PBKDF2_ITERATIONS'] = 600000
+app.config['PASSWORD_WORKERS'] = int(os.environ.get('ELITE_SOUK_PASSWORD_WORKERS', 2))
+# Token buckets per throttled route: name -> (burst capacity, seconds to refill it)
+app.config['RATE_LIMITS'] = {
+    'login': (10, 60),
+    'register': (10, 3600),
+    'checkout': (10, 60)
+}
+# SQLite file holding the buckets so limits span worker processes; defaults
+# to the shared database, and unset keeps buckets per process
+app.config['RATE_LIMIT_DATABASE'] = os.environ.get('ELITE_SOUK_RATE_LIMIT_DB', app.config['DATABASE_PATH'])
 
 # ═══════════════════════════════════════════════════════════════════════════════
-# DATABASE SIMULATION (In-Memory)
+# FULL-TEXT SEARCH
 # ═══════════════════════════════════════════════════════════════════════════════
 
-class Database:
+# Arabic harakat, Quranic marks and superscript alef
+_ARABIC_DIACRITICS = re.compile('[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED]')
+_ARABIC_TATWEEL = '\u0640'
+_ARABIC_LETTER_MAP = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ؤ': 'و', 'ئ': 'ي', 'ى': 'ي',
+    'ة': 'ه'
+})
+_TOKEN_RE = re.compile(r'\w+')
+
+# Indexed product fields and their weights in the term frequency
+PRODUCT_SEARCH_FIELDS = (
+    ('name', 3.0),
+    ('name_en', 3.0),
+    ('tags', 2.0),
+    ('description', 1.0)
+)
+
+def normalize_text(text):
+    """Fold case and unify Arabic letter forms for matching"""
+    text = _ARABIC_DIACRITICS.sub('', text.lower())
+    return text.replace(_ARABIC_TATWEEL, '').translate(_ARABIC_LETTER_MAP)
+
+def tokenize(text):
+    """Split normalized text into terms, dropping the Arabic definite article"""
+    terms = []
+    for token in _TOKEN_RE.findall(normalize_text(text)):
+        for article in ('وال', 'ال'):
+            if token.startswith(article) and len(token) - len(article) >= 2:
+                token = token[len(article):]
+                break
+        terms.append(token)
+    return terms
+
+def merge_sorted(items, removed=(), added=()):
+    """Return the sorted list `items` without `removed` and with `added`
+    
+    Every change is placed by bisection and the runs between them are
+    copied as slices, so a batch costs one copy of the list rather than a
+    shift per change or a comparison per element.
+    """
+    events = []
+    for item in removed:
+        i = bisect.bisect_left(items, item)
+        if i < len(items) and items[i] == item:
+            events.append((i, 1, None))
+    events.extend((bisect.bisect_left(items, item), 0, item) for item in added)
+    events.sort(key=lambda e: e[:2] if e[1] else e)
+    merged = []
+    start = 0
+    for i, drop, item in events:
+        merged += items[start:i]
+        if drop:
+            start = i + 1
+        else:
+            merged.append(item)
+            start = i
+    merged += items[start:]
+    return merged
+
+class SearchIndex:
+    """Inverted index with BM25 ranking, updated one document at a time
+    
+    Not thread-safe: searches change nothing but walk the postings a
+    write changes in place, so the Database runs both under its lock.
+    """
+    
+    K1 = 1.2
+    B = 0.75
+    PREFIX_WEIGHT = 0.5
+    MAX_PREFIX_EXPANSIONS = 50
+    
     def __init__(self):
-        self.users = {}
-        self.products = {}
-        self.categories = {}
-        self.orders = {}
-        self.carts = {}
-        self.reviews = {}
-        self.wishlists = {}
-        self.sessions = {}
-        self._initialize_data()
-    
-    def _initialize_data(self):
-        """Initialize database with sample data"""
-        
-        # Categories
-        categories_data = [
-            {
-                'id': str(uuid4()),
-                'name': 'الإلكترونيات',
-                'name_en': 'Electronics',
-                'slug': 'electronics',
-                'description': 'أحدث الأجهزة الإلكترونية والتقنية',
-                'image': 'https://images.unsplash.com/photo-1498049794561-7780e7231661?w=400',
-                'icon': '📱',
-                'color': '#3B82F6',
-                'is_active': True,
-                'sort_order': 1
-            },
-            {
-                'id': str(uuid4()),
-                'name': 'الأزياء',
-                'name_en': 'Fashion',
-                'slug': 'fashion',
-                'description': 'أحدث صيحات الموضة العالمية',
-                'image': 'https://images.unsplash.com/photo-1445205170230-053b83016050?w=400',
-                'icon': '👗',
-                'color': '#EC4899',
-                'is_active': True,
-                'sort_order': 2
-            },
-            {
-                'id': str(uuid4()),
-                'name': 'المنزل',
-                'name_en': 'Home',
-                'slug': 'home',
-                'description': 'أثاث ومستلزمات منزلية فاخرة',
-                'image': 'https://images.unsplash.com/photo-1484101403633-562f891dc89a?w=400',
-                'icon': '🏠',
-                'color': '#10B981',
-                'is_active': True,
-                'sort_order': 3
-            },
-            {
-                'id': str(uuid4()),
-                'name': 'الرياضة',
-                'name_en': 'Sports',
-                'slug': 'sports',
-                'description': 'معدات رياضية احترافية',
-                'image': 'https://images.unsplash.com/photo-1517836357463-d25dfeac3438?w=400',
-                'icon': '⚽',
-                'color': '#F59E0B',
-                'is_active': True,
-                'sort_order': 4
-            },
-            {
-                'id': str(uuid4()),
-                'name': 'الجمال',
-                'name_en': 'Beauty',
-                'slug': 'beauty',
-                'description': 'مستحضرات تجميل وعناية',
-                'image': 'https://images.unsplash.com/photo-1596462502278-27bfdc403348?w=400',
-                'icon': '💄',
-                'color': '#8B5CF6',
-                'is_active': True,
-                'sort_order': 5
-            },
-            {
-                'id': str(uuid4()),
-                'name': 'الكتب',
-                'name_en': 'Books',
-                'slug': 'books',
-                'description': 'كتب ومراجع متنوعة',
-                'image': 'https://images.unsplash.com/photo-1495446815901-a7297e633e8d?w=400',
-                'icon': '📚',
-                'color': '#EF4444',
-                'is_active': True,
-                'sort_order': 6
-            }
-        ]
+        self.postings = {}      # term -> {doc_id: weighted tf}
+        self.doc_terms = {}     # doc_id -> {term: weighted tf}
+        self.doc_lengths = {}
+        self.total_length = 0.0
+        self.terms = []         # sorted vocabulary for prefix lookups
+    
+    def add(self, doc_id, fields):
+        """Index a document given (text, weight) pairs"""
+        self.add_many([(doc_id, fields)])
+    
+    def add_many(self, docs):
+        """Index (doc_id, fields) pairs, merging new terms into the vocabulary once"""
+        self.add_analyzed([(doc_id, self.analyze(fields)) for doc_id, fields in docs])
+    
+    @staticmethod
+    def analyze(fields):
+        """Weighted term frequencies of (text, weight) pairs; reads no index state"""
+        frequencies = {}
+        for text, weight in fields:
+            for term in tokenize(text):
+                frequencies[term] = frequencies.get(term, 0.0) + weight
+        return frequencies
+    
+    def add_analyzed(self, docs):
+        """add_many() for (doc_id, frequencies) pairs already through analyze()"""
+        new_terms = []
+        for doc_id, frequencies in docs:
+            if doc_id in self.doc_terms:
+                self.remove(doc_id)
+            
+            for term, tf in frequencies.items():
+                posting = self.postings.get(term)
+                if posting is None:
+                    posting = self.postings[term] = {}
+                    new_terms.append(term)
+                posting[doc_id] = tf
+            
+            length = sum(frequencies.values())
+            self.doc_terms[doc_id] = frequencies
+            self.doc_lengths[doc_id] = length
+            self.total_length += length
         
-        for cat in categories_data:
-            self.categories[cat['id']] = cat
+        if len(new_terms) <= 16:
+            for term in new_terms:
+                bisect.insort(self.terms, term)
+        else:
+            self.terms = merge_sorted(self.terms, added=new_terms)
+    
+    def remove(self, doc_id):
+        """Drop a document from every posting list it appears in"""
+        frequencies = self.doc_terms.pop(doc_id, None)
+        if frequencies is None:
+            return
+        for term in frequencies:
+            posting = self.postings[term]
+            del posting[doc_id]
+            if not posting:
+                del self.postings[term]
+                del self.terms[bisect.bisect_left(self.terms, term)]
+        self.total_length -= self.doc_lengths.pop(doc_id)
+    
+    def _expand(self, term):
+        """Return (term, weight) pairs for an exact match plus prefix matches"""
+        matches = []
+        if term in self.postings:
+            matches.append((term, 1.0))
+        i = bisect.bisect_right(self.terms, term)
+        while (i < len(self.terms) and self.terms[i].startswith(term)
+               and len(matches) < self.MAX_PREFIX_EXPANSIONS):
+            matches.append((self.terms[i], self.PREFIX_WEIGHT))
+            i += 1
+        return matches
+    
+    def search(self, query):
+        """Return [(doc_id, score)] matching every query term, best first"""
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        if not query_terms or not self.doc_terms:
+            return []
         
-        # Get category IDs
-        cat_ids = list(self.categories.keys())
+        n_docs = len(self.doc_terms)
+        avg_length = self.total_length / n_docs or 1.0
         
-        # Products
-        products_data = [
-            # Electronics
-            {
-                'id': str(uuid4()),
-                'name': 'آيفون 15 برو ماكس',
-                'name_en': 'iPhone 15 Pro Max',
-                'slug': 'iphone-15-pro-max',
-                'description': 'أحدث هاتف من آبل مع شريحة A17 Pro الثورية، كاميرا 48 ميجابكسل مع تصوير سينمائي، وإطار من التيتانيوم. تجربة استخدام لا مثيل لها مع أفضل أداء في عالم الهواتف الذكية.',
-                'short_description': 'الهاتف الأقوى من آبل',
-                'price': 4999,
-                'original_price': 5499,
-                'currency': 'SAR',
-                'category_id': cat_ids[0],
-                'images': [
-                    'https://images.unsplash.com/photo-1695048133142-1a20484d2569?w=600',
-                    'https://images.unsplash.com/photo-1696446701796-da61225697cc?w=600',
-                    'https://images.unsplash.com/photo-1510557880182-3d4d3cba35a5?w=600'
-                ],
-                'thumbnail': 'https://images.unsplash.com/photo-1695048133142-1a20484d2569?w=300',
-                'stock': 50,
-                'sku': 'APL-IP15PM-256',
-                'brand': 'Apple',
-                'tags': ['هاتف', 'آيفون', 'آبل', 'ذكي', 'تيتانيوم'],
-                'specifications': {
-                    'الشاشة': '6.7 بوصة Super Retina XDR',
-                    'المعالج': 'A17 Pro',
-                    'الذاكرة': '256GB',
-                    'الكاميرا': '48MP + 12MP + 12MP',
-                    'البطارية': '4422 mAh',
-                    'نظام التشغيل': 'iOS 17'
-                },
-                'rating': 4.9,
-                'review_count': 2847,
-                'sold_count': 12500,
-                'is_featured': True,
-                'is_active': True,
-                'created_at': datetime.now().isoformat()
-            },
-            {
-                'id': str(uuid4()),
-                'name': 'ماك بوك برو 16 M3 Max',
-                'name_en': 'MacBook Pro 16 M3 Max',
-                'slug': 'macbook-pro-16-m3-max',
-                'description': 'أقوى لابتوب احترافي في العالم مع شريحة M3 Max. شاشة Liquid Retina XDR مذهلة، أداء خارق للمونتاج والتصميم ثلاثي الأبعاد، وبطارية تدوم حتى 22 ساعة.',
-                'short_description': 'قوة خارقة للمحترفين',
-                'price': 18999,
-                'original_price': 21999,
-                'currency': 'SAR',
-                'category_id': cat_ids[0],
-                'images': [
-                    'https://images.unsplash.com/photo-1517336714731-489689fd1ca8?w=600',
-                    'https://images.unsplash.com/photo-1611186871348-b1ce696e52c9?w=600'
-                ],
-                'thumbnail': 'https://images.unsplash.com/photo-1517336714731-489689fd1ca8?w=300',
-                'stock': 25,
-                'sku': 'APL-MBP16-M3MAX',
-                'brand': 'Apple',
-                'tags': ['لابتوب', 'ماك', 'آبل', 'احترافي', 'M3'],
-                'specifications': {
-                    'الشاشة': '16.2 بوصة Liquid Retina XDR',
-                    'المعالج': 'Apple M3 Max',
-                    'الذاكرة': '48GB RAM + 1TB SSD',
-                    'الجرافيكس': '40-core GPU',
-                    'البطارية': '22 ساعة'
-                },
-                'rating': 4.95,
-                'review_count': 1256,
-                'sold_count': 3200,
-                'is_featured': True,
-                'is_active': True,
-                'created_at': datetime.now().isoformat()
-            },
-            {
-                'id': str(uuid4()),
-                'name': 'سماعات Sony WH-1000XM5',
-                'name_en': 'Sony WH-1000XM5',
-                'slug': 'sony-wh-1000xm5',
-                'description': 'أفضل سماعات لاسلكية في العالم مع إلغاء ضوضاء لا مثيل له. صوت Hi-Res Audio، راحة فائقة، وبطارية تدوم 30 ساعة.',
-                'short_description': 'صوت استثنائي بلا حدود',
-                'price': 1499,
-                'original_price': 1799,
-                'currency': 'SAR',
-                'category_id': cat_ids[0],
-                'images': [
-                    'https://images.unsplash.com/photo-1618366712010-f4ae9c647dcb?w=600',
-                    'https://images.unsplash.com/photo-1546435770-a3e426bf472b?w=600'
-                ],
-                'thumbnail': 'https://images.unsplash.com/photo-1618366712010-f4ae9c647dcb?w=300',
-                'stock': 80,
-                'sku': 'SNY-WH1000XM5',
-                'brand': 'Sony',
-                'tags': ['سماعات', 'لاسلكية', 'سوني', 'إلغاء ضوضاء'],
-                'specifications': {
-                    'نوع': 'Over-ear لاسلكية',
-                    'إلغاء الضوضاء': 'نعم - أفضل في فئتها',
-                    'البطارية': '30 ساعة',
-                    'الصوت': 'Hi-Res Audio, LDAC',
-                    'الوزن': '250 جرام'
-                },
-                'rating': 4.8,
-                'review_count': 3421,
-                'sold_count': 8900,
-                'is_featured': True,
-                'is_active': True,
-                'created_at': datetime.now().isoformat()
-            },
-            {
-                'id': str(uuid4()),
-                'name': 'ساعة Apple Watch Ultra 2',
-                'name_en': 'Apple Watch Ultra 2',
-                'slug': 'apple-watch-ultra-2',
-                'description': 'الساعة الأكثر تطوراً من آبل للمغامرين والرياضيين. هيكل من التيتانيوم، شاشة أكثر سطوعاً، ودقة GPS لا مثيل لها.',
-                'short_description': 'لا حدود لمغامراتك',
-                'price': 3699,
-                'original_price': 3999,
-                'currency': 'SAR',
-                'category_id': cat_ids[0],
-                'images': [
-                    'https://images.unsplash.com/photo-1434493789847-2f02dc6ca35d?w=600',
-                    'https://images.unsplash.com/photo-1546868871-7041f2a55e12?w=600'
-                ],
-                'thumbnail': 'https://images.unsplash.com/photo-1434493789847-2f02dc6ca35d?w=300',
-                'stock': 35,
-                'sku': 'APL-AWU2-49',
-                'brand': 'Apple',
-                'tags': ['ساعة', 'آبل', 'ذكية', 'رياضة', 'تيتانيوم'],
-                'specifications': {
-                    'الشاشة': '49mm Always-On Retina',
-                    'المادة': 'تيتانيوم Grade 5',
-                    'مقاومة الماء': '100 متر',
-                    'البطارية': '36 ساعة',
-                    'GPS': 'دقة L1 + L5'
-                },
-                'rating': 4.85,
-                'review_count': 1892,
-                'sold_count': 4500,
-                'is_featured': True,
-                'is_active': True,
-                'created_at': datetime.now().isoformat()
-            },
-            # Fashion
-            {
-                'id': str(uuid4()),
-                'name': 'حقيبة Louis Vuitton Neverfull',
-                'name_en': 'Louis Vuitton Neverfull MM',
-                'slug': 'lv-neverfull-mm',
-                'description': 'حقيبة يد أيقونية من لويس فيتون بتصميم Monogram الكلاسيكي. سعة واسعة مع أناقة لا تُضاهى. الرفيق المثالي لكل مناسبة.',
-                'short_description': 'أيقونة الأناقة الفرنسية',
-                'price': 8999,
-                'original_price': 9999,
-                'currency': 'SAR',
-                'category_id': cat_ids[1],
-                'images': [
-                    'https://images.unsplash.com/photo-1548036328-c9fa89d128fa?w=600',
-                    'https://images.unsplash.com/photo-1584917865442-de89df76afd3?w=600'
-                ],
-                'thumbnail': 'https://images.unsplash.com/photo-1548036328-c9fa89d128fa?w=300',
-                'stock': 15,
-                'sku': 'LV-NVF-MM-MON',
-                'brand': 'Louis Vuitton',
-                'tags': ['حقيبة', 'فاخرة', 'لويس فيتون', 'جلد'],
-                'specifications': {
-                    'المادة': 'كانفاس Monogram + جلد طبيعي',
-                    'الأبعاد': '31 × 28 × 14 سم',
-                    'الإغلاق': 'سحاب داخلي',
-                    'الجيوب': 'جيب داخلي + حقيبة صغيرة قابلة للفصل',
-                    'بلد الصنع': 'فرنسا'
-                },
-                'rating': 4.9,
-                'review_count': 892,
-                'sold_count': 1200,
-                'is_featured': True,
-                'is_active': True,
-                'created_at': datetime.now().isoformat()
-            },
-            {
-                'id': str(uuid4()),
-                'name': 'ساعة Rolex Submariner',
-                'name_en': 'Rolex Submariner Date',
-                'slug': 'rolex-submariner-date',
-                'description': 'ساعة الغواصين الأسطورية من رولكس. هيكل من الفولاذ Oystersteel، إطار دوار Cerachrom، ومقاومة للماء حتى 300 متر.',
-                'short_description': 'أسطورة تحت الماء',
-                'price': 52000,
-                'original_price': 55000,
-                'currency': 'SAR',
-                'category_id': cat_ids[1],
-                'images': [
-                    'https://images.unsplash.com/photo-1587836374828-4dbafa94cf0e?w=600',
-                    'https://images.unsplash.com/photo-1523275335684-37898b6baf30?w=600'
-                ],
-                'thumbnail': 'https://images.unsplash.com/photo-1587836374828-4dbafa94cf0e?w=300',
-                'stock': 5,
-                'sku': 'RLX-SUB-126610LN',
-                'brand': 'Rolex',
-                'tags': ['ساعة', 'رولكس', 'فاخرة', 'غوص'],
-                'specifications': {
-                    'القطر': '41 مم',
-                    'المادة': 'Oystersteel',
-                    'الحركة': '3235 أوتوماتيكية',
-                    'مقاومة الماء': '300 متر',
-                    'احتياطي الطاقة': '70 ساعة'
-                },
-                'rating': 5.0,
-                'review_count': 234,
-                'sold_count': 89,
-                'is_featured': True,
-                'is_active': True,
-                'created_at': datetime.now().isoformat()
-            },
-            # Home
-            {
-                'id': str(uuid4()),
-                'name': 'كنبة زاوية مودرن',
-                'name_en': 'Modern Corner Sofa',
-                'slug': 'modern-corner-sofa',
-                'description': 'كنبة زاوية فاخرة بتصميم إيطالي معاصر. قماش مخمل فاخر مقاوم للبقع، هيكل خشبي متين، ووسائد مريحة للغاية.',
-                'short_description': 'راحة وأناقة في منزلك',
-                'price': 12999,
-                'original_price': 15999,
-                'currency': 'SAR',
-                'category_id': cat_ids[2],
-                'images': [
-                    'https://images.unsplash.com/photo-1555041469-a586c61ea9bc?w=600',
-                    'https://images.unsplash.com/photo-1493663284031-b7e3aefcae8e?w=600'
-                ],
-                'thumbnail': 'https://images.unsplash.com/photo-1555041469-a586c61ea9bc?w=300',
-                'stock': 12,
-                'sku': 'HOM-SOFA-CRN01',
-                'brand': 'Elite Home',
-                'tags': ['كنبة', 'أثاث', 'غرفة معيشة', 'مودرن'],
-                'specifications': {
-                    'الأبعاد': '300 × 200 × 85 سم',
-                    'المادة': 'مخمل فاخر + خشب زان',
-                    'عدد المقاعد': '6 أشخاص',
-                    'الألوان': 'رمادي، بيج، أزرق',
-                    'الضمان': '5 سنوات'
-                },
-                'rating': 4.7,
-                'review_count': 456,
-                'sold_count': 890,
-                'is_featured': True,
-                'is_active': True,
-                'created_at': datetime.now().isoformat()
-            },
-            # Sports
-            {
-                'id': str(uuid4()),
-                'name': 'جهاز جري Technogym',
-                'name_en': 'Technogym Skillrun',
-                'slug': 'technogym-skillrun',
-                'description': 'جهاز الجري الأكثر تطوراً في العالم من Technogym. شاشة تفاعلية 19 بوصة، برامج تدريب احترافية، وتقنية Biofeedback.',
-                'short_description': 'تدريب احترافي في منزلك',
-                'price': 45000,
-                'original_price': 52000,
-                'currency': 'SAR',
-                'category_id': cat_ids[3],
-                'images': [
-                    'https://images.unsplash.com/photo-1576678927484-cc907957088c?w=600',
-                    'https://images.unsplash.com/photo-1538805060514-97d9cc17730c?w=600'
-                ],
-                'thumbnail': 'https://images.unsplash.com/photo-1576678927484-cc907957088c?w=300',
-                'stock': 8,
-                'sku': 'SPR-TG-SKILLRUN',
-                'brand': 'Technogym',
-                'tags': ['جري', 'رياضة', 'منزلي', 'احترافي'],
-                'specifications': {
-                    'السرعة': '0.8 - 30 كم/ساعة',
-                    'الميل': '-3% إلى +25%',
-                    'الشاشة': '19 بوصة تفاعلية',
-                    'البرامج': 'غير محدودة عبر التطبيق',
-                    'الحمولة': '180 كجم'
-                },
-                'rating': 4.9,
-                'review_count': 167,
-                'sold_count': 234,
-                'is_featured': True,
-                'is_active': True,
-                'created_at': datetime.now().isoformat()
-            },
-            # Beauty
-            {
-                'id': str(uuid4()),
-                'name': 'مجموعة La Mer الفاخرة',
-                'name_en': 'La Mer Luxury Collection',
-                'slug': 'la-mer-luxury-collection',
-                'description': 'مجموعة العناية الفاخرة من La Mer تشمل الكريم المرطب الأسطوري، سيروم التجديد، وتونر الترطيب. سر جمال نجمات هوليوود.',
-                'short_description': 'سر الجمال الخالد',
-                'price': 4500,
-                'original_price': 5200,
-                'currency': 'SAR',
-                'category_id': cat_ids[4],
-                'images': [
-                    'https://images.unsplash.com/photo-1571781926291-c477ebfd024b?w=600',
-                    'https://images.unsplash.com/photo-1556228720-195a672e8a03?w=600'
-                ],
-                'thumbnail': 'https://images.unsplash.com/photo-1571781926291-c477ebfd024b?w=300',
-                'stock': 40,
-                'sku': 'BTY-LAMER-LUX',
-                'brand': 'La Mer',
-                'tags': ['عناية', 'بشرة', 'فاخر', 'ترطيب'],
-                'specifications': {
-                    'المحتويات': 'كريم 60مل + سيروم 30مل + تونر 100مل',
-                    'نوع البشرة': 'جميع أنواع البشرة',
-                    'المكون الرئيسي': 'Miracle Broth™',
-                    'بلد المنشأ': 'الولايات المتحدة'
-                },
-                'rating': 4.95,
-                'review_count': 1234,
-                'sold_count': 3400,
-                'is_featured': True,
-                'is_active': True,
-                'created_at': datetime.now().isoformat()
-            },
-            # Books
-            {
-                'id': str(uuid4()),
-                'name': 'مجموعة كتب ريادة الأعمال',
-                'name_en': 'Entrepreneurship Book Collection',
-                'slug': 'entrepreneurship-book-collection',
-                'description': 'مجموعة من أهم كتب ريادة الأعمال تشمل: The Lean Startup، Zero to One، Think and Grow Rich، وغيرها من الكتب الملهمة.',
-                'short_description': 'طريقك نحو النجاح',
-                'price': 450,
-                'original_price': 650,
-                'currency': 'SAR',
-                'category_id': cat_ids[5],
-                'images': [
-                    'https://images.unsplash.com/photo-1544947950-fa07a98d237f?w=600',
-                    'https://images.unsplash.com/photo-1495446815901-a7297e633e8d?w=600'
-                ],
-                'thumbnail': 'https://images.unsplash.com/photo-1544947950-fa07a98d237f?w=300',
-                'stock': 100,
-                'sku': 'BOK-ENT-COL',
-                'brand': 'مكتبة النخبة',
-                'tags': ['كتب', 'ريادة', 'أعمال', 'نجاح', 'تطوير ذات'],
-                'specifications': {
-                    'عدد الكتب': '10 كتب',
-                    'اللغة': 'إنجليزي',
-                    'الغلاف': 'ورقي',
-                    'إجمالي الصفحات': '3500+ صفحة'
-                },
-                'rating': 4.8,
-                'review_count': 567,
-                'sold_count': 2100,
-                'is_featured': True,
-                'is_active': True,
-                'created_at': datetime.now().isoformat()
+        # Resolve each query term to its matching postings, rarest first
+        expanded = [self._expand(term) for term in query_terms]
+        if not all(expanded):
+            return []
+        expanded.sort(key=lambda m: sum(len(self.postings[t]) for t, _ in m))
+        
+        scores = None
+        for matches in expanded:
+            term_scores = {}
+            for term, weight in matches:
+                posting = self.postings[term]
+                df = len(posting)
+                idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+                for doc_id, tf in posting.items():
+                    if scores is not None and doc_id not in scores:
+                        continue
+                    norm = self.K1 * (1 - self.B + self.B * self.doc_lengths[doc_id] / avg_length)
+                    score = weight * idf * tf * (self.K1 + 1) / (tf + norm)
+                    if score > term_scores.get(doc_id, 0.0):
+                        term_scores[doc_id] = score
+            
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {d: scores[d] + term_scores[d] for d in term_scores}
+            if not scores:
+                return []
+        
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SORTED INDEXES
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Product fields that /api/products can sort by
+PRODUCT_SORT_KEYS = ('price', 'rating', 'sold_count', 'name', 'created_at')
+
+def discount_percent(product):
+    """Rounded discount of an active, discounted product, otherwise None"""
+    original = product.get('original_price')
+    if not product['is_active'] or not original or original <= product['price']:
+        return None
+    return round((original - product['price']) / original * 100)
+
+class SortedIndex:
+    """Ordered (key, id) pairs supporting bisect range scans and paging"""
+    __slots__ = ('entries',)
+    
+    def __init__(self):
+        self.entries = []
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    def add(self, key, item_id):
+        bisect.insort(self.entries, (key, item_id))
+    
+    def insert(self, entry):
+        """Add a ready (key, id) pair; one tuple can then back several indexes"""
+        bisect.insort(self.entries, entry)
+    
+    def remove(self, key, item_id):
+        i = bisect.bisect_left(self.entries, (key, item_id))
+        if i < len(self.entries) and self.entries[i] == (key, item_id):
+            del self.entries[i]
+    
+    def update(self, removed=(), added=(), merged=None):
+        """Remove and add many (key, id) pairs, none of them twice
+        
+        A few changes shift the list in place; more are spliced into a new
+        list in one pass (see merge_sorted()). `merged` is what merged()
+        returned for the same change, when the caller built it beforehand.
+        """
+        if merged is None:
+            merged = self.merged(removed, added)
+        if merged is None:
+            for entry in removed:
+                self.remove(*entry)
+            for entry in added:
+                bisect.insort(self.entries, entry)
+        else:
+            self.entries = merged
+    
+    def merged(self, removed=(), added=()):
+        """The new list update() would splice, or None if it would shift in place
+        
+        Leaves the index alone, so the copy can be made while readers still
+        page through the current list.
+        """
+        if len(removed) + len(added) <= 16:
+            return None
+        return merge_sorted(self.entries, removed, added)
+    
+    def range(self, lo=None, hi=None):
+        """Return the [start, stop) positions of keys within lo..hi inclusive"""
+        start = 0 if lo is None else bisect.bisect_left(self.entries, lo, key=lambda e: e[0])
+        stop = len(self.entries) if hi is None else bisect.bisect_right(self.entries, hi, key=lambda e: e[0])
+        return start, max(start, stop)
+    
+    def iter_ids(self, start, stop, reverse=False):
+        """Yield ids between two positions, in key order or reversed"""
+        positions = range(stop - 1, start - 1, -1) if reverse else range(start, stop)
+        entries = self.entries
+        for i in positions:
+            yield entries[i][1]
+    
+    def seek(self, start, stop, after, reverse=False):
+        """Narrow [start, stop) to the entries that follow the (key, id) pair `after`"""
+        if reverse:
+            return start, max(start, min(stop, bisect.bisect_left(self.entries, after)))
+        return max(start, min(stop, bisect.bisect_right(self.entries, after))), stop
+    
+    def page(self, start, stop, offset, limit, reverse=False):
+        """Return up to limit ids after skipping offset, without walking the skipped part"""
+        if reverse:
+            hi = max(start, stop - offset)
+            lo = max(start, hi - limit)
+            return [e[1] for e in reversed(self.entries[lo:hi])]
+        lo = min(stop, start + offset)
+        return [e[1] for e in self.entries[lo:min(stop, lo + limit)]]
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# COLUMNAR PRODUCT STORE (NumPy, optional)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class ProductColumns:
+    """NumPy arrays mirroring the scalar product fields for vectorized filtering
+    
+    Rows are assigned in insertion order and never reused; `upsert` keeps a
+    row in sync with its product dict. Only available when numpy is installed.
+    """
+    
+    DTYPES = {
+        'price': 'float64',
+        'original_price': 'float64',    # NaN when the product has none
+        'stock': 'int64',
+        'rating': 'float64',
+        'sold_count': 'int64',
+        'category': 'int32',            # code from category_codes
+        'is_active': 'bool',
+        'is_featured': 'bool'
+    }
+    SORTABLE = ('price', 'rating', 'sold_count')
+    
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.rows = {}
+        self.ids = np.empty(capacity, dtype=object)
+        self.category_codes = {}
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.DTYPES.items()}
+    
+    def __len__(self):
+        return self.size
+    
+    def _grow(self):
+        capacity = len(self.ids) * 2
+        ids = np.empty(capacity, dtype=object)
+        ids[:self.size] = self.ids[:self.size]
+        self.ids = ids
+        for name, column in self.columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[name] = grown
+    
+    def upsert(self, product):
+        """Copy a product's scalar fields into its row"""
+        row = self.rows.get(product['id'])
+        if row is None:
+            if self.size == len(self.ids):
+                self._grow()
+            row = self.rows[product['id']] = self.size
+            self.ids[row] = product['id']
+            self.size += 1
+        
+        category = self.category_codes.setdefault(product['category_id'], len(self.category_codes))
+        columns = self.columns
+        columns['price'][row] = product['price']
+        columns['original_price'][row] = product.get('original_price') or np.nan
+        columns['stock'][row] = product['stock']
+        columns['rating'][row] = product['rating']
+        columns['sold_count'][row] = product['sold_count']
+        columns['category'][row] = category
+        columns['is_active'][row] = product['is_active']
+        columns['is_featured'][row] = product['is_featured']
+    
+    def mask(self, category_id=None, min_price=None, max_price=None, featured_only=False):
+        """Boolean mask of active rows passing the listing filters"""
+        n = self.size
+        mask = self.columns['is_active'][:n].copy()
+        if category_id is not None:
+            code = self.category_codes.get(category_id, -1)
+            mask &= self.columns['category'][:n] == code
+        if min_price is not None:
+            mask &= self.columns['price'][:n] >= min_price
+        if max_price is not None:
+            mask &= self.columns['price'][:n] <= max_price
+        if featured_only:
+            mask &= self.columns['is_featured'][:n]
+        return mask
+    
+    def top(self, mask, key, count, reverse=False, after=None):
+        """Return up to count ids from mask ordered by (key, id), resuming after `after`
+        
+        Uses argpartition to find the boundary value, then orders only the
+        rows on the near side of it, so the cost stays linear in the mask.
+        """
+        values = self.columns[key][:self.size]
+        ids = self.ids
+        if after is not None:
+            value, after_id = after
+            ties = np.flatnonzero(mask & (values == value))
+            mask = mask & ((values < value) if reverse else (values > value))
+            for row in ties:
+                if (ids[row] < after_id) if reverse else (ids[row] > after_id):
+                    mask[row] = True
+        
+        rows = np.flatnonzero(mask)
+        if count <= 0 or not rows.size:
+            return []
+        if rows.size > count:
+            keyed = -values[rows] if reverse else values[rows]
+            boundary = keyed[np.argpartition(keyed, count - 1)[:count]].max()
+            rows = rows[keyed <= boundary]
+        
+        ordered = sorted(zip(values[rows].tolist(), ids[rows].tolist()), reverse=reverse)
+        return [item_id for _, item_id in ordered[:count]]
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CURSOR PAGINATION
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def encode_cursor(data):
+    """Pack keyset pagination state into an opaque URL-safe token"""
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """Unpack a cursor token, returning None when it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return data if isinstance(data, dict) else None
+    except (ValueError, TypeError):
+        return None
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SALES ROLLUPS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+ORDER_STATUS_LABELS = {
+    'pending': 'قيد الانتظار',
+    'confirmed': 'تم التأكيد',
+    'processing': 'قيد التحضير',
+    'shipped': 'تم الشحن',
+    'delivered': 'تم التسليم',
+    'cancelled': 'ملغي'
+}
+
+# Granularity -> length of the ISO timestamp prefix that names its bucket
+ROLLUP_GRANULARITIES = {
+    'hour': 13,     # 2024-05-01T14
+    'day': 10,      # 2024-05-01
+    'month': 7      # 2024-05
+}
+
+class SalesRollup:
+    """Pre-aggregated order metrics per time bucket, status, category and brand
+    
+    Every order contributes one row per dimension combination it touches:
+    ('*', '*') carries the order total, while (category, '*'), ('*', brand)
+    and (category, brand) carry the matching item totals. Rows are stored
+    under the order's status so a status change moves them between slices.
+    """
+    
+    def __init__(self):
+        # granularity -> {bucket: {(status, category_id, brand): [revenue, orders, units]}}
+        self.buckets = {g: {} for g in ROLLUP_GRANULARITIES}
+        self.bucket_keys = {g: [] for g in ROLLUP_GRANULARITIES}
+        # packed order_id -> (status, ((category_id, brand) of each item, ...)); the
+        # pairs are shared, so an order costs two small tuples however it sold
+        self.contributions = {}
+        self._dims = {}
+    
+    @staticmethod
+    def _rows(order, item_dims):
+        rows = {('*', '*'): [order['total'], 1, sum(i['quantity'] for i in order['items'])]}
+        for item, (category_id, brand) in zip(order['items'], item_dims):
+            for dims in {(category_id, '*'), ('*', brand), (category_id, brand)}:
+                row = rows.get(dims)
+                if row is None:
+                    row = rows[dims] = [0, 1, 0]
+                row[0] += item['total']
+                row[2] += item['quantity']
+        return rows
+    
+    def _apply(self, created_at, status, rows, sign):
+        for granularity, width in ROLLUP_GRANULARITIES.items():
+            bucket_key = created_at[:width]
+            bucket = self.buckets[granularity].get(bucket_key)
+            if bucket is None:
+                bucket = self.buckets[granularity][bucket_key] = {}
+                bisect.insort(self.bucket_keys[granularity], bucket_key)
+            for (category_id, brand), (revenue, orders, units) in rows.items():
+                totals = bucket.get((status, category_id, brand))
+                if totals is None:
+                    totals = bucket[(status, category_id, brand)] = [0, 0, 0]
+                totals[0] += sign * revenue
+                totals[1] += sign * orders
+                totals[2] += sign * units
+    
+    def add_order(self, order, products):
+        """Fold a new order into every granularity
+        
+        Each item's category and brand are captured now, so a later status
+        change moves exactly what was added even if the product changed.
+        """
+        item_dims = []
+        for item in order['items']:
+            product = products.get(item['product_id'])
+            dims = (product['category_id'], product.get('brand')) if product else (None, None)
+            item_dims.append(self._dims.setdefault(dims, dims))
+        item_dims = tuple(item_dims)
+        self.contributions[record_key(order)] = (order['status'], item_dims)
+        self._apply(order['created_at'], order['status'], self._rows(order, item_dims), 1)
+    
+    def status_of(self, order):
+        """Status an order is counted under, or None if it was never added"""
+        entry = self.contributions.get(record_key(order))
+        return entry[0] if entry is not None else None
+    
+    def set_status(self, order, status):
+        """Move an order's contribution to the slice of its new status"""
+        key = record_key(order)
+        old_status, item_dims = self.contributions[key]
+        if status == old_status:
+            return
+        rows = self._rows(order, item_dims)
+        self._apply(order['created_at'], old_status, rows, -1)
+        self._apply(order['created_at'], status, rows, 1)
+        self.contributions[key] = (status, item_dims)
+    
+    def series(self, granularity, start, end, category_id=None, brand=None, statuses=None):
+        """Return [(bucket, revenue, orders, units)] for non-empty buckets in start..end"""
+        width = ROLLUP_GRANULARITIES[granularity]
+        keys = self.bucket_keys[granularity]
+        lo = bisect.bisect_left(keys, start[:width])
+        hi = bisect.bisect_right(keys, end[:width])
+        dims = (category_id or '*', brand or '*')
+        
+        result = []
+        for bucket_key in keys[lo:hi]:
+            revenue = orders = units = 0
+            for (status, category, brand_), totals in self.buckets[granularity][bucket_key].items():
+                if (category, brand_) == dims and (statuses is None or status in statuses):
+                    revenue += totals[0]
+                    orders += totals[1]
+                    units += totals[2]
+            if orders:
+                result.append((bucket_key, round(revenue, 2), orders, units))
+        return result
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CO-PURCHASES
+# ═══════════════════════════════════════════════════════════════════════════════
+
+CO_PURCHASE_COUNTERS = 32   # partner counters kept per product
+BOUGHT_TOGETHER_KEPT = 8    # partners served per product
+
+class CoPurchaseIndex:
+    """Per-product partners ranked by how many orders bought them together
+    
+    Each product keeps at most `capacity` partner counters, maintained
+    with the Space-Saving algorithm: a new partner that finds the table
+    full takes over the smallest counter and adds to its count. Memory
+    is bounded per product, any partner bought in more than 1/capacity
+    of the product's pairs is guaranteed a counter, and a count can only
+    overestimate, by at most what it inherited. Each product's served
+    top list is cached until its counters change.
+    """
+    
+    def __init__(self, capacity=CO_PURCHASE_COUNTERS):
+        self.capacity = capacity
+        self.counters = {}          # product_id -> {partner_id: count}
+        self.version = 0            # bumped by every counted order and rebuild
+        self._top = {}              # product_id -> ((partner_id, count), ...) best first
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _product_ids(order):
+        return {item['product_id'] for item in order['items']}
+    
+    def add_order(self, order):
+        """Count every pair of distinct products bought in the order"""
+        product_ids = self._product_ids(order)
+        if len(product_ids) < 2:
+            return
+        with self._lock:
+            for product_id in product_ids:
+                self._add(self.counters, product_id, ((p, 1) for p in product_ids if p != product_id))
+                self._top.pop(product_id, None)
+            self.version += 1
+    
+    def _add(self, counters, product_id, partners):
+        table = counters.get(product_id)
+        if table is None:
+            table = counters[product_id] = {}
+        for partner, weight in partners:
+            if partner in table:
+                table[partner] += weight
+            elif len(table) < self.capacity:
+                table[partner] = weight
+            else:
+                smallest = min(table, key=table.get)
+                table[partner] = table.pop(smallest) + weight
+    
+    def _merge(self, counters, product_id, partners):
+        """_add() for many partners at once: evictions pop a heap, not a scan"""
+        table = counters.get(product_id)
+        if table is None:
+            table = counters[product_id] = {}
+        heap = None     # (count, partner) once the table is full; stale entries are skipped
+        for partner, weight in partners:
+            if partner in table or len(table) < self.capacity:
+                count = table[partner] = table.get(partner, 0) + weight
+            else:
+                if heap is None:
+                    heap = [(n, p) for p, n in table.items()]
+                    heapq.heapify(heap)
+                while True:
+                    smallest_count, smallest = heapq.heappop(heap)
+                    if table.get(smallest) == smallest_count:
+                        break
+                del table[smallest]
+                count = table[partner] = smallest_count + weight
+            if heap is not None:
+                heapq.heappush(heap, (count, partner))
+    
+    def rebuild(self, orders, chunk=100000):
+        """Recount from scratch by replaying `orders` a chunk at a time
+        
+        A chunk's pairs are counted exactly first, so each distinct pair
+        costs one weighted counter update (heaviest first) rather than
+        one per order that holds it.
+        """
+        counters = {}
+        orders = iter(orders)
+        for batch in iter(lambda: list(islice(orders, chunk)), []):
+            pairs = Counter()
+            for order in batch:
+                product_ids = self._product_ids(order)
+                if len(product_ids) > 1:
+                    pairs.update(combinations(sorted(product_ids), 2))
+            partners = {}
+            for (a, b), count in pairs.most_common():
+                partners.setdefault(a, []).append((b, count))
+                partners.setdefault(b, []).append((a, count))
+            for product_id, weighted in partners.items():
+                self._merge(counters, product_id, weighted)
+        with self._lock:
+            self.counters = counters
+            self._top = {}
+            self.version += 1
+    
+    def counts(self, product_id):
+        """A copy of a product's partner counters"""
+        with self._lock:
+            return dict(self.counters.get(product_id, ()))
+    
+    def bought_together(self, product_id):
+        """((partner_id, count), ...) best first, from the cache when current"""
+        top = self._top.get(product_id)
+        if top is None:
+            with self._lock:
+                table = self.counters.get(product_id, {})
+                top = tuple(sorted(table.items(), key=lambda e: (-e[1], e[0]))[:BOUGHT_TOGETHER_KEPT])
+                self._top[product_id] = top
+        return top
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# RELATED PRODUCTS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# A neighbor's score is the weighted sum of what it shares with the product
+RELATED_WEIGHTS = {
+    'category': 3.0,        # same category
+    'brand': 2.0,           # same brand
+    'tags': 2.0,            # Jaccard overlap of the tags
+    'price': 1.0,           # 1 at the same price, falling towards 0 as the gap grows
+    'co_purchase': 4.0      # bought in the same orders; saturates with the count
+}
+RELATED_KEPT = 8            # neighbors precomputed per product
+RELATED_WINDOW = 12         # price-nearest candidates taken on each side per shared group
+
+class RelatedProducts:
+    """Ranked related-product lists, precomputed and refreshed in the background
+    
+    The candidates for a product are its co-purchase partners plus the
+    RELATED_WINDOW price-nearest products on either side within
+    its category, its brand and each of its tags, so ranking one product
+    stays bounded however large the catalog grows. A product write or a
+    new order marks the affected lists stale; a worker thread recomputes
+    them every `interval` seconds (with interval=None, on the next read)
+    and a product page reads its list with one dict lookup.
+    """
+    
+    def __init__(self, co_purchases, interval=1.0):
+        self.co_purchases = co_purchases
+        self.interval = interval
+        self.neighbors = {}         # product_id -> (neighbor id, ...) best first
+        self.version = 0            # bumped whenever a published list changes
+        self._products = {}         # product_id -> (category_id, brand, tags, price) of active products
+        self._groups = {}           # ('category' | 'brand' | 'tag', value) -> SortedIndex of (price, id)
+        self._listed_by = {}        # product_id -> ids whose list holds it
+        self._changed = {}          # product_id -> clock of its latest unranked field change
+        self._stale = set()         # products whose list needs recomputing
+        self._ranked_at = {}        # product_id -> clock when its list was last ranked
+        self._clock = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._worker = None
+    
+    def reset(self):
+        """Forget every product and list, ahead of tracking the catalog again"""
+        with self._lock:
+            self.neighbors = {}
+            self._products = {}
+            self._groups = {}
+            self._listed_by = {}
+            self._changed = {}
+            self._stale = set()
+            self._ranked_at = {}
+            self.version += 1
+    
+    @staticmethod
+    def _group_keys(entry):
+        category_id, brand, tags, _ = entry
+        keys = [('category', category_id)]
+        if brand:
+            keys.append(('brand', brand))
+        keys.extend(('tag', tag) for tag in tags)
+        return keys
+    
+    def update_product(self, product):
+        """Track a product write; inactive products drop out of every list"""
+        self.update_products([product])
+    
+    def update_products(self, products):
+        """update_product() for many products (each at most once), one pass per group"""
+        entries = []
+        for product in products:
+            entry = None
+            if product['is_active']:
+                entry = (product['category_id'], product.get('brand'),
+                         frozenset(product.get('tags') or ()), product['price'])
+            entries.append((product['id'], entry))
+        with self._lock:
+            group_changes = {}      # group key -> ([removed (price, id)], [added (price, id)])
+            for product_id, entry in entries:
+                old = self._products.get(product_id)
+                if old == entry:
+                    continue
+                if old is not None:
+                    # Its old neighborhood loses a candidate (and windows shift)
+                    self._stale.update(self._candidates(product_id, old, self.co_purchases.counts(product_id)))
+                    for key in self._group_keys(old):
+                        group_changes.setdefault(key, ([], []))[0].append((old[3], product_id))
+                    del self._products[product_id]
+                if entry is not None:
+                    self._products[product_id] = entry
+                    for key in self._group_keys(entry):
+                        group_changes.setdefault(key, ([], []))[1].append((entry[3], product_id))
+                self._clock += 1
+                self._changed[product_id] = self._clock
+            for key, (removed, added) in group_changes.items():
+                group = self._groups.get(key)
+                if group is None:
+                    group = self._groups[key] = SortedIndex()
+                group.update(removed, added)
+                if not len(group):
+                    del self._groups[key]
+        if group_changes:
+            self._schedule()
+    
+    def add_order(self, order):
+        """Re-rank the products of an order once its co-purchases are counted"""
+        product_ids = {item['product_id'] for item in order['items']}
+        if len(product_ids) < 2:
+            return
+        with self._lock:
+            self._stale.update(product_ids)
+        self._schedule()
+    
+    def invalidate(self):
+        """Re-rank every list, e.g. after the co-purchase counts were rebuilt"""
+        with self._lock:
+            self._stale.update(self._products)
+        self._schedule()
+    
+    def related(self, product_id):
+        """Ranked neighbor ids of a product"""
+        if self.interval is None:
+            self.refresh()
+        neighbors = self.neighbors.get(product_id)
+        if neighbors is None and (product_id in self._changed or product_id in self._stale):
+            # Not ranked yet (just added, or the worker has not reached it)
+            with self._lock:
+                if product_id in self._changed or product_id in self._stale:
+                    self._recompute(product_id, self._changed.pop(product_id, None))
+            neighbors = self.neighbors.get(product_id)
+        return neighbors or ()
+    
+    def refresh(self, batch=64):
+        """Recompute every stale list, releasing the lock between batches"""
+        while self._changed or self._stale:
+            with self._lock:
+                for _ in range(batch):
+                    if self._changed:
+                        self._recompute(*self._changed.popitem())
+                    elif self._stale:
+                        self._recompute(self._stale.pop())
+                    else:
+                        break
+    
+    def _recompute(self, product_id, changed_at=None):
+        self._stale.discard(product_id)
+        entry = self._products.get(product_id)
+        if entry is not None:
+            self._ranked_at[product_id] = self._clock
+        else:
+            self._ranked_at.pop(product_id, None)
+        co_purchases = self.co_purchases.counts(product_id) if entry is not None else {}
+        candidates = self._candidates(product_id, entry, co_purchases) if entry is not None else set()
+        old = self.neighbors.get(product_id, ())
+        new = self._rank(entry, candidates, co_purchases)
+        if new != old:
+            for other in old:
+                listed_by = self._listed_by[other]
+                listed_by.discard(product_id)
+                if not listed_by:
+                    del self._listed_by[other]
+            for other in new:
+                self._listed_by.setdefault(other, set()).add(product_id)
+            if new:
+                self.neighbors[product_id] = new
+            else:
+                self.neighbors.pop(product_id, None)
+            self.version += 1
+        if changed_at is not None:
+            # Candidate sets are symmetric (up to co-purchase counters evicted
+            # on one side), so the products that may now rank this one
+            # differently are its own candidates plus the lists that held
+            # it; only those ranked before the change can be out of date
+            ranked_at = self._ranked_at
+            for other in (*self._listed_by.get(product_id, ()), *candidates):
+                if ranked_at.get(other, 0) < changed_at:
+                    self._stale.add(other)
+    
+    def _candidates(self, product_id, entry, co_purchases):
+        """Co-purchased products and the price-nearest ones in every shared group"""
+        price = entry[3]
+        candidates = set(co_purchases)
+        for key in self._group_keys(entry):
+            entries = self._groups[key].entries
+            i = bisect.bisect_left(entries, (price, product_id))
+            candidates.update(e[1] for e in entries[max(0, i - RELATED_WINDOW):i + RELATED_WINDOW + 1])
+        candidates.discard(product_id)
+        return candidates
+    
+    def _rank(self, entry, candidates, co_purchases):
+        if not candidates:
+            return ()
+        category_id, brand, tags, price = entry
+        products = self._products
+        w_category, w_brand, w_tags, w_price, w_co_purchase = RELATED_WEIGHTS.values()
+        scored = []
+        for other in candidates:
+            other_entry = products.get(other)
+            if other_entry is None:
+                continue
+            other_category, other_brand, other_tags, other_price = other_entry
+            score = w_category if other_category == category_id else 0.0
+            if brand and other_brand == brand:
+                score += w_brand
+            if tags and other_tags:
+                score += w_tags * len(tags & other_tags) / len(tags | other_tags)
+            gap = price - other_price
+            score += w_price * (1 - gap / price) if gap > 0 else w_price * (1 + gap / other_price) if gap else w_price
+            if co_purchases:
+                count = co_purchases.get(other)
+                if count:
+                    score += w_co_purchase * count / (count + 2)
+            scored.append((-score, other))
+        return tuple(other for _, other in heapq.nsmallest(RELATED_KEPT, scored))
+    
+    def _schedule(self):
+        if self.interval is None:
+            return
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name='related-refresh', daemon=True)
+                    self._worker.start()
+        self._wake.set()
+    
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            self.refresh()
+            # Let writes pile up so a burst of orders costs one pass
+            time.sleep(self.interval)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# RECORDS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class FrozenRecord(dict):
+    """A read-only dict for catalog records shared between request threads
+    
+    Reads, iteration, `{**record}` and JSON encoding behave as for a dict;
+    every in-place change raises TypeError. New versions of a record are
+    built as plain dicts and frozen when they are written.
+    """
+    __slots__ = ()
+    
+    def _readonly(self, *args, **kwargs):
+        raise TypeError(f"'{type(self).__name__}' is read-only; write a new version instead")
+    
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+    
+    def __reduce__(self):
+        return (type(self), (dict(self),))
+
+def freeze(value):
+    """Deep read-only copy: dicts become FrozenRecords and lists tuples"""
+    if isinstance(value, FrozenRecord):
+        return value
+    if isinstance(value, dict):
+        return FrozenRecord({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+# Users, carts and orders are far more numerous than catalog records, so the
+# memory store keeps them as __slots__ records with packed field values.
+# Every record reads like the dict it was built from (`record[name]`,
+# get(), keys(), `{**record}`) and to_dict() gives back the same JSON.
+
+_MISSING = object()
+_EPOCH = datetime(1970, 1, 1)
+
+def pack_uuid(value):
+    """Canonical UUID string -> 128-bit int; any other id is kept as is"""
+    if type(value) is str and len(value) == 36:
+        try:
+            packed = int(value.replace('-', ''), 16)
+        except ValueError:
+            return value
+        if unpack_uuid(packed) == value:
+            return packed
+    return value
+
+def unpack_uuid(value):
+    if type(value) is not int:
+        return value
+    h = f'{value:032x}'
+    return f'{h[:8]}-{h[8:12]}-{h[12:16]}-{h[16:20]}-{h[20:]}'
+
+def pack_time(value):
+    """Naive ISO timestamp -> int microseconds since the epoch, when that round-trips"""
+    if type(value) is not str:
+        return value
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    if moment.tzinfo is not None or moment.isoformat() != value:
+        return value
+    return (moment - _EPOCH) // timedelta(microseconds=1)
+
+def unpack_time(value):
+    if type(value) is not int:
+        return value
+    return (_EPOCH + timedelta(microseconds=value)).isoformat()
+
+def time_key(value):
+    """Sortable form of a packed or ISO timestamp: microseconds whenever it parses"""
+    if type(value) is not str:
+        return value
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    if moment.tzinfo is not None:
+        return value
+    return (moment - _EPOCH) // timedelta(microseconds=1)
+
+# Packed ids that many records point at (customers, products), one int each
+_shared_ids = {}
+
+@lru_cache(maxsize=65536)
+def pack_shared_uuid(value):
+    packed = pack_uuid(value)
+    return _shared_ids.setdefault(packed, packed)
+
+unpack_shared_uuid = lru_cache(maxsize=65536)(unpack_uuid)
+
+def intern_str(value):
+    """Share one copy of a low-cardinality string (roles, cities, labels)"""
+    return sys.intern(value) if type(value) is str else value
+
+class OrderStatus(Enum):
+    PENDING = 'pending'
+    CONFIRMED = 'confirmed'
+    PROCESSING = 'processing'
+    SHIPPED = 'shipped'
+    DELIVERED = 'delivered'
+    CANCELLED = 'cancelled'
+    
+    @property
+    def label(self):
+        return ORDER_STATUS_LABELS[self.value]
+
+def pack_status(value):
+    return OrderStatus(value) if value in ORDER_STATUS_LABELS else value
+
+def unpack_status(value):
+    return value.value if isinstance(value, OrderStatus) else value
+
+class Field:
+    """How a record keeps one JSON field
+    
+    `pack` converts the JSON value on the way in, `read` converts it back
+    for record[name] and `dump` for to_dict(); None keeps the value as is.
+    None values are never converted.
+    """
+    __slots__ = ('pack', 'read', 'dump')
+    
+    def __init__(self, pack=None, read=None, dump=None):
+        self.pack = pack
+        self.read = read
+        self.dump = read if dump is None else dump
+
+PLAIN = Field()
+SHARED = Field(intern_str)
+UUID_FIELD = Field(pack_uuid, unpack_uuid)
+SHARED_UUID_FIELD = Field(pack_shared_uuid, unpack_shared_uuid)
+TIME_FIELD = Field(pack_time, unpack_time)
+STATUS_FIELD = Field(pack_status, unpack_status)
+# Nested JSON kept read-only; the empty list packs to the shared ()
+FROZEN_LIST = Field(freeze, None, list)
+
+def record_field(record_type):
+    """A nested record, read as the record itself"""
+    return Field(
+        lambda v: record_type.from_dict(v) if isinstance(v, (dict, record_type)) else v,
+        None,
+        lambda v: v.to_dict() if isinstance(v, Record) else v
+    )
+
+def record_list_field(record_type):
+    """A list of nested records, read as a tuple of records"""
+    return Field(
+        lambda v: tuple(record_type.from_dict(i) if isinstance(i, (dict, record_type)) else i for i in v),
+        None,
+        lambda v: [i.to_dict() if isinstance(i, Record) else i for i in v]
+    )
+
+class Record:
+    """Base of the compact records; FIELDS maps each JSON key to its Field
+    
+    A key missing from the source dict stays missing, and keys outside
+    FIELDS go to `extra`, so to_dict() reproduces the source exactly.
+    A field left out of __slots__ is derived: a property of the same name
+    computes it, and a value for it in the source dict is dropped.
+    Records are replaced rather than changed, like the catalog records.
+    """
+    __slots__ = ('extra',)
+    FIELDS = {}
+    
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        slots = cls.__dict__.get('__slots__', ())
+        cls._packers = tuple((name, f.pack) for name, f in cls.FIELDS.items() if name in slots)
+        cls._readers = {name: f.read for name, f in cls.FIELDS.items()}
+        cls._dumpers = tuple((name, f.dump) for name, f in cls.FIELDS.items())
+    
+    @classmethod
+    def from_dict(cls, data):
+        if type(data) is cls:
+            return data
+        record = cls.__new__(cls)
+        get = data.get
+        for name, pack in cls._packers:
+            value = get(name, _MISSING)
+            if pack is not None and value is not None and value is not _MISSING:
+                value = pack(value)
+            setattr(record, name, value)
+        fields = cls.FIELDS
+        record.extra = {k: data[k] for k in data.keys() if k not in fields} or None
+        return record
+    
+    @classmethod
+    def pack_field(cls, name, value):
+        """The stored form of a JSON value of field `name`"""
+        pack = cls.FIELDS[name].pack
+        return pack(value) if pack is not None and value is not None else value
+    
+    def to_dict(self):
+        data = {}
+        for name, dump in self._dumpers:
+            value = getattr(self, name)
+            if value is not _MISSING:
+                data[name] = dump(value) if dump is not None and value is not None else value
+        if self.extra:
+            data.update(self.extra)
+        return data
+    
+    def __getitem__(self, name):
+        read = self._readers.get(name, _MISSING)
+        if read is _MISSING:
+            if self.extra and name in self.extra:
+                return self.extra[name]
+            raise KeyError(name)
+        value = getattr(self, name)
+        if value is _MISSING:
+            raise KeyError(name)
+        return read(value) if read is not None and value is not None else value
+    
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+    
+    def keys(self):
+        keys = [name for name in self.FIELDS if getattr(self, name) is not _MISSING]
+        if self.extra:
+            keys.extend(self.extra)
+        return keys
+    
+    def __contains__(self, name):
+        return name in self.keys()
+    
+    def __iter__(self):
+        return iter(self.keys())
+    
+    def __repr__(self):
+        return f'{type(self).__name__}({self.to_dict()!r})'
+
+class User(Record):
+    FIELDS = {
+        'id': SHARED_UUID_FIELD, 'email': PLAIN, 'password': PLAIN, 'first_name': PLAIN,
+        'last_name': PLAIN, 'phone': PLAIN, 'role': SHARED, 'avatar': PLAIN,
+        'is_verified': PLAIN, 'is_active': PLAIN, 'addresses': FROZEN_LIST, 'created_at': TIME_FIELD
+    }
+    __slots__ = tuple(FIELDS)
+
+class CartItem(Record):
+    FIELDS = {'product_id': SHARED_UUID_FIELD, 'quantity': PLAIN, 'added_at': TIME_FIELD}
+    __slots__ = tuple(FIELDS)
+
+class Cart(Record):
+    FIELDS = {
+        'id': UUID_FIELD, 'user_id': SHARED_UUID_FIELD, 'items': record_list_field(CartItem),
+        'created_at': TIME_FIELD, 'updated_at': TIME_FIELD
+    }
+    __slots__ = tuple(FIELDS)
+
+class OrderItem(Record):
+    FIELDS = {
+        'product_id': SHARED_UUID_FIELD, 'name': SHARED, 'price': PLAIN, 'quantity': PLAIN,
+        'total': PLAIN, 'thumbnail': SHARED
+    }
+    __slots__ = tuple(FIELDS)
+
+class ShippingAddress(Record):
+    FIELDS = {'full_name': PLAIN, 'phone': PLAIN, 'city': SHARED, 'address': PLAIN}
+    __slots__ = tuple(FIELDS)
+
+class Order(Record):
+    FIELDS = {
+        'id': UUID_FIELD, 'order_number': PLAIN, 'user_id': SHARED_UUID_FIELD,
+        'items': record_list_field(OrderItem), 'shipping_address': record_field(ShippingAddress),
+        'payment_method': SHARED, 'subtotal': PLAIN, 'shipping_cost': PLAIN, 'tax': PLAIN,
+        'total': PLAIN, 'status': STATUS_FIELD, 'status_label': PLAIN, 'notes': PLAIN,
+        'created_at': TIME_FIELD, 'updated_at': TIME_FIELD
+    }
+    __slots__ = tuple(name for name in FIELDS if name != 'status_label')
+    
+    @property
+    def status_label(self):
+        """Label of the status, derived rather than kept on every order"""
+        return self.status.label if isinstance(self.status, OrderStatus) else _MISSING
+
+# Tables the memory store keeps as records, keyed by their packed id
+RECORD_TYPES = {'users': User, 'carts': Cart, 'orders': Order}
+
+def as_record(table, data):
+    """The compact record for a row of `table`; rows of other tables pass through"""
+    record_type = RECORD_TYPES.get(table)
+    return record_type.from_dict(data) if record_type is not None else data
+
+def record_key(record):
+    """Packed id of a record or of a dict row"""
+    return record.id if isinstance(record, Record) else pack_uuid(record['id'])
+
+def record_json(value):
+    """`default` hook that lets the JSON encoders write records"""
+    if isinstance(value, Record):
+        return value.to_dict()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# STORAGE BACKENDS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Table -> (indexed columns, unique columns). Every record is a dict with an
+# 'id'; orders are additionally paged newest-first by (created_at, id).
+STORAGE_SCHEMA = {
+    'users': (('email', 'role', 'created_at'), ('email',)),
+    'categories': (('slug',), ('slug',)),
+    'products': (('slug', 'category_id', 'created_at'), ('slug',)),
+    'carts': (('user_id',), ('user_id',)),
+    'orders': (('user_id', 'created_at'), ()),
+    'reviews': ((), ()),
+    'wishlists': ((), ()),
+    'sessions': (('user_id',), ())
+}
+
+class MemoryStorage:
+    """Dict-backed tables; records are stored and returned by reference
+    
+    Unique columns get a value -> id map, and orders get created_at indexes
+    globally and per user so `recent` can page them without sorting.
+    Tables in RECORD_TYPES hold compact records, and their rows, unique
+    maps and order indexes use the packed field values (ints for UUIDs
+    and timestamps) rather than strings.
+    """
+    
+    shared = False
+    # get() and friends hand back the stored objects themselves
+    by_reference = True
+    
+    def __init__(self):
+        self.tables = {table: {} for table in STORAGE_SCHEMA}
+        self.unique = {
+            (table, column): {}
+            for table, (_, unique) in STORAGE_SCHEMA.items() for column in unique
+        }
+        # packed user_id or None (all orders) -> SortedIndex of (time_key(created_at), packed order_id)
+        self.order_indexes = {None: SortedIndex()}
+    
+    def transaction(self):
+        # Callers already serialize writes with the Database locks
+        return nullcontext()
+    
+    @staticmethod
+    def _pack(table, column, value):
+        record_type = RECORD_TYPES.get(table)
+        return record_type.pack_field(column, value) if record_type is not None else value
+    
+    @staticmethod
+    def _raw(record, column):
+        return getattr(record, column) if isinstance(record, Record) else record[column]
+    
+    def get(self, table, key):
+        return self.tables[table].get(self._pack(table, 'id', key))
+    
+    def find(self, table, column, value):
+        """Look a record up by one of its unique columns"""
+        key = self.unique[(table, column)].get(self._pack(table, column, value))
+        return self.tables[table].get(key) if key is not None else None
+    
+    def put(self, table, record):
+        """Insert or replace a record, enforcing unique columns"""
+        record = as_record(table, record)
+        raw = self._raw
+        key = raw(record, 'id')
+        rows = self.tables[table]
+        old = rows.get(key)
+        for column in STORAGE_SCHEMA[table][1]:
+            index = self.unique[(table, column)]
+            owner = index.get(raw(record, column))
+            if owner is not None and owner != key:
+                raise ValueError(f"duplicate {table}.{column}: {record[column]}")
+        for column in STORAGE_SCHEMA[table][1]:
+            index = self.unique[(table, column)]
+            if old is not None and raw(old, column) != raw(record, column):
+                del index[raw(old, column)]
+            index[raw(record, column)] = key
+        rows[key] = record
+        
+        if table == 'orders' and old is None:
+            entry = (time_key(raw(record, 'created_at')), key)
+            user_id = raw(record, 'user_id')
+            self.order_indexes[None].insert(entry)
+            user_index = self.order_indexes.get(user_id)
+            if user_index is None:
+                user_index = self.order_indexes[user_id] = SortedIndex()
+            user_index.insert(entry)
+    
+    def delete(self, table, key):
+        record = self.tables[table].pop(self._pack(table, 'id', key), None)
+        if record is None:
+            return
+        raw = self._raw
+        for column in STORAGE_SCHEMA[table][1]:
+            self.unique[(table, column)].pop(raw(record, column), None)
+        if table == 'orders':
+            entry = (time_key(raw(record, 'created_at')), raw(record, 'id'))
+            self.order_indexes[None].remove(*entry)
+            self.order_indexes[raw(record, 'user_id')].remove(*entry)
+    
+    def scan(self, table):
+        return iter(list(self.tables[table].values()))
+    
+    def count(self, table, column=None, value=None):
+        if column is None:
+            return len(self.tables[table])
+        if table == 'orders' and column == 'user_id':
+            return len(self.order_indexes.get(self._pack(table, column, value), ()))
+        return sum(1 for r in self.tables[table].values() if r.get(column) == value)
+    
+    def recent_orders(self, user_id=None, after=None, limit=20):
+        """Orders newest first, optionally for one user and after a (created_at, id) key"""
+        if user_id is not None:
+            user_id = Order.pack_field('user_id', user_id)
+        index = self.order_indexes.get(user_id) or SortedIndex()
+        start, stop = 0, len(index)
+        if after is not None:
+            after = (time_key(after[0]), Order.pack_field('id', after[1]))
+            start, stop = index.seek(start, stop, after, reverse=True)
+        orders = self.tables['orders']
+        return [orders[oid] for oid in index.page(start, stop, 0, limit, reverse=True)]
+    
+    def last_change(self):
+        return 0
+    
+    def changes_since(self, seq):
+        return []
+
+class JournaledStorage(MemoryStorage):
+    """MemoryStorage made durable by a write-ahead log and periodic snapshots
+    
+    Every put/delete is appended to `journal-<seq>.log` as one JSON line.
+    A single flusher thread writes whatever has queued up since its last
+    pass and fsyncs once for the whole batch (group commit); writers block
+    at the end of their outermost transaction until their last record is
+    on disk, after releasing the Database lock. Every `snapshot_every`
+    records the tables are copied and written to `snapshot-<seq>.jsonl`
+    in the background, a new journal is started at that sequence number,
+    and older files are removed once the snapshot is safely renamed.
+    Recovery loads the newest snapshot and replays the journals after it.
+    """
+    
+    def __init__(self, directory, snapshot_every=50000):
+        super().__init__()
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.stats = {'records': 0, 'fsyncs': 0}
+        os.makedirs(directory, exist_ok=True)
+        
+        self._local = threading.local()
+        self._write_lock = threading.RLock()  # memory apply + log append
+        self._io_lock = threading.Lock()      # journal file writes
+        self._cond = threading.Condition()    # pending queue and durable mark
+        self._pending = []
+        self._closed = False
+        self._snapshotting = False
+        
+        self._seq = self._recover()
+        self._durable_seq = self._seq
+        self._since_snapshot = 0
+        self._log = open(self._path('journal', self._seq), 'ab')
+        self._flusher = threading.Thread(target=self._flush_loop, name='journal-flusher', daemon=True)
+        self._flusher.start()
+    
+    def _path(self, kind, seq):
+        suffix = 'log' if kind == 'journal' else 'jsonl'
+        return os.path.join(self.directory, f'{kind}-{seq:012d}.{suffix}')
+    
+    def _files(self, kind):
+        """[(start seq, path)] of the given kind, oldest first"""
+        files = []
+        for name in os.listdir(self.directory):
+            match = re.fullmatch(rf'{kind}-(\d+)\.(?:log|jsonl)', name)
+            if match:
+                files.append((int(match.group(1)), os.path.join(self.directory, name)))
+        return sorted(files)
+    
+    # ─── Recovery ────────────────────────────────────────────────────────────
+    
+    def _recover(self):
+        """Load the newest snapshot and replay the journal tail; returns the last seq"""
+        seq = 0
+        snapshots = self._files('snapshot')
+        if snapshots:
+            seq, path = snapshots[-1]
+            with open(path, 'rb') as f:
+                for line in f:
+                    table, record = json.loads(line)
+                    MemoryStorage.put(self, table, record)
+        
+        for start, path in self._files('journal'):
+            with open(path, 'rb+') as f:
+                offset = 0
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn write from a crash: drop the partial record
+                        f.truncate(offset)
+                        break
+                    offset += len(line)
+                    if entry['s'] <= seq:
+                        continue
+                    seq = entry['s']
+                    if 'r' in entry:
+                        MemoryStorage.put(self, entry['t'], entry['r'])
+                    else:
+                        MemoryStorage.delete(self, entry['t'], entry['k'])
+        return seq
+    
+    # ─── Writes ──────────────────────────────────────────────────────────────
+    
+    @contextmanager
+    def transaction(self):
+        """Callers still serialize with the Database lock; this only defers
+        the durability wait until the outermost block has finished"""
+        depth = getattr(self._local, 'depth', 0)
+        self._local.depth = depth + 1
+        try:
+            yield
+        finally:
+            self._local.depth = depth
+        if depth == 0:
+            self._wait_durable()
+    
+    def put(self, table, record):
+        with self._write_lock:
+            super().put(table, record)
+            self._append({'t': table, 'r': record})
+        if not getattr(self._local, 'depth', 0):
+            self._wait_durable()
+    
+    def delete(self, table, key):
+        with self._write_lock:
+            super().delete(table, key)
+            self._append({'t': table, 'k': key})
+        if not getattr(self._local, 'depth', 0):
+            self._wait_durable()
+    
+    def _append(self, entry):
+        with self._cond:
+            self._seq += 1
+            entry['s'] = self._seq
+            self._pending.append(json.dumps(entry, ensure_ascii=False, separators=(',', ':'), default=record_json) + '\n')
+            self._cond.notify_all()
+        self._local.last_seq = entry['s']
+        self._since_snapshot += 1
+        if self._since_snapshot >= self.snapshot_every and not self._snapshotting:
+            self._snapshotting = True
+            threading.Thread(target=self.snapshot, name='journal-snapshot', daemon=True).start()
+    
+    def _wait_durable(self):
+        seq = getattr(self._local, 'last_seq', 0)
+        if seq > self._durable_seq:
+            with self._cond:
+                while self._durable_seq < seq:
+                    self._cond.wait()
+    
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+            with self._io_lock:
+                self._flush()
+    
+    def _flush(self):
+        """Write and fsync everything queued so far (caller holds _io_lock)"""
+        with self._cond:
+            batch, self._pending = self._pending, []
+            upto = self._seq
+        if batch:
+            self._log.write(''.join(batch).encode('utf-8'))
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self.stats['records'] += len(batch)
+            self.stats['fsyncs'] += 1
+        with self._cond:
+            self._durable_seq = max(self._durable_seq, upto)
+            self._cond.notify_all()
+    
+    # ─── Snapshots ───────────────────────────────────────────────────────────
+    
+    def snapshot(self):
+        """Write every table to a new snapshot and drop the files it supersedes"""
+        try:
+            with self._write_lock, self._io_lock:
+                self._flush()
+                seq = self._seq
+                self._log.close()
+                self._log = open(self._path('journal', seq), 'ab')
+                self._since_snapshot = 0
+                # A record changed after this copy is also in the new journal,
+                # and replaying it overwrites whatever image the snapshot got
+                tables = [(table, list(rows.values())) for table, rows in self.tables.items()]
+            
+            path = self._path('snapshot', seq)
+            with open(path + '.tmp', 'wb') as f:
+                for table, records in tables:
+                    f.writelines(
+                        (json.dumps([table, r], ensure_ascii=False, separators=(',', ':'),
+                                    default=record_json) + '\n').encode('utf-8')
+                        for r in records
+                    )
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+            dir_fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+            
+            for kind in ('snapshot', 'journal'):
+                for start, old in self._files(kind):
+                    if start < seq:
+                        os.remove(old)
+            return seq
+        finally:
+            self._snapshotting = False
+    
+    def close(self):
+        """Flush outstanding records and stop the flusher thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._flusher.join()
+        with self._io_lock:
+            self._flush()
+            self._log.close()
+
+class ChangeFeedTruncated(Exception):
+    """Changes after the reader's position were pruned before it read them"""
+
+class SQLiteStorage:
+    """SQLite tables shared by every worker process that opens the same file
+    
+    Records are stored as JSON next to the indexed columns from
+    STORAGE_SCHEMA. Each thread leases its own connection from a pool (WAL
+    mode lets readers run alongside the single writer), and every statement
+    is a fixed parameterized string so sqlite3's per-connection statement
+    cache reuses the prepared form. Writes also append to a `changes` feed
+    that other processes tail to keep their in-memory read models current.
+    
+    Readers record how far they have read in `change_readers`, and
+    prune_changes() deletes the feed rows every live reader is past. A
+    reader silent for longer than the timeout no longer holds rows back;
+    if it reads again after they are gone, changes_since() raises
+    ChangeFeedTruncated and the reader has to reload from the tables.
+    """
+    
+    shared = True
+    # Every read decodes a fresh copy of the record
+    by_reference = False
+    
+    def __init__(self, path, pool_size=16, busy_timeout_ms=5000):
+        self.path = path
+        self.pool_size = pool_size
+        self.busy_timeout_ms = busy_timeout_ms
+        self._idle = []
+        self._idle_lock = threading.Lock()
+        self._local = threading.local()
+        
+        self._sql = {}
+        for table, (columns, _) in STORAGE_SCHEMA.items():
+            names = ('id',) + columns + ('doc',)
+            self._sql[table] = {
+                'get': f"SELECT doc FROM {table} WHERE id = ?",
+                'find': {c: f"SELECT doc FROM {table} WHERE {c} = ?" for c in columns},
+                'insert': f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})",
+                'update': f"UPDATE {table} SET {', '.join(f'{n} = ?' for n in names[1:])} WHERE id = ?",
+                'delete': f"DELETE FROM {table} WHERE id = ?",
+                'scan': f"SELECT doc FROM {table}",
+                'count': f"SELECT COUNT(*) FROM {table}",
+                'count_by': {c: f"SELECT COUNT(*) FROM {table} WHERE {c} = ?" for c in columns},
+                'ids_by': {c: f"SELECT id FROM {table} WHERE {c} = ?" for c in columns}
             }
-        ]
         
-        for prod in products_data:
-            self.products[prod['id']] = prod
-        
-        # Create admin user
-        admin_id = str(uuid4())
-        self.users[admin_id] = {
-            'id': admin_id,
-            'email': 'admin@elitesouk.com',
-            'password': self._hash_password('admin123'),
-            'first_name': 'مدير',
-            'last_name': 'النظام',
-            'phone': '+966500000000',
-            'role': 'admin',
-            'avatar': None,
-            'is_verified': True,
-            'is_active': True,
-            'addresses': [],
-            'created_at': datetime.now().isoformat()
+        conn = self._connection()
+        with self.transaction():
+            for table, (columns, unique) in STORAGE_SCHEMA.items():
+                column_defs = ''.join(
+                    f", {c} TEXT{' NOT NULL UNIQUE' if c in unique else ''}" for c in columns
+                )
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (id TEXT PRIMARY KEY{column_defs}, doc TEXT NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS users_created_at ON users (created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS products_category ON products (category_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS products_created_at ON products (created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS orders_user_created ON orders (user_id, created_at, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS orders_created ON orders (created_at, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_user ON sessions (user_id)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS changes ("
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, tbl TEXT NOT NULL, key TEXT NOT NULL, op TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS change_readers ("
+                "id TEXT PRIMARY KEY, seq INTEGER NOT NULL, seen_at REAL NOT NULL)"
+            )
+            # One row: the highest sequence number pruned so far
+            conn.execute("CREATE TABLE IF NOT EXISTS changes_pruned (seq INTEGER NOT NULL)")
+            if conn.execute("SELECT COUNT(*) FROM changes_pruned").fetchone()[0] == 0:
+                conn.execute("INSERT INTO changes_pruned (seq) VALUES (0)")
+    
+    # ─── Connections ─────────────────────────────────────────────────────────
+    
+    def _connection(self):
+        """Return this thread's connection, leasing one from the pool if needed"""
+        lease = getattr(self._local, 'lease', None)
+        if lease is not None:
+            return lease.conn
+        with self._idle_lock:
+            conn = self._idle.pop() if self._idle else None
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                                   cached_statements=256)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        lease = _ConnectionLease(conn)
+        self._local.lease = lease
+        self._local.depth = 0
+        # When the thread exits its locals are dropped and the connection goes back
+        weakref.finalize(lease, self._give_back, conn)
+        return conn
+    
+    def _give_back(self, conn):
+        with self._idle_lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+    
+    @contextmanager
+    def transaction(self):
+        """Exclusive write transaction; nested calls join the outer one"""
+        conn = self._connection()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield
+            finally:
+                self._local.depth -= 1
+            return
+        
+        conn.execute('BEGIN IMMEDIATE')
+        self._local.depth = 1
+        try:
+            yield
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+        finally:
+            self._local.depth = 0
+    
+    # ─── Records ─────────────────────────────────────────────────────────────
+    
+    @staticmethod
+    def _decode(row):
+        return json.loads(row[0]) if row else None
+    
+    def get(self, table, key):
+        return self._decode(self._connection().execute(self._sql[table]['get'], (key,)).fetchone())
+    
+    def find(self, table, column, value):
+        return self._decode(self._connection().execute(self._sql[table]['find'][column], (value,)).fetchone())
+    
+    def put(self, table, record):
+        """Insert or replace a record; returns the change feed sequence number"""
+        sql = self._sql[table]
+        values = [record.get(c) for c in STORAGE_SCHEMA[table][0]]
+        values.append(json.dumps(record, ensure_ascii=False, separators=(',', ':'), default=record_json))
+        conn = self._connection()
+        with self.transaction():
+            try:
+                op = 'update'
+                if conn.execute(sql['update'], values + [record['id']]).rowcount == 0:
+                    op = 'insert'
+                    conn.execute(sql['insert'], [record['id']] + values)
+            except sqlite3.IntegrityError as e:
+                raise ValueError(f"duplicate {table} record: {e}") from None
+            return self._log_change(conn, table, record['id'], op)
+    
+    def delete(self, table, key):
+        conn = self._connection()
+        with self.transaction():
+            conn.execute(self._sql[table]['delete'], (key,))
+            return self._log_change(conn, table, key, 'delete')
+    
+    def scan(self, table):
+        for row in self._connection().execute(self._sql[table]['scan']):
+            yield json.loads(row[0])
+    
+    def count(self, table, column=None, value=None):
+        if column is None:
+            return self._connection().execute(self._sql[table]['count']).fetchone()[0]
+        return self._connection().execute(self._sql[table]['count_by'][column], (value,)).fetchone()[0]
+    
+    def ids_by(self, table, column, value):
+        """Ids of the records whose indexed `column` equals `value`"""
+        return [row[0] for row in self._connection().execute(self._sql[table]['ids_by'][column], (value,))]
+    
+    def recent_orders(self, user_id=None, after=None, limit=20):
+        """Orders newest first via the (user_id, created_at, id) index"""
+        clauses, params = [], []
+        if user_id is not None:
+            clauses.append("user_id = ?")
+            params.append(user_id)
+        if after is not None:
+            clauses.append("(created_at, id) < (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(clauses)} " if clauses else ''
+        rows = self._connection().execute(
+            f"SELECT doc FROM orders {where}ORDER BY created_at DESC, id DESC LIMIT ?",
+            params + [limit]
+        )
+        return [json.loads(row[0]) for row in rows]
+    
+    # ─── Change feed ─────────────────────────────────────────────────────────
+    
+    @staticmethod
+    def _log_change(conn, table, key, op):
+        return conn.execute(
+            "INSERT INTO changes (tbl, key, op) VALUES (?, ?, ?)", (table, key, op)
+        ).lastrowid
+    
+    def _pruned_through(self):
+        return self._connection().execute("SELECT seq FROM changes_pruned").fetchone()[0]
+    
+    def last_change(self):
+        last = self._connection().execute("SELECT COALESCE(MAX(seq), 0) FROM changes").fetchone()[0]
+        return max(last, self._pruned_through())
+    
+    def changes_since(self, seq):
+        """Feed rows after `seq`; raises ChangeFeedTruncated if some were pruned"""
+        rows = self._connection().execute(
+            "SELECT seq, tbl, key, op FROM changes WHERE seq > ? ORDER BY seq", (seq,)
+        ).fetchall()
+        # Checked after the read, so a prune running alongside it is caught too
+        if self._pruned_through() > seq:
+            raise ChangeFeedTruncated(seq)
+        return rows
+    
+    def report_position(self, reader_id, seq):
+        """Record that `reader_id` has applied every change up to `seq`"""
+        conn = self._connection()
+        with self.transaction():
+            conn.execute(
+                "INSERT INTO change_readers (id, seq, seen_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET seq = excluded.seq, seen_at = excluded.seen_at",
+                (reader_id, seq, time.time())
+            )
+    
+    def prune_changes(self, reader_timeout):
+        """Drop readers silent for `reader_timeout` seconds and the rows all others are past
+        
+        Returns the number of feed rows deleted.
+        """
+        conn = self._connection()
+        with self.transaction():
+            conn.execute("DELETE FROM change_readers WHERE seen_at < ?", (time.time() - reader_timeout,))
+            floor = conn.execute("SELECT MIN(seq) FROM change_readers").fetchone()[0]
+            if floor is None or floor <= self._pruned_through():
+                return 0
+            deleted = conn.execute("DELETE FROM changes WHERE seq <= ?", (floor,)).rowcount
+            conn.execute("UPDATE changes_pruned SET seq = ?", (floor,))
+            return deleted
+
+class _ConnectionLease:
+    """Thread-local handle whose collection returns the connection to the pool"""
+    __slots__ = ('conn', '__weakref__')
+    
+    def __init__(self, conn):
+        self.conn = conn
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SEED CATALOG
+# ═══════════════════════════════════════════════════════════════════════════════
+
+SEED_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'seed_catalog.jsonl')
+
+# Seed records get name-based ids so they are identical on every machine and
+# every restart; the file stores them, and records without one get it derived
+SEED_NAMESPACE = UUID('6885ca89-7d8d-5818-ae39-34e0e686a6db')
+SEED_KEYS = {'categories': 'slug', 'products': 'slug', 'users': 'email'}
+
+def seed_id(table, key):
+    return str(uuid5(SEED_NAMESPACE, f'{table}:{key}'))
+
+def read_seed_catalog(path):
+    """Yield (table, record) from a JSON-lines seed file, one line at a time
+    
+    The file is memory-mapped, so a large catalog is paged in by the OS as
+    it is parsed instead of being read into memory up front.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for line in iter(mm.readline, b''):
+                if not line.strip():
+                    continue
+                table, record = json.loads(line)
+                if 'id' not in record:
+                    record['id'] = seed_id(table, record[SEED_KEYS[table]])
+                yield table, record
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SESSIONS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Lifetime of a login session and of the token that refers to it
+SESSION_LIFETIME = 7 * 24 * 3600
+
+# Seconds between a worker's reports of its change feed position (and prunes)
+CHANGE_FEED_REPORT_INTERVAL = 10.0
+
+class SessionIndex:
+    """Live sessions by id and by user, expired through a timing wheel
+    
+    The wheel has one bucket per `resolution` seconds of the longest
+    session lifetime. A session sits in the bucket of its expiry slot, and
+    sweep() walks only the buckets whose slots have elapsed since the last
+    sweep, so expired sessions are dropped without scanning live ones and
+    memory follows the number of live sessions.
+    """
+    
+    def __init__(self, lifetime, resolution=60):
+        self.resolution = resolution
+        self.sessions = {}  # session id -> (user_id, expires_at epoch)
+        self.by_user = {}   # user_id -> {session id}
+        self.wheel = [set() for _ in range(lifetime // resolution + 2)]
+        self._swept_slot = int(time.time()) // resolution
+    
+    def __len__(self):
+        return len(self.sessions)
+    
+    def get(self, session_id):
+        return self.sessions.get(session_id)
+    
+    def add(self, session_id, user_id, expires_at):
+        self.discard(session_id)
+        self.sessions[session_id] = (user_id, expires_at)
+        self.by_user.setdefault(user_id, set()).add(session_id)
+        self.wheel[(expires_at // self.resolution) % len(self.wheel)].add(session_id)
+    
+    def discard(self, session_id):
+        entry = self.sessions.pop(session_id, None)
+        if entry is None:
+            return
+        user_id, expires_at = entry
+        sids = self.by_user[user_id]
+        sids.discard(session_id)
+        if not sids:
+            del self.by_user[user_id]
+        self.wheel[(expires_at // self.resolution) % len(self.wheel)].discard(session_id)
+    
+    def sweep(self, now):
+        """Drop sessions whose slots have elapsed; returns their ids"""
+        slot = int(now) // self.resolution
+        expired = []
+        # A full turn of the wheel visits every bucket once
+        for s in range(max(self._swept_slot, slot - len(self.wheel)), slot):
+            for session_id in list(self.wheel[s % len(self.wheel)]):
+                if self.sessions[session_id][1] <= now:
+                    self.discard(session_id)
+                    expired.append(session_id)
+        self._swept_slot = max(self._swept_slot, slot)
+        return expired
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# DATABASE SIMULATION (In-Memory)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class Database:
+    def __init__(self, store=None, sync_interval=0.2, seed_path=SEED_CATALOG_PATH, lazy=False,
+                 related_interval=1.0, reader_timeout=600, import_batch_size=5000):
+        # Source of truth for every table; the catalog is also held in memory
+        # because all of the read models below are derived from it
+        self.store = store or MemoryStorage()
+        self.sync_interval = sync_interval
+        self._next_sync = 0.0
+        self._own_changes = set()
+        self._synced_seq = self.store.last_change()
+        
+        # Position in a shared store's change feed, reported every
+        # CHANGE_FEED_REPORT_INTERVAL so rows every worker has applied can
+        # be pruned; a worker silent for `reader_timeout` stops counting
+        self.reader_id = uuid4().hex
+        self.reader_timeout = reader_timeout
+        self._next_report = 0.0
+        
+        # Deals ranked by (-discount_percent, id); the version changes whenever
+        # a ranked product or its discount changes
+        self.deals_version = 0
+        
+        # Response cache versions: catalog_version moves with every product or
+        # category write and keys the product routes; category_version only
+        # with what the category routes show (categories and their counts)
+        self.catalog_version = 0
+        self.category_version = 0
+        
+        # Bounded co-purchase counters and the related-product lists they feed
+        self.co_purchases = CoPurchaseIndex()
+        self.related = RelatedProducts(self.co_purchases, related_interval)
+        self._lock = threading.RLock()
+        # Serializes product writers and is taken before _lock; a writer
+        # builds its index changes under it alone and holds _lock only to
+        # swap them in (see import_products())
+        self._catalog_lock = threading.RLock()
+        
+        if isinstance(self.store, MemoryStorage):
+            self.products = self.store.tables['products']
+            self.categories = self.store.tables['categories']
+        else:
+            self.products = {}
+            self.categories = {}
+        self._reset_read_models()
+        
+        # With lazy=True nothing is read until the first load() call, which
+        # keeps imports and worker boot cheap however large the catalog is
+        self.seed_path = seed_path
+        self.import_batch_size = import_batch_size
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        if not lazy:
+            self.load()
+    
+    def _reset_read_models(self):
+        """Start every structure _load() fills from empty; versions only move forward"""
+        self.search_index = SearchIndex()
+        
+        # Sessions referenced by issued tokens; absence means revoked or expired
+        self.sessions = SessionIndex(SESSION_LIFETIME)
+        
+        # (sort key, category_id or None, featured only) -> SortedIndex of active products
+        self.product_indexes = {}
+        self.columns = ProductColumns() if np is not None else None
+        
+        self.deals_index = SortedIndex()
+        self.deal_discounts = {}
+        self.deals_version += 1
+        
+        # Active products per category and the derived /api/categories list
+        self.category_product_counts = {}
+        self._categories_snapshot = None
+        
+        # Category id -> the {id, name, slug} summary embedded in product views
+        self.category_summaries = {}
+        
+        self.related.reset()
+        
+        # Running dashboard aggregates, kept current by the write methods
+        self.counters = {
+            'total_revenue': 0,
+            'total_orders': 0,
+            'total_products': 0,
+            'total_users': 0
         }
+        self.sales_rollup = SalesRollup()
+    
+    def load(self):
+        """Seed an empty store from the seed catalog, or build the read models from a filled one"""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            # Seed an empty store exactly once, even with several workers starting
+            with self.store.transaction():
+                seeded = self.store.count('categories') == 0
+                if seeded:
+                    self._seed()
+            if not seeded:
+                self._load()
+            self._loaded = True
+        if self.store.shared:
+            self.store.report_position(self.reader_id, self._synced_seq)
+    
+    def _seed(self):
+        """Fill an empty store from the seed catalog file
+        
+        Categories and products go through import_categories() and
+        import_products(), `import_batch_size` rows at a time; queued
+        categories are written before the next product, as in
+        import_catalog_lines().
+        """
+        if not self.seed_path:
+            return
+        pending = {'categories': [], 'products': []}
+        write = {'categories': self.import_categories, 'products': self.import_products}
+        
+        def flush(table):
+            if pending[table]:
+                write[table](pending[table])
+                pending[table] = []
+        
+        for table, record in read_seed_catalog(self.seed_path):
+            if table == 'users':
+                self.add_user(record)
+                continue
+            if table == 'products':
+                flush('categories')
+            pending[table].append(record)
+            if len(pending[table]) >= self.import_batch_size:
+                flush(table)
+        flush('categories')
+        flush('products')
         
         print("✅ Database initialized successfully!")
         print(f"   📦 {len(self.categories)} categories")
         print(f"   🛍️ {len(self.products)} products")
-        print(f"   👤 {len(self.users)} users")
+        print(f"   👤 {self.store.count('users')} users")
+    
+    # ─── Storage plumbing ────────────────────────────────────────────────────
+    
+    def _put(self, table, record):
+        """Write through to the store, remembering our own change feed entries"""
+        seq = self.store.put(table, record)
+        if seq:
+            self._own_changes.add(seq)
+    
+    def _delete(self, table, key):
+        seq = self.store.delete(table, key)
+        if seq:
+            self._own_changes.add(seq)
+    
+    def _load(self):
+        """Build the catalog replica and every read model from a non-empty store"""
+        with self._catalog_lock, self._lock:
+            self._synced_seq = self.store.last_change()
+            # With a memory store this swaps the stored records for frozen ones
+            self.categories.update((c['id'], freeze(c)) for c in self.store.scan('categories'))
+            self.products.update((p['id'], freeze(p)) for p in self.store.scan('products'))
+            for category in self.categories.values():
+                self._summarize_category(category)
+            self._categories_changed()
+            # Counted before the products, so their first ranking sees them
+            self.co_purchases.rebuild(self.store.scan('orders'))
+            products = iter(list(self.products.values()))
+            for batch in iter(lambda: list(islice(products, 10000)), []):
+                self._reindex_products([(None, p) for p in batch])
+            self.counters['total_users'] = self.store.count('users', 'role', 'customer')
+            for order in self.store.scan('orders'):
+                self._index_order(order, count_pairs=False)
+            now = time.time()
+            for session in self.store.scan('sessions'):
+                if session['expires_at'] > now:
+                    self.sessions.add(session['id'], session['user_id'], session['expires_at'])
+    
+    def sync(self, force=False):
+        """Apply writes committed by other worker processes to the read models
+        
+        Only shared stores have a change feed. Calls are throttled to one
+        feed read per `sync_interval` seconds unless forced.
+        """
+        if not self.store.shared or (not force and time.monotonic() < self._next_sync):
+            return
+        self._next_sync = time.monotonic() + self.sync_interval
+        with self._catalog_lock, self._lock:
+            try:
+                changes = self.store.changes_since(self._synced_seq)
+            except ChangeFeedTruncated:
+                self._reload()
+                changes = ()
+            for seq, table, key, op in changes:
+                self._synced_seq = seq
+                if seq in self._own_changes:
+                    self._own_changes.discard(seq)
+                    continue
+                self._apply_change(table, key, op)
+        
+        if time.monotonic() >= self._next_report:
+            self._next_report = time.monotonic() + CHANGE_FEED_REPORT_INTERVAL
+            self.store.report_position(self.reader_id, self._synced_seq)
+            self.store.prune_changes(self.reader_timeout)
+    
+    def _reload(self):
+        """Rebuild every read model from the tables after missing pruned changes"""
+        with self._lock:
+            self.products.clear()
+            self.categories.clear()
+            self._own_changes.clear()
+            self._reset_read_models()
+            self._load()
+    
+    def _apply_change(self, table, key, op):
+        record = self.store.get(table, key)
+        if table in ('products', 'categories'):
+            record = freeze(record)
+        if table == 'products':
+            old = self.products.get(key)
+            if record is None:
+                if old is not None:
+                    self._reindex_product(old, {**old, 'is_active': False})
+                    del self.products[key]
+            else:
+                self.products[key] = record
+                self._reindex_product(old, record)
+        elif table == 'categories':
+            if record is None:
+                self.categories.pop(key, None)
+                self.category_summaries.pop(key, None)
+            else:
+                self.categories[key] = record
+                self._summarize_category(record)
+            self._categories_changed()
+        elif table == 'orders' and record is not None:
+            if op == 'insert':
+                self._index_order(record)
+            else:
+                self._reindex_order(record)
+        elif table == 'users' and op == 'insert' and record is not None:
+            if record['role'] == 'customer':
+                self.counters['total_users'] += 1
+        elif table == 'sessions':
+            if record is None:
+                self.sessions.discard(key)
+            else:
+                self.sessions.add(key, record['user_id'], record['expires_at'])
+    
+    # ─── Users ───────────────────────────────────────────────────────────────
+    
+    def add_user(self, user):
+        """Insert a user; raises ValueError if the email is taken"""
+        user = as_record('users', user)
+        with self.store.transaction(), self._lock:
+            self._put('users', user)
+            if user['role'] == 'customer':
+                self.counters['total_users'] += 1
+        return user
+    
+    def update_user(self, user_id, **changes):
+        """Write a new version of a user with the given field changes"""
+        with self.store.transaction(), self._lock:
+            current = self.store.get('users', user_id)
+            if current is None:
+                raise KeyError(user_id)
+            user = as_record('users', {**current, **changes})
+            self._put('users', user)
+        return user
+    
+    def get_user(self, user_id):
+        return self.store.get('users', user_id)
+    
+    def get_user_by_email(self, email):
+        """Find a user by email through the unique email index"""
+        return self.store.find('users', 'email', email)
+    
+    # ─── Categories ──────────────────────────────────────────────────────────
+    
+    def add_category(self, category):
+        """Insert a category; raises ValueError if the slug is taken"""
+        category = freeze(category)
+        with self.store.transaction(), self._lock:
+            self._put('categories', category)
+            self.categories[category['id']] = category
+            self._summarize_category(category)
+            self._categories_changed()
+        return category
+    
+    def import_categories(self, rows):
+        """Upsert a batch of categories; results as for import_products()"""
+        results = []
+        with self.store.transaction(), self._lock:
+            for row in rows:
+                row = freeze(row)
+                current = self.store.get('categories', row['id'])
+                if current is not None and all(freeze(current.get(k)) == v for k, v in row.items()):
+                    results.append('unchanged')
+                    continue
+                category = freeze({**current, **row}) if current is not None else row
+                try:
+                    self._put('categories', category)
+                except ValueError:
+                    results.append(None)
+                    continue
+                self.categories[category['id']] = category
+                self._summarize_category(category)
+                results.append('created' if current is None else 'updated')
+            if 'created' in results or 'updated' in results:
+                self._categories_changed()
+        return results
+    
+    def _summarize_category(self, category):
+        self.category_summaries[category['id']] = FrozenRecord(
+            id=category['id'], name=category['name'], slug=category['slug']
+        )
+    
+    def _categories_changed(self):
+        """Invalidate everything showing categories, product views included (they embed summaries)"""
+        self.catalog_version += 1
+        self.category_version += 1
+        self._categories_snapshot = None
+    
+    def active_categories(self):
+        """Active categories in display order, each with its product_count"""
+        snapshot = self._categories_snapshot
+        if snapshot is None:
+            with self._lock:
+                snapshot = sorted(
+                    (FrozenRecord(c, product_count=self.category_product_counts.get(c['id'], 0))
+                     for c in self.categories.values() if c['is_active']),
+                    key=lambda c: c['sort_order']
+                )
+                self._categories_snapshot = snapshot
+        return snapshot
+    
+    def get_category(self, slug_or_id):
+        """Find a category by id, or by slug through the unique slug index"""
+        category = self.categories.get(slug_or_id)
+        if category:
+            return category
+        found = self.store.find('categories', 'slug', slug_or_id)
+        return self.categories.get(found['id'], found) if found else None
+    
+    # ─── Products ────────────────────────────────────────────────────────────
+    
+    def add_product(self, product):
+        """Insert a product; raises ValueError if the slug is taken"""
+        product = freeze(product)
+        with self.store.transaction(), self._catalog_lock, self._lock:
+            self._put('products', product)
+            self.products[product['id']] = product
+            self._reindex_product(None, product)
+        return product
+    
+    def update_product(self, product_id, **changes):
+        """Write a new version of a product with the given field changes"""
+        with self.store.transaction(), self._catalog_lock, self._lock:
+            current = self.store.get('products', product_id)
+            if current is None:
+                raise KeyError(product_id)
+            old = self.products.get(product_id)
+            product = freeze({**current, **changes})
+            self._put('products', product)
+            self.products[product_id] = product
+            self._reindex_product(old, product)
+        return product
+    
+    def adjust_stock(self, product_id, delta):
+        """Move stock by delta and sold_count the opposite way, atomically
+        
+        Raises ValueError rather than take stock below zero: an import
+        writes stock without the Inventory stripe locks, so it may have
+        lowered it since the caller checked.
+        """
+        with self.store.transaction(), self._catalog_lock:
+            current = self.store.get('products', product_id)
+            if current['stock'] + delta < 0:
+                raise ValueError(f"insufficient stock for {product_id}")
+            return self.update_product(
+                product_id,
+                stock=current['stock'] + delta,
+                sold_count=current['sold_count'] - delta
+            )
+    
+    def import_products(self, rows):
+        """Upsert a batch of products (each at most once), reindexing once for the batch
+        
+        Each row is merged onto the stored product with its id. Returns one
+        result per row: 'created', 'updated', 'unchanged' when the row
+        matches what is stored (nothing is written), or None when the row's
+        slug belongs to another product and nothing was written.
+        
+        Rows are written and their index changes built under the catalog
+        lock alone; _lock is held only to swap them in, so listings and
+        searches keep being served during a batch. Until the swap, readers of a memory
+        store may see a new version of a product at its old position.
+        """
+        results, changes = [], []
+        with self.store.transaction(), self._catalog_lock:
+            for row in rows:
+                row = freeze(row)
+                current = self.store.get('products', row['id'])
+                if current is not None and all(freeze(current.get(k)) == v for k, v in row.items()):
+                    results.append('unchanged')
+                    continue
+                old = self.products.get(row['id'])
+                product = freeze({**current, **row}) if current is not None else row
+                try:
+                    self._put('products', product)
+                except ValueError:
+                    results.append(None)
+                    continue
+                changes.append((old, product))
+                results.append('created' if current is None else 'updated')
+            if changes:
+                plan = self._plan_reindex(changes)
+                with self._lock:
+                    self.products.update((product['id'], product) for _, product in changes)
+                    self._apply_reindex(plan)
+                self.related.update_products(plan['related'])
+        return results
+    
+    def get_product(self, slug_or_id):
+        """Find a product by id, or by slug through the unique slug index"""
+        product = self.products.get(slug_or_id)
+        if product:
+            return product
+        found = self.store.find('products', 'slug', slug_or_id)
+        return self.products.get(found['id'], found) if found else None
+    
+    def _reindex_product(self, old, new):
+        """Bring derived product structures in line with a write (old is None on insert)"""
+        self._reindex_products([(old, new)])
+    
+    def _reindex_products(self, changes):
+        """_reindex_product() for a batch of (old, new) writes, each product at most once"""
+        plan = self._plan_reindex(changes)
+        self._apply_reindex(plan)
+        self.related.update_products(plan['related'])
+    
+    def _plan_reindex(self, changes):
+        """Work out what a batch of (old, new) writes changes in the read models
+        
+        Only reads them, so it runs under the catalog lock alone: the
+        sorted index and deals changes are spliced into new lists and the
+        search documents analyzed here, leaving _apply_reindex() the
+        counters, columns and postings, each cheap per product.
+        """
+        plan = {
+            'columns': [], 'discounts': [], 'deals_touched': 0, 'active_delta': 0,
+            'category_counts': [], 'search_removed': [], 'search_docs': [],
+            'indexes': [], 'deals': None, 'related': []
+        }
+        index_changes = {}      # product index key -> ([removed], [added])
+        deals_removed, deals_added = [], []
+        search_fields = [f for f, _ in PRODUCT_SEARCH_FIELDS]
+        
+        for old, new in changes:
+            def changed(*fields):
+                return old is None or any(old.get(f) != new.get(f) for f in fields)
+            
+            if self.columns is not None and changed(*ProductColumns.DTYPES, 'category_id'):
+                plan['columns'].append(new)
+            
+            was_deal = new['id'] in self.deal_discounts
+            is_deal = was_deal
+            if changed('is_active', 'price', 'original_price'):
+                old_discount = self.deal_discounts.get(new['id'])
+                if old_discount is not None:
+                    deals_removed.append((-old_discount, new['id']))
+                discount = discount_percent(new)
+                if discount is not None:
+                    deals_added.append((-discount, new['id']))
+                plan['discounts'].append((new['id'], discount))
+                is_deal = discount is not None
+            if was_deal or is_deal:
+                plan['deals_touched'] += 1
+            
+            was_active = old is not None and old['is_active']
+            plan['active_delta'] += int(new['is_active']) - int(was_active)
+            
+            if changed('is_active', 'category_id'):
+                if was_active:
+                    plan['category_counts'].append((old['category_id'], -1))
+                if new['is_active']:
+                    plan['category_counts'].append((new['category_id'], 1))
+            
+            if changed('is_active', 'category_id', 'brand', 'tags', 'price'):
+                plan['related'].append(new)
+            
+            if changed('is_active', *search_fields):
+                if new['is_active']:
+                    plan['search_docs'].append((new['id'], SearchIndex.analyze([
+                        (' '.join(new.get(f) or []) if f == 'tags' else new.get(f) or '', weight)
+                        for f, weight in PRODUCT_SEARCH_FIELDS
+                    ])))
+                else:
+                    plan['search_removed'].append(new['id'])
+            
+            for key in PRODUCT_SORT_KEYS:
+                if changed('is_active', 'category_id', 'is_featured', key):
+                    if was_active:
+                        for partition in self._product_partitions(old):
+                            index_changes.setdefault((key,) + partition, ([], []))[0].append((old[key], old['id']))
+                    if new['is_active']:
+                        for partition in self._product_partitions(new):
+                            index_changes.setdefault((key,) + partition, ([], []))[1].append((new[key], new['id']))
+        
+        empty = SortedIndex()
+        for index_key, (removed, added) in index_changes.items():
+            merged = self.product_indexes.get(index_key, empty).merged(removed, added)
+            plan['indexes'].append((index_key, removed, added, merged))
+        if deals_removed or deals_added:
+            plan['deals'] = (deals_removed, deals_added, self.deals_index.merged(deals_removed, deals_added))
+        return plan
+    
+    def _apply_reindex(self, plan):
+        """Swap a _plan_reindex() result into the read models (caller holds _lock)
+        
+        The postings, counters and columns change in place here, so every
+        read of them (query_products(), search_products(), top_deals(),
+        active_categories()) holds _lock too and sees a batch whole or not
+        at all.
+        """
+        self.catalog_version += 1
+        for product in plan['columns']:
+            self.columns.upsert(product)
+        for product_id, discount in plan['discounts']:
+            if discount is None:
+                self.deal_discounts.pop(product_id, None)
+            else:
+                self.deal_discounts[product_id] = discount
+        self.deals_version += plan['deals_touched']
+        self.counters['total_products'] += plan['active_delta']
+        
+        if plan['category_counts']:
+            counts = self.category_product_counts
+            for category_id, delta in plan['category_counts']:
+                counts[category_id] = counts.get(category_id, 0) + delta
+            self.category_version += 1
+            self._categories_snapshot = None
+        
+        for product_id in plan['search_removed']:
+            self.search_index.remove(product_id)
+        if plan['search_docs']:
+            self.search_index.add_analyzed(plan['search_docs'])
+        
+        for index_key, removed, added, merged in plan['indexes']:
+            index = self.product_indexes.get(index_key)
+            if index is None:
+                index = self.product_indexes[index_key] = SortedIndex()
+            index.update(removed, added, merged)
+        if plan['deals'] is not None:
+            self.deals_index.update(*plan['deals'])
+    
+    @staticmethod
+    def _product_partitions(product):
+        """Sorted index partitions a product belongs to"""
+        partitions = [(None, False), (product['category_id'], False)]
+        if product['is_featured']:
+            partitions += [(None, True), (product['category_id'], True)]
+        return partitions
+    
+    def query_products(self, sort_key, reverse=False, category_id=None, min_price=None,
+                       max_price=None, featured_only=False, offset=0, limit=12, after=None):
+        """Return (page, total, has_more) of active products by walking a sorted index
+        
+        `after` is the (sort value, id) of the last product already returned;
+        when given, the walk resumes right behind it instead of skipping `offset`.
+        """
+        partition = (category_id, featured_only)
+        empty = SortedIndex()
+        with self._lock:
+            price_index = self.product_indexes.get(('price',) + partition, empty)
+            start, stop = price_index.range(min_price, max_price)
+            total = stop - start
+            
+            in_price_range = None
+            if sort_key == 'price':
+                index = price_index
+            else:
+                index = self.product_indexes.get((sort_key,) + partition, empty)
+                start, stop = 0, len(index)
+                if min_price is not None or max_price is not None:
+                    # Price is not the sort key, so filter while walking
+                    def in_price_range(pid):
+                        price = self.products[pid]['price']
+                        return ((min_price is None or price >= min_price) and
+                                (max_price is None or price <= max_price))
+            
+            if after is not None:
+                start, stop = index.seek(start, stop, after, reverse)
+                offset = 0
+            
+            if in_price_range is not None and self.columns is not None and sort_key in ProductColumns.SORTABLE:
+                # Vectorized filter and partial sort instead of an interpreted walk
+                mask = self.columns.mask(category_id, min_price, max_price, featured_only)
+                ids = self.columns.top(mask, sort_key, offset + limit + 1, reverse, after)[offset:]
+            elif in_price_range is None:
+                ids = index.page(start, stop, offset, limit + 1, reverse)
+            else:
+                ids = list(islice(
+                    filter(in_price_range, index.iter_ids(start, stop, reverse)),
+                    offset, offset + limit + 1
+                ))
+            return [self.products[pid] for pid in ids[:limit]], total, len(ids) > limit
+    
+    def search_products(self, query):
+        """Return the products matching a search query, best match first
+        
+        Ranking and lookup hold the lock like query_products(), so a search
+        never walks postings a writer is changing; an id whose product is
+        gone by the lookup is skipped.
+        """
+        with self._lock:
+            products = (self.products.get(pid) for pid, _ in self.search_index.search(query))
+            return [p for p in products if p is not None]
+    
+    def top_deals(self, limit):
+        """Return [(product, discount_percent)] for the best discounts"""
+        with self._lock:
+            ids = self.deals_index.page(0, len(self.deals_index), 0, limit)
+            return [(self.products[pid], self.deal_discounts[pid]) for pid in ids]
+    
+    # ─── Orders ──────────────────────────────────────────────────────────────
+    
+    def add_order(self, order):
+        """Insert an order and fold it into the dashboard counters and rollups"""
+        order = as_record('orders', order)
+        with self.store.transaction(), self._lock:
+            self._put('orders', order)
+            self._index_order(order)
+        return order
+    
+    def get_order(self, order_id):
+        return self.store.get('orders', order_id)
+    
+    def update_order(self, order_id, **changes):
+        """Write a new version of an order with the given field changes"""
+        with self.store.transaction(), self._lock:
+            current = self.store.get('orders', order_id)
+            if current is None:
+                raise KeyError(order_id)
+            order = as_record('orders', {**current, **changes})
+            self._put('orders', order)
+            self._reindex_order(order)
+        return order
+    
+    def _index_order(self, order, count_pairs=True):
+        if self.sales_rollup.status_of(order) is not None:
+            return
+        self.counters['total_orders'] += 1
+        if order['status'] != 'cancelled':
+            self.counters['total_revenue'] += order['total']
+        self.sales_rollup.add_order(order, self.products)
+        if count_pairs:
+            self.co_purchases.add_order(order)
+            self.related.add_order(order)
+    
+    def _reindex_order(self, order):
+        """Move an order's revenue to the slices of its current status"""
+        old_status = self.sales_rollup.status_of(order)
+        was_counted = old_status != 'cancelled'
+        is_counted = order['status'] != 'cancelled'
+        if was_counted != is_counted:
+            self.counters['total_revenue'] += order['total'] if is_counted else -order['total']
+        self.sales_rollup.set_status(order, order['status'])
+    
+    def rebuild_co_purchases(self):
+        """Recount every stored order's co-purchases in one batch pass"""
+        with self._lock:
+            self.co_purchases.rebuild(self.store.scan('orders'))
+        self.related.invalidate()
+    
+    def query_orders(self, user_id=None, limit=20, after=None):
+        """Return (page, total, has_more) of orders, newest first
+        
+        `user_id` restricts the walk to one customer; `after` is the
+        (created_at, id) of the last order already returned.
+        """
+        with self._lock:
+            orders = self.store.recent_orders(user_id, after, limit + 1)
+            if user_id is None:
+                total = self.counters['total_orders']
+            else:
+                total = self.store.count('orders', 'user_id', user_id)
+            return orders[:limit], total, len(orders) > limit
+    
+    def query_sales(self, granularity, start, end, **filters):
+        """Read a bucketed sales series from the rollups"""
+        with self._lock:
+            return self.sales_rollup.series(granularity, start, end, **filters)
+    
+    # ─── Sessions ────────────────────────────────────────────────────────────
+    
+    def create_session(self, user_id, lifetime=SESSION_LIFETIME):
+        """Open a session for a newly issued token, sweeping expired ones first"""
+        now = int(time.time())
+        session = {
+            'id': uuid4().hex,
+            'user_id': user_id,
+            'created_at': datetime.now().isoformat(),
+            'expires_at': now + lifetime
+        }
+        with self.store.transaction(), self._lock:
+            for session_id in self.sessions.sweep(now):
+                self._delete('sessions', session_id)
+            self._put('sessions', session)
+            self.sessions.add(session['id'], user_id, session['expires_at'])
+        return session
+    
+    def session_active(self, session_id, user_id):
+        """O(1) check that a token's session is neither revoked nor expired
+        
+        With a shared store a session opened by another worker may not have
+        reached this one's index through sync() yet, so a miss is looked up
+        in the store and remembered.
+        """
+        entry = self.sessions.get(session_id)
+        if entry is None and self.store.shared and session_id:
+            session = self.store.get('sessions', session_id)
+            if session is not None and session['expires_at'] > time.time():
+                with self._lock:
+                    self.sessions.add(session['id'], session['user_id'], session['expires_at'])
+                entry = (session['user_id'], session['expires_at'])
+        return entry is not None and entry[0] == user_id and entry[1] > time.time()
+    
+    def revoke_session(self, session_id):
+        with self.store.transaction(), self._lock:
+            # A shared store may hold a session this worker has not synced yet
+            if self.sessions.get(session_id) is not None or (
+                self.store.shared and self.store.get('sessions', session_id) is not None
+            ):
+                self.sessions.discard(session_id)
+                self._delete('sessions', session_id)
+    
+    def revoke_user_sessions(self, user_id):
+        """Revoke every session of a user; returns how many were open"""
+        with self.store.transaction(), self._lock:
+            session_ids = set(self.sessions.by_user.get(user_id, ()))
+            if self.store.shared:
+                session_ids.update(self.store.ids_by('sessions', 'user_id', user_id))
+            for session_id in session_ids:
+                self.sessions.discard(session_id)
+                self._delete('sessions', session_id)
+        return len(session_ids)
+    
+    # ─── Carts ───────────────────────────────────────────────────────────────
+    
+    def get_cart_for_user(self, user_id, create=False):
+        """Find a user's cart through the unique owner index, optionally creating it"""
+        cart = self.store.find('carts', 'user_id', user_id)
+        if cart is None and create:
+            cart = as_record('carts', {
+                'id': str(uuid4()),
+                'user_id': user_id,
+                'items': [],
+                'created_at': datetime.now().isoformat()
+            })
+            try:
+                with self.store.transaction(), self._lock:
+                    self._put('carts', cart)
+            except ValueError:
+                # A concurrent request created it first
+                cart = self.store.find('carts', 'user_id', user_id)
+        return cart
+    
+    def save_cart(self, cart):
+        """Write a new version of a cart"""
+        cart = as_record('carts', cart)
+        with self.store.transaction(), self._lock:
+            self._put('carts', cart)
+        return cart
+
+# Initialize database
+if app.config['DATABASE_PATH']:
+    store = SQLiteStorage(app.config['DATABASE_PATH'])
+elif app.config['JOURNAL_DIR']:
+    store = JournaledStorage(app.config['JOURNAL_DIR'])
+else:
+    store = MemoryStorage()
+db = Database(store, seed_path=app.config['SEED_CATALOG'] or SEED_CATALOG_PATH, lazy=True,
+              related_interval=app.config['RELATED_REFRESH_INTERVAL'],
+              reader_timeout=app.config['CHANGE_FEED_READER_TIMEOUT'],
+              import_batch_size=app.config['IMPORT_BATCH_SIZE'])
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# INVENTORY RESERVATION
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class Inventory:
+    """All-or-nothing stock reservation guarded by striped per-product locks
+    
+    A checkout locks the stripes of all its products in ascending stripe
+    order, so two checkouts can never deadlock, and checkouts over disjoint
+    stripes run in parallel. Every line is verified before any stock moves.
+    """
+    
+    def __init__(self, db, stripes=64):
+        self.db = db
+        self._locks = [threading.Lock() for _ in range(stripes)]
+    
+    def _locks_for(self, product_ids):
+        n = len(self._locks)
+        return [self._locks[i] for i in sorted({hash(pid) % n for pid in product_ids})]
+    
+    def reserve(self, quantities):
+        """Take stock for every {product_id: quantity} line, or for none of them
+        
+        Returns (products, None) on success, or (None, (product_id, reason))
+        where reason is 'unavailable' or 'insufficient'.
+        """
+        locks = self._locks_for(quantities)
+        for lock in locks:
+            lock.acquire()
+        try:
+            # The store transaction makes the check and the writes atomic for
+            # other worker processes too, which the stripe locks cannot see
+            with self.db.store.transaction():
+                for product_id, quantity in quantities.items():
+                    product = self.db.store.get('products', product_id)
+                    if not product or not product['is_active']:
+                        return None, (product_id, 'unavailable')
+                    if product['stock'] < quantity:
+                        return None, (product_id, 'insufficient')
+                
+                products = {}
+                try:
+                    for product_id, quantity in quantities.items():
+                        products[product_id] = self._adjust(product_id, -quantity)
+                except Exception as e:
+                    for taken in products:
+                        self._adjust(taken, quantities[taken])
+                    if isinstance(e, ValueError):
+                        # A catalog import lowered the stock after the check
+                        return None, (product_id, 'insufficient')
+                    raise
+                return products, None
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+    
+    def release(self, quantities):
+        """Give back stock taken by a reservation that was not turned into an order"""
+        locks = self._locks_for(quantities)
+        for lock in locks:
+            lock.acquire()
+        try:
+            with self.db.store.transaction():
+                for product_id, quantity in quantities.items():
+                    self._adjust(product_id, quantity)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+    
+    def _adjust(self, product_id, delta):
+        return self.db.adjust_stock(product_id, delta)
+
+inventory = Inventory(db)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# PASSWORD HASHING
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class PasswordHasherBusy(Exception):
+    """Every key derivation slot stayed taken for the whole wait"""
+
+class PasswordHasher:
+    """Salted, versioned password hashes derived off the request threads
+    
+    Stored forms are `scrypt$n$r$p$salt$digest` and
+    `pbkdf2_sha256$iterations$salt$digest` (base64 salt and digest), so
+    the cost travels with each hash and can be raised later. A bare
+    64-character hex string is a legacy unsalted SHA-256 hash;
+    needs_rehash() reports those and hashes made with an older cost.
+    
+    Derivations run in a pool of `workers` processes, leaving the
+    request threads and the GIL to catalog traffic. The pool starts its
+    workers through a fork server (spawn where there is none) rather than
+    forking this process, whose background threads may hold locks. At most
+    `max_pending` derivations may be queued or running; a caller that
+    cannot get a slot within `wait` seconds gets PasswordHasherBusy.
+    """
+    
+    def __init__(self, scheme='scrypt', scrypt_n=2 ** 14, scrypt_r=8, scrypt_p=1,
+                 pbkdf2_iterations=600000, workers=2, max_pending=32, wait=2.0):
+        if scheme not in ('scrypt', 'pbkdf2_sha256'):
+            raise ValueError(f"unknown password scheme: {scheme}")
+        self.scheme = scheme
+        self.scrypt_params = (scrypt_n, scrypt_r, scrypt_p)
+        self.pbkdf2_iterations = pbkdf2_iterations
+        self.workers = workers
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pool = None
+        self._pool_pid = None
+        self._pool_lock = threading.Lock()
+        # Verified in place of a missing user's hash, so an unknown email
+        # costs the same derivation as a known one; its empty digest
+        # matches no password
+        self.dummy_hash = self._prefix() + base64.b64encode(bytes(16)).decode() + '$'
+    
+    def _executor(self):
+        # A pool inherited through fork() has no live workers in the child
+        with self._pool_lock:
+            if self._pool is None or self._pool_pid != os.getpid():
+                method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context(method))
+                self._pool_pid = os.getpid()
+            return self._pool
+    
+    def _derive(self, scheme, password, salt, params):
+        if scheme == 'scrypt':
+            n, r, p = params
+            fn, args = hashlib.scrypt, (password,)
+            kwargs = {'salt': salt, 'n': n, 'r': r, 'p': p, 'maxmem': 256 * n * r, 'dklen': 32}
+        else:
+            fn, args, kwargs = hashlib.pbkdf2_hmac, ('sha256', password, salt, params[0]), {}
+        
+        if not self.workers:
+            return fn(*args, **kwargs)
+        if not self._slots.acquire(timeout=self.wait):
+            raise PasswordHasherBusy()
+        try:
+            return self._executor().submit(fn, *args, **kwargs).result()
+        finally:
+            self._slots.release()
+    
+    def _prefix(self):
+        if self.scheme == 'scrypt':
+            return 'scrypt$%d$%d$%d$' % self.scrypt_params
+        return f'pbkdf2_sha256${self.pbkdf2_iterations}$'
+    
+    def hash(self, password):
+        salt = os.urandom(16)
+        params = self.scrypt_params if self.scheme == 'scrypt' else (self.pbkdf2_iterations,)
+        digest = self._derive(self.scheme, password.encode(), salt, params)
+        return (self._prefix() + base64.b64encode(salt).decode() + '$' +
+                base64.b64encode(digest).decode())
+    
+    def verify(self, password, stored):
+        parts = stored.split('$')
+        if len(parts) == 1:
+            legacy = hashlib.sha256(password.encode()).hexdigest()
+            return hmac.compare_digest(legacy, stored)
+        
+        if (parts[0], len(parts)) not in (('scrypt', 6), ('pbkdf2_sha256', 4)):
+            return False
+        scheme, *params, salt, digest = parts
+        try:
+            params = tuple(int(p) for p in params)
+            salt, digest = base64.b64decode(salt), base64.b64decode(digest)
+        except ValueError:
+            return False
+        return hmac.compare_digest(self._derive(scheme, password.encode(), salt, params), digest)
+    
+    def needs_rehash(self, stored):
+        return not stored.startswith(self._prefix())
+
+passwords = PasswordHasher(
+    app.config['PASSWORD_SCHEME'],
+    scrypt_n=app.config['SCRYPT_N'],
+    pbkdf2_iterations=app.config['PBKDF2_ITERATIONS'],
+    workers=app.config['PASSWORD_WORKERS']
+)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# JWT AUTHENTICATION
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class TokenCache:
+    """Bounded LRU of verified tokens -> decoded payload
+    
+    An entry is trusted for at most `ttl` seconds and never past the
+    token's own expiry, so caching cannot extend a token's life. Only
+    tokens that passed verification are stored.
+    """
     
-    def _hash_password(self, password):
-        """Hash password using SHA256"""
-        return hashlib.sha256(password.encode()).hexdigest()
+    def __init__(self, max_entries=10000, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # token -> (payload, trusted until)
+        self._lock = threading.Lock()
     
-    def verify_password(self, password, hashed):
-        """Verify password"""
-        return self._hash_password(password) == hashed
+    def get(self, token, now):
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            if entry[1] <= now:
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return entry[0]
+    
+    def put(self, token, payload, expires, now):
+        with self._lock:
+            self._entries[token] = (payload, min(expires, now + self.ttl))
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def discard_user(self, user_id):
+        """Forget every cached token of a user, e.g. once their sessions are revoked"""
+        with self._lock:
+            for token in [t for t, (p, _) in self._entries.items() if p['user_id'] == user_id]:
+                del self._entries[token]
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
 
-# Initialize database
-db = Database()
+token_cache = TokenCache()
 
-# ═══════════════════════════════════════════════════════════════════════════════
-# JWT AUTHENTICATION
-# ═══════════════════════════════════════════════════════════════════════════════
+# (secret, HMAC-SHA256 with that key already absorbed); rebuilt if the secret changes
+_token_mac = (None, None)
+
+def _token_hmac():
+    global _token_mac
+    secret, mac = _token_mac
+    if secret != app.config['SECRET_KEY']:
+        secret = app.config['SECRET_KEY']
+        mac = hmac.new(secret.encode(), digestmod=hashlib.sha256)
+        _token_mac = (secret, mac)
+        token_cache.clear()
+    return mac
+
+def _token_signature(encoded):
+    mac = _token_hmac().copy()
+    mac.update(encoded.encode())
+    return mac.hexdigest()
 
 def generate_token(user_id):
-    """Generate JWT-like token"""
+    """Generate JWT-like token bound to a new revocable session"""
+    session = db.create_session(user_id)
     payload = {
         'user_id': user_id,
-        'exp': (datetime.now() + timedelta(days=7)).isoformat()
+        'sid': session['id'],
+        'exp': session['expires_at']
     }
-    payload_json = json.dumps(payload)
-    encoded = base64.b64encode(payload_json.encode()).decode()
-    signature = hmac.new(
-        app.config['SECRET_KEY'].encode(),
-        encoded.encode(),
-        hashlib.sha256
-    ).hexdigest()
-    return f"{encoded}.{signature}"
+    payload_json = json.dumps(payload, separators=(',', ':'))
+    encoded = base64.urlsafe_b64encode(payload_json.encode()).rstrip(b'=').decode()
+    return f"{encoded}.{_token_signature(encoded)}"
 
 def verify_token(token):
-    """Verify JWT-like token"""
+    """Verify JWT-like token; recently verified tokens are answered from token_cache"""
+    _token_hmac()  # drops cached tokens if the secret was rotated
+    now = time.time()
+    payload = token_cache.get(token, now)
+    if payload is not None:
+        return payload
+    
     try:
-        parts = token.split('.')
-        if len(parts) != 2:
-            return None
-        
-        encoded, signature = parts
-        expected_sig = hmac.new(
-            app.config['SECRET_KEY'].encode(),
-            encoded.encode(),
-            hashlib.sha256
-        ).hexdigest()
-        
-        if not hmac.compare_digest(signature, expected_sig):
+        encoded, signature = token.split('.')
+        if not hmac.compare_digest(signature, _token_signature(encoded)):
             return None
         
-        payload_json = base64.b64decode(encoded).decode()
-        payload = json.loads(payload_json)
-        
-        if datetime.fromisoformat(payload['exp']) < datetime.now():
+        data = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+        # json.loads() sniffs the encoding of bytes; orjson or a str skips that
+        payload = orjson.loads(data) if orjson is not None else json.loads(data.decode())
+        expires = payload['exp']
+        if expires < now:
             return None
-        
-        return payload
-    except:
+    except (ValueError, TypeError, KeyError):
         return None
+    
+    token_cache.put(token, payload, expires, now)
+    return payload
 
 def auth_required(f):
     """Authentication decorator"""
@@ -570,7 +3014,7 @@ def auth_required(f):
         auth_header = request.headers.get('Authorization', '')
         
         if not auth_header.startswith('Bearer '):
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': 'غير مصرح. يرجى تسجيل الدخول.',
                 'code': 'NO_TOKEN'
@@ -579,16 +3023,16 @@ def auth_required(f):
         token = auth_header.split(' ')[1]
         payload = verify_token(token)
         
-        if not payload:
-            return jsonify({
+        if not payload or not db.session_active(payload.get('sid'), payload['user_id']):
+            return json_response({
                 'success': False,
                 'message': 'جلسة منتهية. يرجى إعادة تسجيل الدخول.',
                 'code': 'INVALID_TOKEN'
             }), 401
         
-        user = db.users.get(payload['user_id'])
+        user = db.get_user(payload['user_id'])
         if not user or not user['is_active']:
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': 'المستخدم غير موجود أو معطل',
                 'code': 'USER_NOT_FOUND'
@@ -596,6 +3040,7 @@ def auth_required(f):
         
         request.user = user
         request.user_id = user['id']
+        request.session_id = payload['sid']
         return f(*args, **kwargs)
     
     return decorated
@@ -606,7 +3051,7 @@ def admin_required(f):
     @auth_required
     def decorated(*args, **kwargs):
         if request.user['role'] != 'admin':
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': 'صلاحيات المدير مطلوبة',
                 'code': 'ADMIN_REQUIRED'
@@ -630,13 +3075,570 @@ def handle_options():
     if request.method == 'OPTIONS':
         return '', 200
 
+@app.before_request
+def sync_read_models():
+    # Build the catalog on the first request unless preload() already
+    # did, then pick up writes made by other worker processes
+    db.load()
+    db.sync()
+
+def preload(heartbeat=None, interval=1.0):
+    """Build the catalog before a worker serves, rather than in its first request
+    
+    Called from a worker start hook (see gunicorn.conf.py). The load runs
+    in a thread while this one calls `heartbeat` every `interval` seconds,
+    so a supervisor that kills silent workers leaves a long load alone.
+    """
+    failure = []
+    
+    def load():
+        try:
+            db.load()
+        except BaseException as e:
+            failure.append(e)
+    
+    loader = threading.Thread(target=load, name='catalog-preload')
+    loader.start()
+    while loader.is_alive():
+        if heartbeat is not None:
+            heartbeat()
+        loader.join(interval)
+    if failure:
+        raise failure[0]
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# JSON RESPONSES
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class RawJSON:
+    """Already-encoded JSON that encode_json() splices in verbatim"""
+    __slots__ = ('data',)
+    
+    def __init__(self, data):
+        self.data = data
+
+def encode_json(obj):
+    """Compact UTF-8 JSON bytes, via orjson when it is installed
+    
+    RawJSON values are first encoded as nonce-tagged placeholder strings
+    by the encoder's `default` hook, then swapped for their bytes in one
+    split-and-join over the output.
+    """
+    fragments = []
+    nonce = os.urandom(6).hex()
+    
+    def default(value):
+        if isinstance(value, RawJSON):
+            fragments.append(value.data)
+            return f'\x00{nonce}:{len(fragments) - 1}'
+        return record_json(value)
+    
+    if orjson is not None:
+        body = orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+    else:
+        body = json.dumps(obj, default=default, ensure_ascii=False, separators=(',', ':')).encode()
+    if fragments:
+        # Placeholders appear in the order the encoder met them
+        pieces = body.split(b'"\\u0000' + nonce.encode() + b':')
+        out = [pieces[0]]
+        for fragment, piece in zip(fragments, pieces[1:]):
+            out.append(fragment)
+            out.append(piece[piece.index(b'"') + 1:])
+        body = b''.join(out)
+    return body
+
+def json_response(payload):
+    """jsonify() replacement built on encode_json()"""
+    return app.response_class(encode_json(payload), mimetype='application/json')
+
+class FragmentCache:
+    """Pre-encoded JSON of catalog and order records, shared across responses
+    
+    Those records are replaced rather than mutated, so a given record
+    object always encodes the same way. Entries are keyed by a view name
+    and the identities of the records they were built from, and hold on
+    to those records: while an entry lives, no other object can reuse
+    those id()s. Bounded by the encoded size, least recently used first.
+    """
+    
+    def __init__(self, max_bytes, enabled=True):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.enabled = enabled
+        self._entries = OrderedDict()  # (view, *ids) -> (sources, RawJSON)
+        self._lock = threading.Lock()
+    
+    def fragment(self, view, *sources, build=None):
+        """RawJSON of build(*sources), or of the single source as it is"""
+        if not self.enabled:
+            return build(*sources) if build else sources[0]
+        key = (view, *map(id, sources))
+        # Hits skip the lock: single OrderedDict calls are atomic under the GIL
+        entry = self._entries.get(key)
+        if entry is not None:
+            try:
+                self._entries.move_to_end(key)
+            except KeyError:
+                pass  # evicted meanwhile
+            return entry[1]
+        
+        raw = RawJSON(encode_json(build(*sources) if build else sources[0]))
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (sources, raw)
+                self.size += len(raw.data)
+            while self.size > self.max_bytes:
+                self.size -= len(self._entries.popitem(last=False)[1][1].data)
+        return raw
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+fragments = FragmentCache(app.config['FRAGMENT_CACHE_MAX_BYTES'])
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# PRODUCT VIEWS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Named projections for ?view=; `fields=` picks from the detail view unless
+# a view is given too. Without either, routes keep their full documents.
+PRODUCT_VIEWS = {
+    'card': (
+        'id', 'name', 'name_en', 'slug', 'short_description', 'price', 'original_price',
+        'currency', 'category', 'thumbnail', 'stock', 'rating', 'review_count', 'is_featured'
+    ),
+    'detail': (
+        'id', 'name', 'name_en', 'slug', 'description', 'short_description', 'price',
+        'original_price', 'currency', 'category', 'images', 'thumbnail', 'stock', 'brand',
+        'tags', 'specifications', 'rating', 'review_count', 'is_featured', 'created_at'
+    ),
+    # Inventory and bookkeeping fields; admins only
+    'admin': (
+        'id', 'name', 'name_en', 'slug', 'description', 'short_description', 'price',
+        'original_price', 'currency', 'category_id', 'category', 'images', 'thumbnail',
+        'stock', 'sku', 'brand', 'tags', 'specifications', 'rating', 'review_count',
+        'sold_count', 'is_featured', 'is_active', 'created_at'
+    )
+}
+
+def product_fields_arg():
+    """Fields requested through ?view= and ?fields=, None for the full document
+    
+    Returns (fields, error response). The id is always included.
+    """
+    view = request.args.get('view')
+    fields = request.args.get('fields')
+    if view is None and fields is None:
+        return None, None
+    
+    if view is not None and view not in PRODUCT_VIEWS:
+        return None, (json_response({
+            'success': False,
+            'message': f'طريقة العرض غير معروفة: {view}'
+        }), 400)
+    allowed = PRODUCT_VIEWS[view or 'detail']
+    if fields is None:
+        return allowed, None
+    
+    requested = tuple(dict.fromkeys(['id'] + [f.strip() for f in fields.split(',') if f.strip()]))
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        return None, (json_response({
+            'success': False,
+            'message': f'حقول غير معروفة: {", ".join(unknown)}'
+        }), 400)
+    return requested, None
+
+def product_view(f):
+    """Resolve ?view=/?fields= into request.product_fields before the route runs
+    
+    Goes above @cached_response so the admin view is authorized before a
+    cached admin body could be served.
+    """
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        fields, error = product_fields_arg()
+        if error:
+            return error
+        request.product_fields = fields
+        if request.args.get('view') == 'admin':
+            return admin_required(f)(*args, **kwargs)
+        return f(*args, **kwargs)
+    return decorated
+
+def project_product(product, category, fields=None):
+    """Product document cut down to `fields`, with the shared category summary
+    
+    Only the top-level dict is new; every value is the stored record's own.
+    """
+    if fields is None:
+        return {**product, 'category': category}
+    return {
+        field: category if field == 'category' else product[field]
+        for field in fields if field in product or field == 'category'
+    }
+
+def product_card(product, fields=None):
+    """Encoded product with its category summary, only `fields` if given"""
+    return fragments.fragment(
+        fields or 'full', product, db.category_summaries.get(product['category_id']),
+        build=lambda p, c: project_product(p, c, fields)
+    )
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# RESPONSE CACHE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class ResponseCache:
+    """Byte-bounded LRU of encoded 200 responses with strong ETags"""
+    
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()    # key -> (version, etag, body, mimetype)
+        self._lock = threading.Lock()
+    
+    def get(self, key, version):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                self._discard(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+    
+    def put(self, key, version, body, mimetype):
+        if len(body) > self.max_bytes // 8:
+            return None
+        entry = (version, hashlib.sha256(body).hexdigest()[:32], body, mimetype)
+        with self._lock:
+            if key in self.entries:
+                self._discard(key)
+            self.entries[key] = entry
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                self._discard(next(iter(self.entries)))
+        return entry
+    
+    def _discard(self, key):
+        self.size -= len(self.entries.pop(key)[2])
+    
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.size = 0
+
+response_cache = ResponseCache(app.config['RESPONSE_CACHE_MAX_BYTES'])
+
+def cached_response(version=lambda: db.catalog_version):
+    """Serve a public GET route from the response cache, honoring If-None-Match
+    
+    Entries are keyed by path and normalized query args and are dropped as
+    soon as `version()` moves on (by default the catalog version).
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            current = version()
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            entry = response_cache.get(key, current)
+            
+            if entry is None:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = response_cache.put(key, current, response.get_data(), response.mimetype)
+                if entry is None:
+                    response.set_etag(hashlib.sha256(response.get_data()).hexdigest()[:32])
+                    return response.make_conditional(request)
+            
+            _, etag, body, mimetype = entry
+            if request.if_none_match.contains_weak(etag):
+                response = app.response_class(status=304)
+            else:
+                response = app.response_class(body, mimetype=mimetype)
+            response.set_etag(etag)
+            return response
+        return decorated
+    return decorator
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# RATE LIMITING
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def refill_bucket(tokens, stamp, capacity, period, now):
+    """Spend one token from a bucket last seen at `stamp`
+    
+    Returns (tokens left, seconds until a token is available or 0 when
+    this call was allowed, time at which the bucket is full again).
+    """
+    rate = capacity / period
+    tokens = min(capacity, tokens + (now - stamp) * rate)
+    retry_after = 0
+    if tokens >= 1:
+        tokens -= 1
+    else:
+        retry_after = (1 - tokens) / rate
+    return tokens, retry_after, now + (capacity - tokens) / rate
+
+class LocalRateLimitStore:
+    """Token buckets kept in this process, in an LRU capped at `max_keys`
+    
+    A bucket untouched until its refill time is full again, so dropping it
+    loses nothing; each take() evicts such buckets from the cold end of
+    the LRU. The cap bounds memory even when a flood brings new keys
+    faster than they go idle.
+    """
+    
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, stamp, full_at)
+        self._lock = threading.Lock()
+    
+    def take(self, key, capacity, period, now):
+        with self._lock:
+            tokens, stamp, _ = self._buckets.pop(key, (capacity, now, now))
+            tokens, retry_after, full_at = refill_bucket(tokens, stamp, capacity, period, now)
+            self._buckets[key] = (tokens, now, full_at)
+            
+            for _ in range(2):
+                oldest = next(iter(self._buckets))
+                if self._buckets[oldest][2] > now:
+                    break
+                del self._buckets[oldest]
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return retry_after
+    
+    def __len__(self):
+        return len(self._buckets)
+
+class SQLiteRateLimitStore:
+    """Token buckets in a SQLite file, so limits hold across worker processes"""
+    
+    def __init__(self, path, busy_timeout_ms=5000):
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS rate_limits ("
+            "key TEXT PRIMARY KEY, tokens REAL NOT NULL, stamp REAL NOT NULL, full_at REAL NOT NULL)"
+        )
+        self._connection().execute("CREATE INDEX IF NOT EXISTS rate_limits_full_at ON rate_limits (full_at)")
+    
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+            self._local.conn = conn
+        return conn
+    
+    def take(self, key, capacity, period, now):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute("SELECT tokens, stamp FROM rate_limits WHERE key = ?", (key,)).fetchone()
+            tokens, stamp = row if row else (capacity, now)
+            tokens, retry_after, full_at = refill_bucket(tokens, stamp, capacity, period, now)
+            conn.execute("INSERT OR REPLACE INTO rate_limits VALUES (?, ?, ?, ?)", (key, tokens, now, full_at))
+            # Idle buckets are full again; clear a few per call
+            conn.execute(
+                "DELETE FROM rate_limits WHERE key IN "
+                "(SELECT key FROM rate_limits WHERE full_at <= ? LIMIT 16)", (now,)
+            )
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+        return retry_after
+
+if app.config['RATE_LIMIT_DATABASE']:
+    rate_limits = SQLiteRateLimitStore(app.config['RATE_LIMIT_DATABASE'])
+else:
+    rate_limits = LocalRateLimitStore()
+
+def rate_limited(name, per='ip'):
+    """Throttle a route with the token bucket configured under RATE_LIMITS[name]
+    
+    `per` is 'ip' (client address) or 'user' (needs auth_required to run
+    first). Rejected requests get 429 with Retry-After.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            limit = app.config['RATE_LIMITS'].get(name)
+            if limit:
+                capacity, period = limit
+                client = request.user_id if per == 'user' else request.remote_addr
+                retry_after = rate_limits.take(f'{name}:{per}:{client}', capacity, period, time.time())
+                if retry_after:
+                    response = json_response({
+                        'success': False,
+                        'message': 'طلبات كثيرة جداً. يرجى المحاولة بعد قليل.',
+                        'code': 'RATE_LIMITED'
+                    })
+                    response.headers['Retry-After'] = str(math.ceil(retry_after))
+                    return response, 429
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CATALOG IMPORT / EXPORT
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Both directions use the seed catalog format: one [table, record] array per line
+NUMBER = (int, float)
+OPTIONAL_STR = (str, type(None))
+CATALOG_FIELDS = {
+    'categories': {
+        'id': (str,), 'name': (str,), 'name_en': (str,), 'slug': (str,), 'description': (str,),
+        'image': (str,), 'icon': (str,), 'color': (str,), 'is_active': (bool,), 'sort_order': (int,)
+    },
+    'products': {
+        'id': (str,), 'name': (str,), 'name_en': (str,), 'slug': (str,), 'description': (str,),
+        'short_description': (str,), 'price': NUMBER, 'original_price': NUMBER + (type(None),),
+        'currency': (str,), 'category_id': (str,), 'images': (list,), 'thumbnail': (str,),
+        'stock': (int,), 'sku': OPTIONAL_STR, 'brand': OPTIONAL_STR, 'tags': (list,),
+        'specifications': (dict,), 'rating': NUMBER, 'review_count': (int,), 'sold_count': (int,),
+        'is_featured': (bool,), 'is_active': (bool,), 'created_at': (str,)
+    }
+}
+CATALOG_REQUIRED = {'categories': ('name', 'slug'), 'products': ('name', 'slug', 'price', 'category_id')}
+CATALOG_DEFAULTS = {
+    'categories': {
+        'name_en': '', 'description': '', 'image': '', 'icon': '', 'color': '',
+        'is_active': True, 'sort_order': 0
+    },
+    'products': {
+        'name_en': '', 'description': '', 'short_description': '', 'original_price': None,
+        'currency': 'SAR', 'images': [], 'thumbnail': '', 'stock': 0, 'sku': None, 'brand': None,
+        'tags': [], 'specifications': {}, 'rating': 0, 'review_count': 0, 'sold_count': 0,
+        'is_featured': False, 'is_active': True
+    }
+}
+IMPORT_MAX_ERRORS = 100
+
+def catalog_record(table, row, exists):
+    """Check an import row and return what to write; raises ValueError(message)
+    
+    A row without an id updates the record with its slug, or creates one
+    with the slug's seed id. `exists(id)` says whether that record is
+    already stored or queued; new records need the required fields and
+    start from CATALOG_DEFAULTS.
+    """
+    if not isinstance(row, dict):
+        raise ValueError('السجل يجب أن يكون كائن JSON')
+    fields = CATALOG_FIELDS[table]
+    for name, value in row.items():
+        types = fields.get(name)
+        if types is None:
+            raise ValueError(f'حقل غير معروف: {name}')
+        if type(value) not in types or (name in ('price', 'stock') and value < 0) or (name == 'slug' and not value):
+            raise ValueError(f'قيمة غير صالحة للحقل: {name}')
+    if table == 'products' and not all(isinstance(t, str) for t in row.get('tags', ())):
+        raise ValueError('قيمة غير صالحة للحقل: tags')
+    
+    record_id = row.get('id')
+    if record_id is None:
+        if 'slug' not in row:
+            raise ValueError('حقل مطلوب: slug')
+        found = db.store.find(table, 'slug', row['slug'])
+        record_id = found['id'] if found else seed_id(table, row['slug'])
+    if not exists(record_id):
+        missing = [name for name in CATALOG_REQUIRED[table] if name not in row]
+        if missing:
+            raise ValueError(f'حقل مطلوب: {missing[0]}')
+        row = {**CATALOG_DEFAULTS[table], 'created_at': datetime.now().isoformat(), **row}
+        if table == 'categories':
+            row.pop('created_at')
+    if table == 'products' and 'category_id' in row and row['category_id'] not in db.categories:
+        raise ValueError('التصنيف غير موجود')
+    return {**row, 'id': record_id}
+
+def import_catalog_lines(lines, batch_size):
+    """Upsert categories and products from catalog JSON lines
+    
+    Lines are parsed one at a time and written `batch_size` rows per table
+    at a time, each batch updating the read models once, so memory is
+    bounded by the batch however long the stream is. Queued categories are
+    written before the next product, so products can refer to categories
+    from earlier in the same stream. Returns the counts and the first
+    IMPORT_MAX_ERRORS errors by line number.
+    """
+    summary = {'created': 0, 'updated': 0, 'unchanged': 0, 'failed': 0, 'errors': []}
+    pending = {'categories': {}, 'products': {}}    # table -> {id: (line number, row)}
+    
+    def fail(number, message):
+        summary['failed'] += 1
+        if len(summary['errors']) < IMPORT_MAX_ERRORS:
+            summary['errors'].append({'line': number, 'message': message})
+    
+    def flush(table):
+        batch = pending[table]
+        if not batch:
+            return
+        numbers, rows = zip(*batch.values())
+        batch.clear()
+        write = db.import_categories if table == 'categories' else db.import_products
+        for number, result in zip(numbers, write(rows)):
+            if result is None:
+                fail(number, 'الرابط مستخدم لسجل آخر')
+            else:
+                summary[result] += 1
+    
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            table, row = json.loads(line)
+        except (ValueError, TypeError):
+            fail(number, 'سطر JSON غير صالح')
+            continue
+        if not isinstance(table, str) or table not in CATALOG_FIELDS:
+            fail(number, f'جدول غير معروف: {table}')
+            continue
+        if table == 'products':
+            flush('categories')
+        batch = pending[table]
+        try:
+            record = catalog_record(table, row, lambda record_id: (
+                record_id in batch or db.store.get(table, record_id) is not None
+            ))
+        except ValueError as e:
+            fail(number, str(e))
+            continue
+        if record['id'] in batch:
+            # A batch holds each record once; the repeat applies on top
+            flush(table)
+        batch[record['id']] = (number, record)
+        if len(batch) >= batch_size:
+            flush(table)
+    flush('categories')
+    flush('products')
+    return summary
+
+def catalog_lines(chunk=1000):
+    """Yield the catalog as JSON lines, `chunk` records per piece"""
+    for table, records in (('categories', db.categories), ('products', db.products)):
+        records = list(records.values())
+        for start in range(0, len(records), chunk):
+            yield b''.join(encode_json([table, r]) + b'\n' for r in records[start:start + chunk])
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # API ROUTES - HEALTH & INFO
 # ═══════════════════════════════════════════════════════════════════════════════
 
 @app.route('/')
 def home():
-    return jsonify({
+    return json_response({
         'success': True,
         'message': '🏆 مرحباً بك في سوق النخبة API',
         'version': '1.0.0',
@@ -651,14 +3653,14 @@ def home():
 
 @app.route('/health')
 def health():
-    return jsonify({
+    return json_response({
         'success': True,
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'stats': {
-            'products': len(db.products),
-            'categories': len(db.categories),
-            'users': len(db.users)
+            'products': db.store.count('products'),
+            'categories': db.store.count('categories'),
+            'users': db.store.count('users')
         }
     })
 
@@ -666,7 +3668,12 @@ def health():
 # API ROUTES - AUTHENTICATION
 # ═══════════════════════════════════════════════════════════════════════════════
 
+def public_user(user):
+    """A user's fields minus the password hash"""
+    return {k: user[k] for k in user.keys() if k != 'password'}
+
 @app.route('/api/auth/register', methods=['POST'])
+@rate_limited('register')
 def register():
     data = request.json or {}
     
@@ -674,32 +3681,31 @@ def register():
     required = ['email', 'password', 'first_name', 'last_name']
     for field in required:
         if not data.get(field):
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': f'الحقل {field} مطلوب'
             }), 400
     
     # Check email format
     if not re.match(r'^[\w\.-]+@[\w\.-]+\.\w+$', data['email']):
-        return jsonify({
+        return json_response({
             'success': False,
             'message': 'بريد إلكتروني غير صالح'
         }), 400
     
     # Check if email exists
-    for user in db.users.values():
-        if user['email'] == data['email']:
-            return jsonify({
-                'success': False,
-                'message': 'البريد الإلكتروني مسجل مسبقاً'
-            }), 400
+    if db.get_user_by_email(data['email']):
+        return json_response({
+            'success': False,
+            'message': 'البريد الإلكتروني مسجل مسبقاً'
+        }), 400
     
     # Create user
     user_id = str(uuid4())
     user = {
         'id': user_id,
         'email': data['email'],
-        'password': db._hash_password(data['password']),
+        'password': passwords.hash(data['password']),
         'first_name': data['first_name'],
         'last_name': data['last_name'],
         'phone': data.get('phone'),
@@ -710,24 +3716,24 @@ def register():
         'addresses': [],
         'created_at': datetime.now().isoformat()
     }
-    db.users[user_id] = user
+    try:
+        db.add_user(user)
+    except ValueError:
+        return json_response({
+            'success': False,
+            'message': 'البريد الإلكتروني مسجل مسبقاً'
+        }), 400
     
     # Create cart
-    cart_id = str(uuid4())
-    db.carts[cart_id] = {
-        'id': cart_id,
-        'user_id': user_id,
-        'items': [],
-        'created_at': datetime.now().isoformat()
-    }
+    db.get_cart_for_user(user_id, create=True)
     
     # Generate token
     token = generate_token(user_id)
     
     # Return user without password
-    user_response = {k: v for k, v in user.items() if k != 'password'}
+    user_response = public_user(user)
     
-    return jsonify({
+    return json_response({
         'success': True,
         'message': 'تم إنشاء الحساب بنجاح',
         'data': {
@@ -737,41 +3743,47 @@ def register():
     }), 201
 
 @app.route('/api/auth/login', methods=['POST'])
+@rate_limited('login')
 def login():
     data = request.json or {}
     
     if not data.get('email') or not data.get('password'):
-        return jsonify({
+        return json_response({
             'success': False,
             'message': 'البريد الإلكتروني وكلمة المرور مطلوبان'
         }), 400
     
-    # Find user
-    user = None
-    for u in db.users.values():
-        if u['email'] == data['email']:
-            user = u
-            break
+    # Find user; an unknown email is checked against the dummy hash so it
+    # takes as long as a wrong password and does not reveal the account
+    user = db.get_user_by_email(data['email'])
+    stored = user['password'] if user else passwords.dummy_hash
     
-    if not user or not db.verify_password(data['password'], user['password']):
-        return jsonify({
+    if not passwords.verify(data['password'], stored) or not user:
+        return json_response({
             'success': False,
             'message': 'بيانات الدخول غير صحيحة'
         }), 401
     
     if not user['is_active']:
-        return jsonify({
+        return json_response({
             'success': False,
             'message': 'الحساب معطل'
         }), 401
     
+    # Upgrade legacy or outdated hashes while the plain password is at hand
+    if passwords.needs_rehash(user['password']):
+        try:
+            user = db.update_user(user['id'], password=passwords.hash(data['password']))
+        except PasswordHasherBusy:
+            pass  # try again on a later login
+    
     # Generate token
     token = generate_token(user['id'])
     
     # Return user without password
-    user_response = {k: v for k, v in user.items() if k != 'password'}
+    user_response = public_user(user)
     
-    return jsonify({
+    return json_response({
         'success': True,
         'message': 'تم تسجيل الدخول بنجاح',
         'data': {
@@ -780,11 +3792,31 @@ def login():
         }
     })
 
+@app.route('/api/auth/logout', methods=['POST'])
+@auth_required
+def logout():
+    db.revoke_session(request.session_id)
+    return json_response({
+        'success': True,
+        'message': 'تم تسجيل الخروج بنجاح'
+    })
+
+@app.route('/api/auth/logout-all', methods=['POST'])
+@auth_required
+def logout_all():
+    revoked = db.revoke_user_sessions(request.user_id)
+    token_cache.discard_user(request.user_id)
+    return json_response({
+        'success': True,
+        'message': 'تم تسجيل الخروج من جميع الأجهزة',
+        'data': {'revoked_sessions': revoked}
+    })
+
 @app.route('/api/auth/me')
 @auth_required
 def get_me():
-    user_response = {k: v for k, v in request.user.items() if k != 'password'}
-    return jsonify({
+    user_response = public_user(request.user)
+    return json_response({
         'success': True,
         'data': {'user': user_response}
     })
@@ -794,39 +3826,32 @@ def get_me():
 # ═══════════════════════════════════════════════════════════════════════════════
 
 @app.route('/api/categories')
+@cached_response(lambda: db.category_version)
 def get_categories():
-    categories = [c for c in db.categories.values() if c['is_active']]
-    categories.sort(key=lambda x: x['sort_order'])
-    
-    # Add product count
-    for cat in categories:
-        cat['product_count'] = len([
-            p for p in db.products.values() 
-            if p['category_id'] == cat['id'] and p['is_active']
-        ])
-    
-    return jsonify({
+    return json_response({
         'success': True,
-        'data': {'categories': categories}
+        'data': {'categories': db.active_categories()}
     })
 
 @app.route('/api/categories/<slug>')
+@cached_response(lambda: db.category_version)
 def get_category(slug):
-    category = None
-    for c in db.categories.values():
-        if c['slug'] == slug or c['id'] == slug:
-            category = c
-            break
+    category = db.get_category(slug)
     
     if not category:
-        return jsonify({
+        return json_response({
             'success': False,
             'message': 'التصنيف غير موجود'
         }), 404
     
-    return jsonify({
+    return json_response({
         'success': True,
-        'data': {'category': category}
+        'data': {
+            'category': {
+                **category,
+                'product_count': db.category_product_counts.get(category['id'], 0)
+            }
+        }
     })
 
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -834,160 +3859,193 @@ def get_category(slug):
 # ═══════════════════════════════════════════════════════════════════════════════
 
 @app.route('/api/products')
+@product_view
+@cached_response()
 def get_products():
     page = int(request.args.get('page', 1))
     limit = int(request.args.get('limit', 12))
     sort = request.args.get('sort', 'created_at')
     order = request.args.get('order', 'desc')
     category = request.args.get('category')
-    search = request.args.get('search', '').lower()
+    search = request.args.get('search', '').strip()
     min_price = request.args.get('min_price', type=float)
     max_price = request.args.get('max_price', type=float)
     featured = request.args.get('featured')
+    cursor = request.args.get('cursor')
     
-    # Filter products
-    products = [p for p in db.products.values() if p['is_active']]
+    cat = db.get_category(category) if category else None
+    category_id = cat['id'] if cat else None
     
-    # Filter by category
-    if category:
-        cat = None
-        for c in db.categories.values():
-            if c['slug'] == category or c['id'] == category:
-                cat = c
-                break
-        if cat:
-            products = [p for p in products if p['category_id'] == cat['id']]
+    reverse = order == 'desc'
+    if sort not in PRODUCT_SORT_KEYS or sort == 'created_at':
+        # Newest first is the only supported order for the default sort
+        sort, reverse = 'created_at', True
+    start = (page - 1) * limit
+    
+    after = None
+    if cursor:
+        state = decode_cursor(cursor)
+        if search:
+            offset = state.get('offset') if state is not None else None
+            valid = type(offset) is int and offset >= 0
+        else:
+            after = state.get('after') if state is not None else None
+            valid = (state is not None and state.get('sort') == sort and state.get('reverse') == reverse and
+                     isinstance(after, list) and len(after) == 2)
+        if not valid:
+            return json_response({
+                'success': False,
+                'message': 'مؤشر الصفحة غير صالح'
+            }), 400
+        if search:
+            start = offset
+        else:
+            after = tuple(after)
     
-    # Filter by search
     if search:
+        # Search results arrive ranked by relevance and are filtered in place
         products = [
-            p for p in products 
-            if search in p['name'].lower() or 
-               search in p['name_en'].lower() or
-               search in p.get('description', '').lower() or
-               any(search in tag.lower() for tag in p.get('tags', []))
+            p for p in db.search_products(search)
+            if (category_id is None or p['category_id'] == category_id) and
+               (min_price is None or p['price'] >= min_price) and
+               (max_price is None or p['price'] <= max_price) and
+               (featured != 'true' or p['is_featured'])
         ]
-    
-    # Filter by price
-    if min_price is not None:
-        products = [p for p in products if p['price'] >= min_price]
-    if max_price is not None:
-        products = [p for p in products if p['price'] <= max_price]
-    
-    # Filter featured
-    if featured == 'true':
-        products = [p for p in products if p['is_featured']]
-    
-    # Sort
-    reverse = order == 'desc'
-    if sort == 'price':
-        products.sort(key=lambda x: x['price'], reverse=reverse)
-    elif sort == 'rating':
-        products.sort(key=lambda x: x['rating'], reverse=reverse)
-    elif sort == 'sold_count':
-        products.sort(key=lambda x: x['sold_count'], reverse=reverse)
-    elif sort == 'name':
-        products.sort(key=lambda x: x['name'], reverse=reverse)
+        if 'sort' in request.args:
+            products.sort(key=lambda x: x[sort], reverse=reverse)
+        total = len(products)
+        paginated = products[start:start + limit]
+        has_next = start + limit < total
+        next_cursor = encode_cursor({'offset': start + limit}) if has_next else None
     else:
-        products.sort(key=lambda x: x['created_at'], reverse=True)
+        try:
+            paginated, total, has_next = db.query_products(
+                sort, reverse,
+                category_id=category_id,
+                min_price=min_price,
+                max_price=max_price,
+                featured_only=featured == 'true',
+                offset=start,
+                limit=limit,
+                after=after
+            )
+        except TypeError:
+            # Cursor value of a different type than the sort key
+            return json_response({
+                'success': False,
+                'message': 'مؤشر الصفحة غير صالح'
+            }), 400
+        next_cursor = encode_cursor({
+            'sort': sort,
+            'reverse': reverse,
+            'after': [paginated[-1][sort], paginated[-1]['id']]
+        }) if has_next else None
     
-    # Pagination
-    total = len(products)
-    start = (page - 1) * limit
-    end = start + limit
-    paginated = products[start:end]
-    
-    # Add category info
-    for p in paginated:
-        cat = db.categories.get(p['category_id'])
-        p['category'] = {
-            'id': cat['id'],
-            'name': cat['name'],
-            'slug': cat['slug']
-        } if cat else None
-    
-    return jsonify({
+    return json_response({
         'success': True,
         'data': {
-            'products': paginated,
+            'products': [product_card(p, request.product_fields) for p in paginated],
             'pagination': {
                 'page': page,
                 'limit': limit,
                 'total': total,
                 'pages': (total + limit - 1) // limit,
-                'has_next': end < total,
-                'has_prev': page > 1
+                'has_next': has_next,
+                'has_prev': page > 1 or bool(cursor),
+                'next_cursor': next_cursor
             }
         }
     })
 
 @app.route('/api/products/featured')
+@product_view
+@cached_response()
 def get_featured_products():
     limit = int(request.args.get('limit', 8))
-    products = [
-        p for p in db.products.values() 
-        if p['is_active'] and p['is_featured']
-    ]
-    products.sort(key=lambda x: x['sold_count'], reverse=True)
-    return jsonify({
+    fields = request.product_fields
+    products, _, _ = db.query_products('sold_count', reverse=True, featured_only=True, limit=limit)
+    return json_response({
         'success': True,
-        'data': {'products': products[:limit]}
+        'data': {'products': [
+            product_card(p, fields) if fields else fragments.fragment('record', p) for p in products
+        ]}
     })
 
 @app.route('/api/products/deals')
+@product_view
+# Projected deals embed category summaries, which move category_version
+@cached_response(lambda: (db.deals_version, db.category_version))
 def get_deal_products():
     limit = int(request.args.get('limit', 8))
+    fields = request.product_fields
+    # Discount goes on the encoded copy, never on the shared record
     products = [
-        p for p in db.products.values() 
-        if p['is_active'] and p.get('original_price') and p['original_price'] > p['price']
+        fragments.fragment(
+            ('deal', fields), p, db.category_summaries.get(p['category_id']),
+            build=lambda p, c: {
+                **(project_product(p, c, fields) if fields else p),
+                'discount_percent': discount_percent(p)
+            }
+        )
+        for p, _ in db.top_deals(limit)
     ]
-    # Sort by discount percentage
-    for p in products:
-        p['discount_percent'] = round((p['original_price'] - p['price']) / p['original_price'] * 100)
-    products.sort(key=lambda x: x['discount_percent'], reverse=True)
-    return jsonify({
+    return json_response({
         'success': True,
-        'data': {'products': products[:limit]}
+        'data': {'products': products}
     })
 
 @app.route('/api/products/<slug>')
+@product_view
+@cached_response(lambda: (db.catalog_version, db.related.version))
 def get_product(slug):
-    product = None
-    for p in db.products.values():
-        if (p['slug'] == slug or p['id'] == slug) and p['is_active']:
-            product = p.copy()
-            break
+    product = db.get_product(slug)
     
-    if not product:
-        return jsonify({
+    if not product or not product['is_active']:
+        return json_response({
             'success': False,
             'message': 'المنتج غير موجود'
         }), 404
     
-    # Add category
-    cat = db.categories.get(product['category_id'])
-    product['category'] = {
-        'id': cat['id'],
-        'name': cat['name'],
-        'slug': cat['slug']
-    } if cat else None
-    
-    # Get related products
+    # Precomputed neighbors; one may have been deactivated since its list was ranked
     related = [
-        p for p in db.products.values()
-        if p['category_id'] == product['category_id'] and 
-           p['id'] != product['id'] and 
-           p['is_active']
+        db.products[pid] for pid in db.related.related(product['id'])
+        if pid in db.products and db.products[pid]['is_active']
     ][:4]
     
-    return jsonify({
+    fields = request.product_fields
+    return json_response({
         'success': True,
         'data': {
-            'product': product,
-            'related_products': related
+            'product': product_card(product, fields),
+            'related_products': [
+                product_card(p, fields) if fields else fragments.fragment('record', p) for p in related
+            ]
         }
     })
 
+@app.route('/api/products/<slug>/bought-together')
+@product_view
+@cached_response(lambda: (db.catalog_version, db.co_purchases.version))
+def get_bought_together(slug):
+    product = db.get_product(slug)
+    
+    if not product or not product['is_active']:
+        return json_response({
+            'success': False,
+            'message': 'المنتج غير موجود'
+        }), 404
+    
+    limit = max(1, min(int(request.args.get('limit', 4)), BOUGHT_TOGETHER_KEPT))
+    partners = [
+        db.products[pid] for pid, _ in db.co_purchases.bought_together(product['id'])
+        if pid in db.products and db.products[pid]['is_active']
+    ][:limit]
+    
+    return json_response({
+        'success': True,
+        'data': {'products': [product_card(p, request.product_fields) for p in partners]}
+    })
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # API ROUTES - CART
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -995,28 +4053,14 @@ def get_product(slug):
 @app.route('/api/cart')
 @auth_required
 def get_cart():
-    cart = None
-    for c in db.carts.values():
-        if c['user_id'] == request.user_id:
-            cart = c
-            break
-    
-    if not cart:
-        cart_id = str(uuid4())
-        cart = {
-            'id': cart_id,
-            'user_id': request.user_id,
-            'items': [],
-            'created_at': datetime.now().isoformat()
-        }
-        db.carts[cart_id] = cart
+    cart = db.get_cart_for_user(request.user_id, create=True)
     
     # Populate product details
     items_with_products = []
     subtotal = 0
     
     for item in cart['items']:
-        product = db.products.get(item['product_id'])
+        product = db.get_product(item['product_id'])
         if product and product['is_active']:
             item_total = product['price'] * item['quantity']
             subtotal += item_total
@@ -1034,7 +4078,7 @@ def get_cart():
                 'total': item_total
             })
     
-    return jsonify({
+    return json_response({
         'success': True,
         'data': {
             'cart': {
@@ -1054,63 +4098,48 @@ def add_to_cart():
     quantity = int(data.get('quantity', 1))
     
     if not product_id:
-        return jsonify({
+        return json_response({
             'success': False,
             'message': 'معرف المنتج مطلوب'
         }), 400
     
-    product = db.products.get(product_id)
+    product = db.get_product(product_id)
     if not product or not product['is_active']:
-        return jsonify({
+        return json_response({
             'success': False,
             'message': 'المنتج غير متاح'
         }), 404
     
     if product['stock'] < quantity:
-        return jsonify({
+        return json_response({
             'success': False,
             'message': f'الكمية المتاحة: {product["stock"]}'
         }), 400
     
     # Find or create cart
-    cart = None
-    for c in db.carts.values():
-        if c['user_id'] == request.user_id:
-            cart = c
-            break
-    
-    if not cart:
-        cart_id = str(uuid4())
-        cart = {
-            'id': cart_id,
-            'user_id': request.user_id,
-            'items': [],
-            'created_at': datetime.now().isoformat()
-        }
-        db.carts[cart_id] = cart
+    cart = db.get_cart_for_user(request.user_id, create=True)
     
     # Check if product already in cart
-    found = False
-    for item in cart['items']:
+    items = list(cart['items'])
+    for n, item in enumerate(items):
         if item['product_id'] == product_id:
             new_qty = item['quantity'] + quantity
             if new_qty > product['stock']:
-                return jsonify({
+                return json_response({
                     'success': False,
                     'message': f'الكمية المتاحة: {product["stock"]}'
                 }), 400
-            item['quantity'] = new_qty
-            found = True
+            items[n] = {**item, 'quantity': new_qty}
             break
-    
-    if not found:
-        cart['items'].append({
+    else:
+        items.append({
             'product_id': product_id,
             'quantity': quantity,
             'added_at': datetime.now().isoformat()
         })
+    db.save_cart({**cart, 'items': items})
     
-    return jsonify({
+    return json_response({
         'success': True,
         'message': 'تمت الإضافة إلى السلة'
     })
@@ -1122,35 +4151,33 @@ def update_cart_item():
     product_id = data.get('product_id')
     quantity = int(data.get('quantity', 0))
     
-    cart = None
-    for c in db.carts.values():
-        if c['user_id'] == request.user_id:
-            cart = c
-            break
+    cart = db.get_cart_for_user(request.user_id)
     
     if not cart:
-        return jsonify({
+        return json_response({
             'success': False,
             'message': 'السلة فارغة'
         }), 404
     
     if quantity <= 0:
         # Remove item
-        cart['items'] = [i for i in cart['items'] if i['product_id'] != product_id]
+        items = [i for i in cart['items'] if i['product_id'] != product_id]
     else:
         # Update quantity
-        for item in cart['items']:
+        items = list(cart['items'])
+        for n, item in enumerate(items):
             if item['product_id'] == product_id:
-                product = db.products.get(product_id)
+                product = db.get_product(product_id)
                 if product and quantity > product['stock']:
-                    return jsonify({
+                    return json_response({
                         'success': False,
                         'message': f'الكمية المتاحة: {product["stock"]}'
                     }), 400
-                item['quantity'] = quantity
+                items[n] = {**item, 'quantity': quantity}
                 break
+    db.save_cart({**cart, 'items': items})
     
-    return jsonify({
+    return json_response({
         'success': True,
         'message': 'تم تحديث السلة'
     })
@@ -1158,12 +4185,11 @@ def update_cart_item():
 @app.route('/api/cart/clear', methods=['DELETE'])
 @auth_required
 def clear_cart():
-    for cart in db.carts.values():
-        if cart['user_id'] == request.user_id:
-            cart['items'] = []
-            break
+    cart = db.get_cart_for_user(request.user_id)
+    if cart:
+        db.save_cart({**cart, 'items': []})
     
-    return jsonify({
+    return json_response({
         'success': True,
         'message': 'تم تفريغ السلة'
     })
@@ -1175,42 +4201,71 @@ def clear_cart():
 @app.route('/api/orders')
 @auth_required
 def get_orders():
-    if request.user['role'] == 'admin':
-        orders = list(db.orders.values())
-    else:
-        orders = [o for o in db.orders.values() if o['user_id'] == request.user_id]
+    limit = max(1, min(int(request.args.get('limit', 20)), 100))
+    cursor = request.args.get('cursor')
+    
+    after = None
+    if cursor:
+        state = decode_cursor(cursor)
+        if not state or not isinstance(state.get('after'), list) or len(state['after']) != 2:
+            return json_response({
+                'success': False,
+                'message': 'مؤشر الصفحة غير صالح'
+            }), 400
+        after = tuple(state['after'])
     
-    orders.sort(key=lambda x: x['created_at'], reverse=True)
+    user_id = None if request.user['role'] == 'admin' else request.user_id
+    try:
+        orders, total, has_next = db.query_orders(user_id, limit=limit, after=after)
+    except TypeError:
+        return json_response({
+            'success': False,
+            'message': 'مؤشر الصفحة غير صالح'
+        }), 400
+    
+    next_cursor = encode_cursor({
+        'after': [orders[-1]['created_at'], orders[-1]['id']]
+    }) if has_next else None
     
-    return jsonify({
+    return json_response({
         'success': True,
-        'data': {'orders': orders}
+        'data': {
+            # Fragments are keyed by identity, so only stored objects can hit
+            'orders': [fragments.fragment('record', o) for o in orders] if db.store.by_reference else orders,
+            'pagination': {
+                'limit': limit,
+                'total': total,
+                'has_next': has_next,
+                'next_cursor': next_cursor
+            }
+        }
     })
 
 @app.route('/api/orders/<order_id>')
 @auth_required
 def get_order(order_id):
-    order = db.orders.get(order_id)
+    order = db.get_order(order_id)
     
     if not order:
-        return jsonify({
+        return json_response({
             'success': False,
             'message': 'الطلب غير موجود'
         }), 404
     
     if request.user['role'] != 'admin' and order['user_id'] != request.user_id:
-        return jsonify({
+        return json_response({
             'success': False,
             'message': 'غير مصرح'
         }), 403
     
-    return jsonify({
+    return json_response({
         'success': True,
         'data': {'order': order}
     })
 
 @app.route('/api/orders', methods=['POST'])
 @auth_required
+@rate_limited('checkout', per='user')
 def create_order():
     data = request.json or {}
     
@@ -1219,57 +4274,56 @@ def create_order():
     required_fields = ['full_name', 'phone', 'city', 'address']
     for field in required_fields:
         if not shipping.get(field):
-            return jsonify({
+            return json_response({
                 'success': False,
                 'message': f'الحقل {field} مطلوب في عنوان الشحن'
             }), 400
     
     # Get cart
-    cart = None
-    for c in db.carts.values():
-        if c['user_id'] == request.user_id:
-            cart = c
-            break
+    cart = db.get_cart_for_user(request.user_id)
     
     if not cart or not cart['items']:
-        return jsonify({
+        return json_response({
             'success': False,
             'message': 'السلة فارغة'
         }), 400
     
-    # Process items
-    items = []
-    subtotal = 0
-    
+    # Reserve stock for the whole cart at once
+    quantities = {}
     for cart_item in cart['items']:
-        product = db.products.get(cart_item['product_id'])
-        if not product or not product['is_active']:
-            return jsonify({
+        product_id = cart_item['product_id']
+        quantities[product_id] = quantities.get(product_id, 0) + cart_item['quantity']
+    
+    products, failure = inventory.reserve(quantities)
+    if failure:
+        product_id, reason = failure
+        if reason == 'unavailable':
+            return json_response({
                 'success': False,
                 'message': f'المنتج غير متاح'
             }), 400
-        
-        if product['stock'] < cart_item['quantity']:
-            return jsonify({
-                'success': False,
-                'message': f'المنتج "{product["name"]}" غير متوفر بالكمية المطلوبة'
-            }), 400
-        
-        item_total = product['price'] * cart_item['quantity']
+        return json_response({
+            'success': False,
+            'message': f'المنتج "{db.get_product(product_id)["name"]}" غير متوفر بالكمية المطلوبة'
+        }), 400
+    
+    # Process items
+    items = []
+    subtotal = 0
+    
+    for product_id, quantity in quantities.items():
+        product = products[product_id]
+        item_total = product['price'] * quantity
         subtotal += item_total
         
         items.append({
             'product_id': product['id'],
             'name': product['name'],
             'price': product['price'],
-            'quantity': cart_item['quantity'],
+            'quantity': quantity,
             'total': item_total,
             'thumbnail': product['thumbnail']
         })
-        
-        # Update stock
-        product['stock'] -= cart_item['quantity']
-        product['sold_count'] += cart_item['quantity']
     
     # Calculate totals
     shipping_cost = 0 if subtotal >= 500 else 30
@@ -1292,17 +4346,20 @@ def create_order():
         'tax': tax,
         'total': round(total, 2),
         'status': 'pending',
-        'status_label': 'قيد الانتظار',
         'notes': data.get('notes'),
         'created_at': datetime.now().isoformat()
     }
     
-    db.orders[order_id] = order
+    try:
+        order = db.add_order(order)
+    except Exception:
+        inventory.release(quantities)
+        raise
     
     # Clear cart
-    cart['items'] = []
+    db.save_cart({**cart, 'items': []})
     
-    return jsonify({
+    return json_response({
         'success': True,
         'message': 'تم إنشاء الطلب بنجاح',
         'data': {'order': order}
@@ -1311,9 +4368,9 @@ def create_order():
 @app.route('/api/orders/<order_id>/status', methods=['PUT'])
 @admin_required
 def update_order_status(order_id):
-    order = db.orders.get(order_id)
+    order = db.get_order(order_id)
     if not order:
-        return jsonify({
+        return json_response({
             'success': False,
             'message': 'الطلب غير موجود'
         }), 404
@@ -1321,26 +4378,19 @@ def update_order_status(order_id):
     data = request.json or {}
     status = data.get('status')
     
-    status_labels = {
-        'pending': 'قيد الانتظار',
-        'confirmed': 'تم التأكيد',
-        'processing': 'قيد التحضير',
-        'shipped': 'تم الشحن',
-        'delivered': 'تم التسليم',
-        'cancelled': 'ملغي'
-    }
-    
-    if status not in status_labels:
-        return jsonify({
+    if status not in ORDER_STATUS_LABELS:
+        return json_response({
             'success': False,
             'message': 'حالة غير صالحة'
         }), 400
     
-    order['status'] = status
-    order['status_label'] = status_labels[status]
-    order['updated_at'] = datetime.now().isoformat()
+    order = db.update_order(
+        order_id,
+        status=status,
+        updated_at=datetime.now().isoformat()
+    )
     
-    return jsonify({
+    return json_response({
         'success': True,
         'message': 'تم تحديث حالة الطلب',
         'data': {'order': order}
@@ -1353,47 +4403,122 @@ def update_order_status(order_id):
 @app.route('/api/analytics/dashboard')
 @admin_required
 def get_dashboard_analytics():
-    # Calculate stats
-    total_revenue = sum(o['total'] for o in db.orders.values() if o['status'] != 'cancelled')
-    total_orders = len(db.orders)
-    total_products = len([p for p in db.products.values() if p['is_active']])
-    total_users = len([u for u in db.users.values() if u['role'] == 'customer'])
-    
-    # Recent orders
-    recent_orders = sorted(
-        db.orders.values(),
-        key=lambda x: x['created_at'],
-        reverse=True
-    )[:5]
-    
-    # Top products
-    top_products = sorted(
-        [p for p in db.products.values() if p['is_active']],
-        key=lambda x: x['sold_count'],
-        reverse=True
-    )[:5]
-    
-    return jsonify({
+    # Counters and both top-5 lists come from maintained structures
+    stats = dict(db.counters)
+    stats['total_revenue'] = round(stats['total_revenue'], 2)
+    recent_orders, _, _ = db.query_orders(limit=5)
+    top_products, _, _ = db.query_products('sold_count', reverse=True, limit=5)
+    
+    return json_response({
         'success': True,
         'data': {
-            'stats': {
-                'total_revenue': total_revenue,
-                'total_orders': total_orders,
-                'total_products': total_products,
-                'total_users': total_users
-            },
+            'stats': stats,
             'recent_orders': recent_orders,
             'top_products': top_products
         }
     })
 
+@app.route('/api/analytics/timeseries')
+@admin_required
+def get_sales_timeseries():
+    granularity = request.args.get('granularity', 'day')
+    category = request.args.get('category')
+    brand = request.args.get('brand')
+    status = request.args.get('status')
+    
+    if granularity not in ROLLUP_GRANULARITIES:
+        return json_response({
+            'success': False,
+            'message': 'دقة زمنية غير صالحة'
+        }), 400
+    
+    if status and status != 'all' and status not in ORDER_STATUS_LABELS:
+        return json_response({
+            'success': False,
+            'message': 'حالة غير صالحة'
+        }), 400
+    
+    # Default window: two days of hours, a month of days or a year of months
+    default_span = {'hour': timedelta(hours=48), 'day': timedelta(days=30), 'month': timedelta(days=365)}
+    try:
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else datetime.now()
+        start = (datetime.fromisoformat(request.args['from']) if request.args.get('from')
+                 else end - default_span[granularity])
+    except ValueError:
+        return json_response({
+            'success': False,
+            'message': 'تاريخ غير صالح'
+        }), 400
+    
+    category_id = None
+    if category:
+        cat = db.get_category(category)
+        if not cat:
+            return json_response({
+                'success': False,
+                'message': 'التصنيف غير موجود'
+            }), 404
+        category_id = cat['id']
+    
+    # Cancelled orders are left out unless asked for explicitly
+    if status == 'all':
+        statuses = None
+    elif status:
+        statuses = {status}
+    else:
+        statuses = set(ORDER_STATUS_LABELS) - {'cancelled'}
+    
+    series = db.query_sales(
+        granularity, start.isoformat(), end.isoformat(),
+        category_id=category_id, brand=brand, statuses=statuses
+    )
+    
+    return json_response({
+        'success': True,
+        'data': {
+            'granularity': granularity,
+            'from': start.isoformat(),
+            'to': end.isoformat(),
+            'series': [
+                {'bucket': bucket, 'revenue': revenue, 'orders': orders, 'units': units}
+                for bucket, revenue, orders, units in series
+            ],
+            'totals': {
+                'revenue': round(sum(b[1] for b in series), 2),
+                'orders': sum(b[2] for b in series),
+                'units': sum(b[3] for b in series)
+            }
+        }
+    })
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# API ROUTES - CATALOG (Admin)
+# ═══════════════════════════════════════════════════════════════════════════════
+
+@app.route('/api/admin/catalog/import', methods=['POST'])
+@admin_required
+def import_catalog():
+    # The body is read line by line, never held whole
+    summary = import_catalog_lines(request.stream, app.config['IMPORT_BATCH_SIZE'])
+    
+    return json_response({
+        'success': True,
+        'message': 'تم استيراد الكتالوج',
+        'data': summary
+    })
+
+@app.route('/api/admin/catalog/export')
+@admin_required
+def export_catalog():
+    return app.response_class(catalog_lines(), mimetype='application/x-ndjson')
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # ERROR HANDLERS
 # ═══════════════════════════════════════════════════════════════════════════════
 
 @app.errorhandler(404)
 def not_found(e):
-    return jsonify({
+    return json_response({
         'success': False,
         'message': 'المسار غير موجود',
         'code': 'NOT_FOUND'
@@ -1401,12 +4526,22 @@ def not_found(e):
 
 @app.errorhandler(500)
 def server_error(e):
-    return jsonify({
+    return json_response({
         'success': False,
         'message': 'خطأ في الخادم',
         'code': 'SERVER_ERROR'
     }), 500
 
+@app.errorhandler(PasswordHasherBusy)
+def password_hasher_busy(e):
+    response = json_response({
+        'success': False,
+        'message': 'الخادم مشغول حالياً. يرجى المحاولة بعد قليل.',
+        'code': 'SERVER_BUSY'
+    })
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # MAIN
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -0,0 +1,16 @@
+"""
+gunicorn settings for the Elite Souk API, read from the working directory:
+
+    gunicorn elite-souk-backend:app
+
+Each worker builds its catalog read models before it accepts requests,
+so the first request does not pay for a full load (or the seeding of an
+empty store) and the worker keeps reporting to the arbiter throughout,
+however long that takes.
+"""
+
+import sys
+
+def post_worker_init(worker):
+    backend = sys.modules[worker.wsgi.import_name]
+    backend.preload(heartbeat=worker.notify)